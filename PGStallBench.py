@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+Sales Engine Benchmarks - synthetic Books folders and per-phase timings
+
+Generates realistic PlayerShopLog folders (several overlapping, partially
+duplicated log files per day, month and year rollovers, xN quantities) and
+times each phase of the engine on them at several scales, reporting wall
+time, items per second and peak traced memory.
+    
+    python PGStallBench.py --scales 1000,10000 --save bench.json
+    python PGStallBench.py --scales 1000,10000 --baseline bench.json
+    python PGStallBench.py --scales 1000,10000 --parity
+
+Generated folders are kept in --data-dir and reused when the generator
+settings match.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import PGStallEngine as engine
+
+
+# =============================================================================
+# Synthetic Log Generator
+# =============================================================================
+
+# Bump when generate_books output changes so cached folders are rebuilt
+GENERATOR_VERSION = 1
+
+DEFAULT_START = datetime(2024, 11, 15)
+
+ITEM_WORDS = (
+    "Amulet", "Apple", "Bacon", "Barley", "Bear", "Beer", "Boots", "Bread", "Butter",
+    "Cheese", "Cotton", "Crystal", "Deer", "Dye", "Egg", "Fairy", "Fire", "Flour",
+    "Gloves", "Goblin", "Helm", "Hide", "Ice", "Iron", "Leather", "Linen", "Mushroom",
+    "Potion", "Ring", "Salt", "Shirt", "Silk", "Silver", "Skull", "Staff", "Sugar",
+    "Sword", "Tundra", "Wax", "Wolf", "Wood"
+)
+
+
+def make_names(rnd, buyers, items):
+    """Return (buyer names, item names) for a generated folder"""
+    buyer_names = [f"Player{i:04d}" for i in range(buyers)]
+    item_names = []
+    seen = set()
+    while len(item_names) < items:
+        words = rnd.sample(ITEM_WORDS, rnd.randint(1, 3))
+        name = " ".join(words)
+        if len(item_names) % 17 == 0:
+            # Some real item names end in "x<something>"-like text
+            name += f" of Power {len(item_names)}"
+        if name not in seen:
+            seen.add(name)
+            item_names.append(name)
+    return buyer_names, item_names
+
+
+def format_line(moment, text):
+    """Format a log line the way the game does: 'Sat May 31 23:46 - ...'"""
+    return f"{moment.strftime('%a %b')} {moment.day} {moment.strftime('%H:%M')} - {text}"
+
+
+def generate_books(folder, days, files_per_day, buyers=200, items=400, sales_per_day=60,
+                   history_lines=400, start=DEFAULT_START, seed=1):
+    """
+    Write a synthetic Books folder.
+    
+    Every day has files_per_day snapshots of the shop log. Each snapshot
+    holds the most recent lines of the running history (up to
+    history_lines), so consecutive files overlap and repeat lines; some
+    snapshots are cut short to mimic files written mid-day. About one line
+    in five is not a purchase.
+    
+    Returns:
+        dict with the number of files, lines and purchase lines written
+    """
+    os.makedirs(folder, exist_ok=True)
+    rnd = random.Random(seed)
+    buyer_names, item_names = make_names(rnd, buyers, items)
+    
+    history = []
+    files = lines = purchases = 0
+    
+    for day_index in range(days):
+        day = start + timedelta(days=day_index)
+        minutes = sorted(rnd.randrange(24 * 60) for _ in range(rnd.randint(sales_per_day // 2,
+                                                                          sales_per_day * 3 // 2)))
+        day_lines = []
+        for minute in minutes:
+            moment = day + timedelta(minutes=minute)
+            buyer = rnd.choice(buyer_names)
+            if rnd.random() < 0.8:
+                item = rnd.choice(item_names)
+                quantity = rnd.choice((1, 1, 1, 2, 3, 5, 10, 20))
+                price = rnd.randint(5, 2000)
+                quantity_text = f" x{quantity}" if quantity > 1 else ""
+                day_lines.append((format_line(
+                    moment,
+                    f"{buyer} bought {item}{quantity_text} at a cost of {price} per 1 = {price * quantity}"
+                ), True))
+            else:
+                day_lines.append((format_line(moment, f"{buyer} visited your shop"), False))
+        
+        # Spread the day's snapshots over the day; each sees the history so far
+        for file_index in range(files_per_day):
+            seen_until = (len(day_lines) * (file_index + 1)) // files_per_day
+            snapshot = history + day_lines[:seen_until]
+            snapshot = snapshot[-history_lines:]
+            if file_index < files_per_day - 1 and rnd.random() < 0.3:
+                snapshot = snapshot[:len(snapshot) * 2 // 3]
+            
+            stamp = day + timedelta(seconds=(86400 * (file_index + 1)) // (files_per_day + 1))
+            filename = f"PlayerShopLog_{stamp.strftime('%y%m%d_%H%M%S')}.txt"
+            with open(os.path.join(folder, filename), 'w', encoding='utf-8') as f:
+                f.write("".join(text + "\n" for text, _ in snapshot))
+            
+            files += 1
+            lines += len(snapshot)
+            purchases += sum(1 for _, is_purchase in snapshot if is_purchase)
+        
+        history.extend(day_lines)
+        history = history[-history_lines:]
+    
+    return {'files': files, 'lines': lines, 'purchases': purchases}
+
+
+def prepare_folder(data_dir, file_count, files_per_day, seed):
+    """Return (folder, stats) for a generated folder, reusing a matching one"""
+    days = max(1, file_count // files_per_day)
+    settings = {
+        'version': GENERATOR_VERSION,
+        'days': days,
+        'files_per_day': files_per_day,
+        'seed': seed,
+    }
+    folder = os.path.join(data_dir, f"books_{days}x{files_per_day}_s{seed}")
+    manifest_path = os.path.join(folder, "manifest.json")
+    
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('settings') == settings:
+            return folder, manifest['stats']
+    except (OSError, ValueError):
+        pass
+    
+    shutil.rmtree(folder, ignore_errors=True)
+    stats = generate_books(folder, days, files_per_day, seed=seed)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'settings': settings, 'stats': stats}, f)
+    return folder, stats
+
+
+# =============================================================================
+# Benchmark Harness
+# =============================================================================
+
+def text_scan(folder):
+    """
+    Count lines per date per file the way the scan phase did before the byte
+    scanner: text mode, one regex match per line. Kept as a comparison point.
+    """
+    counts = defaultdict(lambda: defaultdict(int))
+    for filename in os.listdir(folder):
+        if engine.parse_filename_info(filename) is None:
+            continue
+        file_path = os.path.join(folder, filename)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line_date_str = engine.parse_line_date_string(line)
+                if line_date_str:
+                    counts[line_date_str][file_path] += 1
+    return counts
+
+
+def line_parse_benchmark(folder, max_files=200):
+    """
+    Micro-benchmark of purchase-line parsing on the first log files of a
+    folder, all held in memory.
+    
+    Compares the per-line steps of the original extraction (date regex,
+    date calculation, then purchase regex) with the "bought" prefix check,
+    fused SALE_LINE_PATTERN and memoized calculate_full_date, and with the
+    byte scanner parse_log_file builds on.
+    
+    Returns:
+        dict[approach] = lines per second
+    """
+    files = []
+    for filename in sorted(os.listdir(folder)):
+        parsed = engine.parse_filename_info(filename)
+        if parsed is None:
+            continue
+        with open(os.path.join(folder, filename), 'rb') as f:
+            data = f.read()
+        files.append((parsed, data, data.decode('utf-8').splitlines(keepends=True)))
+        if len(files) >= max_files:
+            break
+    line_count = sum(len(lines) for _, _, lines in files)
+    
+    def separate():
+        resolve = engine.calculate_full_date.__wrapped__
+        for (file_year, file_month), _, lines in files:
+            for line in lines:
+                line_date_str = engine.parse_line_date_string(line)
+                if not line_date_str:
+                    continue
+                if resolve(line_date_str, file_year, file_month) is None:
+                    continue
+                if 'bought' not in line:
+                    continue
+                engine.BUY_PATTERN.search(line)
+    
+    def fused():
+        engine.calculate_full_date.cache_clear()
+        resolve = engine.calculate_full_date
+        sale_pattern = engine.SALE_LINE_PATTERN
+        for (file_year, file_month), _, lines in files:
+            for line in lines:
+                if 'bought' not in line:
+                    continue
+                match = sale_pattern.match(line)
+                if match:
+                    resolve(match.group('date'), file_year, file_month)
+    
+    def byte_scan():
+        for _, data, _ in files:
+            for _, _, start, end in engine.iter_date_runs(data):
+                engine.PURCHASE_PATTERN.findall(data, start, end)
+    
+    rates = {}
+    for name, approach in (("separate", separate), ("fused", fused), ("bytes", byte_scan)):
+        started = time.perf_counter()
+        approach()
+        seconds = time.perf_counter() - started
+        rates[name] = line_count / seconds if seconds > 0 else 0.0
+    return rates
+
+
+def benchmark_phases(folder, stats, cache_dir):
+    """
+    Return a list of (phase name, function, items) to run in order. Each
+    function takes and returns the shared state dict; items is a callable
+    giving the number of items the phase processed, for the rate column.
+    """
+    start_date = datetime(2000, 1, 1)
+    end_date = datetime(2099, 12, 31)
+    
+    def listing(state):
+        with os.scandir(folder) as entries:
+            state['names'] = [entry.name for entry in entries
+                              if engine.parse_filename_info(entry.name) is not None]
+    
+    def scan_text(state):
+        text_scan(folder)
+    
+    def reference_scan(state):
+        state['ref_counts'], state['ref_file_info'] = engine.scan_files_for_authority(folder)
+    
+    def reference_select(state):
+        state['ref_best_files'] = engine.select_authority_files(state['ref_counts'])
+    
+    def reference_extract(state):
+        state['ref_sales'] = engine.extract_sales_with_authority(
+            folder, state['ref_best_files'], state['ref_file_info'], start_date, end_date
+        )
+    
+    def ingest_cold(state):
+        cache = engine.ParseCache(folder, cache_dir)
+        cache.clear()
+        engine.ingest_files(folder, cache, workers=1)
+        cache.save()
+    
+    def ingest_warm(state):
+        cache = engine.ParseCache(folder, cache_dir)
+        state['counts'], state['file_info'], state['partitions'] = engine.ingest_files(
+            folder, cache, workers=1
+        )
+    
+    def select(state):
+        state['best_files'] = engine.select_authority_files(state['counts'])
+    
+    def collect(state):
+        state['sales'] = engine.collect_authority_sales(
+            state['partitions'], state['best_files'], state['file_info'], start_date, end_date
+        )
+        state['dataset'] = engine.LoadedDataset(folder, start_date, end_date, {}, state['sales'])
+    
+    def filter_substring(state):
+        state['rows'] = engine.apply_filters(state['dataset'], "", "a", False, start_date, end_date)
+    
+    def aggregate_item(state):
+        engine.group_and_aggregate(state['sales'], range(len(state['sales'])), "Item")
+    
+    def aggregate_week(state):
+        engine.group_and_aggregate(state['sales'], range(len(state['sales'])), "Week")
+    
+    def aggregate_pivot(state):
+        engine.group_and_aggregate(state['sales'], range(len(state['sales'])), "Item", "Month")
+    
+    def rollup_build(state):
+        state['rollup'] = engine.DailyRollup(state['sales'])
+        state['day_totals'] = engine.DailyRollup(state['sales'], detail=False)
+    
+    def rollup_week(state):
+        engine.aggregate_rollup(state['day_totals'], range(len(state['day_totals'])), "Week")
+    
+    def rollup_pivot(state):
+        engine.aggregate_rollup(state['rollup'], range(len(state['rollup'])), "Month", "Item")
+    
+    lines = lambda state: stats['lines']
+    files = lambda state: stats['files']
+    dates = lambda state: len(state['counts'])
+    sales = lambda state: len(state['sales'])
+    
+    return [
+        ("list", listing, files),
+        ("scan_text", scan_text, lines),
+        ("reference_scan", reference_scan, lines),
+        ("reference_select", reference_select, lambda state: len(state['ref_counts'])),
+        ("reference_extract", reference_extract, lambda state: len(state['ref_sales'])),
+        ("ingest_cold", ingest_cold, lines),
+        ("ingest_warm", ingest_warm, files),
+        ("select", select, dates),
+        ("collect", collect, sales),
+        ("filter_substring", filter_substring, sales),
+        ("aggregate_item", aggregate_item, sales),
+        ("aggregate_week", aggregate_week, sales),
+        ("aggregate_pivot", aggregate_pivot, sales),
+        ("rollup_build", rollup_build, sales),
+        ("rollup_week", rollup_week, lambda state: len(state['day_totals'])),
+        ("rollup_pivot", rollup_pivot, lambda state: len(state['rollup'])),
+    ]
+
+
+def run_benchmark(folder, stats, measure_memory=True):
+    """
+    Time every phase on one folder.
+    
+    Phases run once untraced for wall time, then (optionally) once more
+    under tracemalloc for peak memory, so tracing does not skew timings.
+    
+    Returns:
+        dict[phase] = {'seconds', 'items', 'items_per_second', 'peak_mb'}
+    """
+    results = {}
+    cache_dir = tempfile.mkdtemp(prefix="pgstall_bench_cache_")
+    try:
+        state = {}
+        for name, phase, items in benchmark_phases(folder, stats, cache_dir):
+            started = time.perf_counter()
+            phase(state)
+            seconds = time.perf_counter() - started
+            count = items(state)
+            results[name] = {
+                'seconds': seconds,
+                'items': count,
+                'items_per_second': count / seconds if seconds > 0 else 0.0,
+                'peak_mb': None,
+            }
+        
+        if measure_memory:
+            state = {}
+            tracemalloc.start()
+            try:
+                for name, phase, _ in benchmark_phases(folder, stats, cache_dir):
+                    tracemalloc.reset_peak()
+                    phase(state)
+                    results[name]['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            finally:
+                tracemalloc.stop()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    return results
+
+
+# =============================================================================
+# Backend Parity
+# =============================================================================
+
+PARITY_DIMENSIONS = ("Buyer", "Item", "Year", "Month", "Week", "Day")
+
+
+def parity_queries(sales):
+    """
+    Return the query params --parity runs on loaded sales: every Group By
+    without Then By and with Item or Month, under each filter set.
+    """
+    first_day = datetime.fromordinal(sales.day[0])
+    last_day = datetime.fromordinal(sales.day[-1])
+    middle = first_day + (last_day - first_day) / 2
+    buyer = sales.buyer_names[0]
+    item = sales.item_names[0]
+    # (buyer_filter, item_filter, item_exact, start_date)
+    filters = [
+        ("", "", False, first_day),
+        ("", "", False, middle),
+        (buyer, "", False, first_day),
+        ("", "Iron", False, first_day),
+        ("", "a", False, middle),
+        ("", item, True, first_day),
+        (buyer, "e", False, first_day),
+    ]
+    
+    queries = []
+    for group_by in PARITY_DIMENSIONS:
+        for then_by in (None, "Item", "Month"):
+            if then_by == group_by:
+                continue
+            for buyer_filter, item_filter, item_exact, start_date in filters:
+                queries.append({
+                    'group_by': group_by, 'then_by': then_by,
+                    'buyer_filter': buyer_filter, 'item_filter': item_filter,
+                    'item_exact': item_exact, 'start_date': start_date, 'end_date': last_day,
+                    'sort_by': 'TotalEarned', 'top_n': 0,
+                })
+    return queries
+
+
+def outcome_signature(outcome):
+    """Return a comparable form of a query outcome, down to key order and value types"""
+    summary_text, results, columns, sort_by, sort_descending = outcome
+    rows = [[(key, type(value).__name__, value) for key, value in r.items()] for r in results]
+    return summary_text, rows, columns, sort_by, sort_descending
+
+
+def run_parity(folder):
+    """
+    Run parity_queries on a folder with the NumPy backend and with the
+    pure-Python path, comparing their outcomes.
+    
+    Returns:
+        dict with the number of queries, the mismatching queries and the
+        seconds each path took over all queries, or None if NumPy is not
+        installed
+    """
+    engine.use_vector_backend(True)
+    if engine.vector_backend() is None:
+        return None
+    
+    cache_dir = tempfile.mkdtemp(prefix="pgstall_bench_cache_")
+    try:
+        cache = engine.ParseCache(folder, cache_dir)
+        counts, file_info, partitions = engine.ingest_files(folder, cache, workers=1)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    best_files = engine.select_authority_files(counts)
+    sales = engine.collect_authority_sales(partitions, best_files, file_info,
+                                           datetime(2000, 1, 1), datetime(2099, 12, 31))
+    dataset = engine.LoadedDataset(folder, datetime(2000, 1, 1), datetime(2099, 12, 31),
+                                   {}, sales)
+    
+    seconds = {'python': 0.0, 'numpy': 0.0}
+    mismatches = []
+    queries = parity_queries(sales)
+    for params in queries:
+        signatures = {}
+        for path in ('python', 'numpy'):
+            engine.use_vector_backend(path == 'numpy')
+            # Select from scratch rather than narrow the previous query's rows
+            dataset.last_selection = None
+            stats = engine.RunStats()
+            started = time.perf_counter()
+            source, rows, message = engine.filter_dataset(dataset, params, stats)
+            outcome = engine.aggregate_selection(params, source, rows, message, stats)
+            seconds[path] += time.perf_counter() - started
+            signatures[path] = outcome_signature(outcome)
+        if signatures['python'] != signatures['numpy']:
+            mismatches.append(params)
+    engine.use_vector_backend(True)
+    
+    return {'queries': len(queries), 'mismatches': mismatches, 'seconds': seconds}
+
+
+def print_parity(scale, parity, out=sys.stdout):
+    """Print one scale's run_parity outcome"""
+    seconds = parity['seconds']
+    speedup = seconds['python'] / seconds['numpy'] if seconds['numpy'] > 0 else 0.0
+    out.write(f"\n== {scale:,} files: {parity['queries']} queries, "
+              f"{len(parity['mismatches'])} mismatches ==\n")
+    out.write(f"python {seconds['python']:.3f}s, numpy {seconds['numpy']:.3f}s ({speedup:.1f}x)\n")
+    for params in parity['mismatches']:
+        out.write("mismatch: " + ", ".join(
+            f"{key}={value}" for key, value in params.items() if value not in ("", None, False)
+        ) + "\n")
+
+
+def print_line_parse(rates, out=sys.stdout):
+    """Print line_parse_benchmark rates relative to the original per-line steps"""
+    base = rates['separate']
+    out.write("line parsing: " + ", ".join(
+        f"{name} {rate:,.0f} lines/s ({rate / base:.1f}x)" for name, rate in rates.items()
+    ) + "\n")
+
+
+def print_report(scale, stats, results, baseline=None, out=sys.stdout):
+    """Print one scale's results, with the change against a baseline run if given"""
+    out.write(f"\n== {scale:,} files: {stats['lines']:,} lines, {stats['purchases']:,} purchase lines ==\n")
+    header = f"{'phase':<20}{'seconds':>10}{'items/s':>14}{'peak MB':>10}"
+    if baseline is not None:
+        header += f"{'vs base':>10}"
+    out.write(header + "\n")
+    
+    for name, r in results.items():
+        peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else "-"
+        line = f"{name:<20}{r['seconds']:>10.3f}{r['items_per_second']:>14,.0f}{peak:>10}"
+        if baseline is not None:
+            base = baseline.get(name)
+            if base and r['seconds'] > 0:
+                line += f"{base['seconds'] / r['seconds']:>9.2f}x"
+            else:
+                line += f"{'-':>10}"
+        out.write(line + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sales engine on synthetic logs")
+    parser.add_argument('--scales', default="1000,10000,100000",
+                        help="comma-separated file counts to benchmark (default: 1000,10000,100000)")
+    parser.add_argument('--files-per-day', type=int, default=4,
+                        help="log files written per day (default: 4)")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="random seed for the generator (default: 1)")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), "pgstall_bench"),
+                        help="where generated folders are kept between runs")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the tracemalloc pass (peak memory)")
+    parser.add_argument('--micro', action='store_true',
+                        help="also run the line parsing micro-benchmark at each scale")
+    parser.add_argument('--parity', action='store_true',
+                        help="instead of timing phases, check that the NumPy backend gives "
+                             "the same results as the pure-Python path")
+    parser.add_argument('--save', default=None,
+                        help="write results to this JSON file")
+    parser.add_argument('--baseline', default=None,
+                        help="compare against results saved earlier with --save")
+    args = parser.parse_args(argv)
+    
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('scales', {})
+    
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'files_per_day': args.files_per_day,
+        'seed': args.seed,
+        'scales': {},
+    }
+    
+    failed = False
+    for scale in (int(text) for text in args.scales.split(",") if text.strip()):
+        folder, stats = prepare_folder(args.data_dir, scale, args.files_per_day, args.seed)
+        if args.parity:
+            parity = run_parity(folder)
+            if parity is None:
+                sys.stderr.write("NumPy is not installed; there is no backend to compare\n")
+                return 2
+            report['scales'][str(scale)] = {'stats': stats, 'parity': parity}
+            print_parity(scale, parity)
+            failed = failed or bool(parity['mismatches'])
+            continue
+        
+        results = run_benchmark(folder, stats, not args.no_memory)
+        report['scales'][str(scale)] = {'stats': stats, 'phases': results}
+        
+        base = baseline.get(str(scale), {}).get('phases') if args.baseline else None
+        print_report(scale, stats, results, base)
+        
+        if args.micro:
+            rates = line_parse_benchmark(folder)
+            report['scales'][str(scale)]['line_parse'] = rates
+            print_line_parse(rates)
+    
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
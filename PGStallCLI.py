@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Sales Summary CLI - command-line front end for the Sales Engine
+Analyzes Project Gorgon Player Shop Log files without opening a window
+
+Takes the same options as the GUI and writes the results as a text table,
+CSV, JSON or JSON Lines, e.g. for nightly batch reports:
+
+    python PGStallCLI.py --group Month --start 01/01/2025 --format csv -o sales.csv
+
+With --sales the matching sales themselves are streamed out, one row each:
+
+    python PGStallCLI.py --sales --start 01/01/2025 --format jsonl -o sales.jsonl
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from PGStallEngine import RunStats, SalesEngine, default_books_folder, use_vector_backend
+from PGStallExport import (export_sales, result_records, sale_headings, sale_records,
+                           write_records)
+from PGStallFederation import CHARACTER_DIMENSION, SalesFederation, load_characters
+
+
+GROUP_CHOICES = ("Buyer", "Item", "Year", "Month", "Week", "Day", CHARACTER_DIMENSION)
+SORT_CHOICES = ("Group", "TotalSold", "TotalEarned", "AvgPrice")
+
+
+def parse_date(text):
+    """argparse type for MM/DD/YYYY dates"""
+    try:
+        return datetime.strptime(text, "%m/%d/%Y")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{text}', use MM/DD/YYYY")
+
+
+def parse_character(text):
+    """argparse type for NAME=FOLDER character registrations"""
+    name, separator, folder = text.partition("=")
+    if not separator or not name.strip() or not folder:
+        raise argparse.ArgumentTypeError(f"invalid character '{text}', use NAME=FOLDER")
+    return name.strip(), folder
+
+
+def build_parser():
+    """Return the argument parser for the CLI"""
+    today = datetime.now()
+    
+    parser = argparse.ArgumentParser(description="Project Gorgon sales report")
+    parser.add_argument('--folder', default=default_books_folder(),
+                        help="folder holding the PlayerShopLog files")
+    parser.add_argument('--character', type=parse_character, action='append', default=[],
+                        metavar='NAME=FOLDER',
+                        help="query this character's folder together with the other "
+                             "--character folders (repeatable; replaces --folder)")
+    parser.add_argument('--characters', action='store_true',
+                        help="query the characters registered in the GUI as well")
+    parser.add_argument('--group', choices=GROUP_CHOICES, default="Item",
+                        help="grouping dimension (default: Item)")
+    parser.add_argument('--then', choices=GROUP_CHOICES, default=None,
+                        help="second grouping dimension; output becomes a pivot table")
+    parser.add_argument('--buyer', default="",
+                        help="only sales to this buyer (exact match)")
+    parser.add_argument('--item', default="",
+                        help="only items whose name contains this text")
+    parser.add_argument('--exact', action='store_true',
+                        help="match --item exactly")
+    parser.add_argument('--start', type=parse_date, default=datetime(today.year, 1, 1),
+                        help="start date MM/DD/YYYY (default: January 1st)")
+    parser.add_argument('--end', type=parse_date,
+                        default=datetime(today.year, today.month, today.day),
+                        help="end date MM/DD/YYYY (default: today)")
+    parser.add_argument('--top', type=int, default=0,
+                        help="keep only the top N results (default: 0 = all)")
+    parser.add_argument('--sort', choices=SORT_CHOICES, default="TotalEarned",
+                        help="sort column (default: TotalEarned)")
+    parser.add_argument('--format', choices=("table", "csv", "json", "jsonl"), default="table",
+                        help="output format (default: table)")
+    parser.add_argument('--sales', action='store_true',
+                        help="stream every matching sale (one row each, in date order) "
+                             "instead of grouped results; needs --format csv or jsonl")
+    parser.add_argument('-o', '--output', default=None,
+                        help="write to this file instead of stdout")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes used to parse log files (0 = one per CPU, 1 = serial)")
+    parser.add_argument('--reference-mode', action='store_true',
+                        help="use the original three-phase scan/extract path (no cache)")
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help="discard the parse cache and re-read every log file")
+    parser.add_argument('--warehouse', action='store_true',
+                        help="answer the query from the indexed SQLite sales warehouse")
+    parser.add_argument('--no-numpy', action='store_true',
+                        help="filter and aggregate in pure Python even if NumPy is installed")
+    parser.add_argument('--archive-older-than', type=int, default=None, metavar='DAYS',
+                        help="first compress log files dated at least DAYS days ago")
+    parser.add_argument('--archive-format', choices=("gz", "bz2", "xz"), default="gz",
+                        help="compression used by --archive-older-than (default: gz)")
+    parser.add_argument('--stats', action='store_true',
+                        help="print phase times and counters to stderr")
+    return parser
+
+
+def format_value(value):
+    """Format a cell for the text table"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return f"{int(value):,}"
+
+
+def write_table(out, results, columns):
+    """Write results as an aligned text table"""
+    headings = [heading for _, heading in columns]
+    rows = [[format_value(value) for value in row] for row in result_records(results, columns)]
+    widths = [max([len(heading)] + [len(row[i]) for row in rows]) for i, heading in enumerate(headings)]
+    
+    def line(values):
+        cells = [values[0].ljust(widths[0])]
+        cells += [value.rjust(width) for value, width in zip(values[1:], widths[1:])]
+        return "  ".join(cells).rstrip()
+    
+    out.write(line(headings) + "\n")
+    out.write("  ".join("-" * width for width in widths) + "\n")
+    for row in rows:
+        out.write(line(row) + "\n")
+    
+    total_earned_sum = sum(r['TotalEarned'] for r in results)
+    out.write(f"\nTotal Earned: {total_earned_sum:,}\n")
+
+
+def write_csv(out, results, columns):
+    """Write results as CSV with a header row"""
+    write_records(out, [heading for _, heading in columns],
+                  result_records(results, columns), 'csv')
+
+
+def write_json(out, results, columns):
+    """Write results as a JSON list of objects keyed by column heading"""
+    headings = [heading for _, heading in columns]
+    rows = [dict(zip(headings, row)) for row in result_records(results, columns)]
+    json.dump(rows, out, indent=2)
+    out.write("\n")
+
+
+def write_jsonl(out, results, columns):
+    """Write results as JSON Lines, one object keyed by column heading per line"""
+    write_records(out, [heading for _, heading in columns],
+                  result_records(results, columns), 'jsonl')
+
+
+WRITERS = {
+    'table': write_table,
+    'csv': write_csv,
+    'json': write_json,
+    'jsonl': write_jsonl,
+}
+
+
+def stream_sales(engine, params, args):
+    """Write every sale the query matches to --output (or stdout) as they are read"""
+    stats = RunStats()
+    try:
+        if args.output:
+            written = export_sales(engine, params, args.output, args.format, stats=stats)
+        else:
+            written = write_records(sys.stdout, sale_headings(engine),
+                                    sale_records(engine.iter_sales(params, stats=stats)),
+                                    args.format)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    print(f"Exported {written:,} sales", file=sys.stderr)
+    if args.stats:
+        print(stats.summary(), file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    
+    if args.no_numpy:
+        use_vector_backend(False)
+    if args.sales and args.format not in ("csv", "jsonl"):
+        parser.error("--sales needs --format csv or jsonl")
+    if args.archive_older_than is not None and args.archive_older_than < 1:
+        parser.error("--archive-older-than needs at least 1 day (today's log is still "
+                     "being written)")
+    
+    characters = (load_characters() if args.characters else []) + args.character
+    if characters:
+        try:
+            engine = SalesFederation(characters, reference_mode=args.reference_mode,
+                                     workers=args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.archive_older_than is not None:
+            parser.error("--archive-older-than takes a single --folder")
+        if args.rebuild_cache:
+            engine.rebuild_cache()
+    elif CHARACTER_DIMENSION in (args.group, args.then):
+        parser.error(f"grouping by {CHARACTER_DIMENSION} needs --character or --characters")
+    else:
+        engine = SalesEngine(reference_mode=args.reference_mode, workers=args.workers,
+                             warehouse=args.warehouse)
+        if args.rebuild_cache:
+            engine.rebuild_cache(args.folder)
+    
+    if args.archive_older_than is not None:
+        try:
+            archived = engine.archive_logs(args.folder, args.archive_older_than,
+                                           args.archive_format)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"Archived {len(archived)} log files", file=sys.stderr)
+    
+    params = {
+        'folder': args.folder,
+        'group_by': args.group,
+        'then_by': args.then,
+        'buyer_filter': args.buyer.strip(),
+        'item_filter': args.item.strip(),
+        'item_exact': args.exact,
+        'sort_by': args.sort,
+        'top_n': args.top,
+        'start_date': args.start,
+        'end_date': args.end,
+    }
+    
+    if args.sales:
+        return stream_sales(engine, params, args)
+    
+    try:
+        summary_text, results, columns, _, _ = engine.run_query(params)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    print(summary_text, file=sys.stderr)
+    if args.stats:
+        print(engine.last_stats.summary(), file=sys.stderr)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as out:
+            WRITERS[args.format](out, results, columns)
+    else:
+        WRITERS[args.format](sys.stdout, results, columns)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
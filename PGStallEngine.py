@@ -0,0 +1,2850 @@
+#!/usr/bin/env python3
+"""
+Sales Engine - headless parsing and aggregation of Project Gorgon Player Shop Logs
+
+Everything the Sales Viewer does apart from drawing it: reading the log files,
+the "Authority File" deduplication, filtering, grouping and sorting. Nothing
+here imports tkinter, so the engine can be scripted, timed or driven from the
+command line (PGStallCLI.py) on a machine without a display.
+
+Uses "Authority File" algorithm to prevent duplicate counting:
+- For each unique line date, only process lines from the file that has
+  the most entries for that date (the authority file).
+"""
+
+import os
+import re
+import time
+import hashlib
+import heapq
+import importlib
+import logging
+import logging.handlers
+import mmap
+import pickle
+import shutil
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import compress
+from operator import itemgetter
+
+
+def default_books_folder():
+    """Return the Books folder Project Gorgon writes its shop logs to"""
+    return os.path.join(
+        os.path.expanduser("~"),
+        "AppData", "LocalLow", "Elder Game", "Project Gorgon", "Books"
+    )
+
+
+# =============================================================================
+# Parse Cache
+# =============================================================================
+
+# Bump whenever the layout of a cache entry or the parsing rules change so
+# stale caches are discarded instead of misread.
+CACHE_VERSION = 2
+
+LOG_FILENAME_PATTERN = re.compile(r'^PlayerShopLog_(\d{6})_(\d+)\.txt(?:\.(?:gz|bz2|xz))?$')
+LINE_DATE_PATTERN = re.compile(r'^(\w{3}\s+\w{3}\s+\d+)')
+BUY_PATTERN = re.compile(
+    r"- (?P<buyer>\S+) bought\s+(?P<item>.+?)(?:\s*x(?P<qty>\d+))?\s+at a cost.*=\s*(?P<earned>\d+)$"
+)
+
+# LINE_DATE_PATTERN and BUY_PATTERN in one, for matching a purchase line and
+# its date at once. Lines should be checked for "bought" before matching.
+SALE_LINE_PATTERN = re.compile(
+    r"^(?P<date>\w{3}\s+\w{3}\s+\d+).*?- (?P<buyer>\S+) bought\s+(?P<item>.+?)"
+    r"(?:\s*x(?P<qty>\d+))?\s+at a cost.*=\s*(?P<earned>\d+)$"
+)
+
+# Byte versions of LINE_DATE_PATTERN and BUY_PATTERN for scanning a whole
+# file at once, with whitespace kept within one line. A DATE_RUN_PATTERN match
+# covers a run of consecutive lines with the same date prefix, so a file costs
+# one match per date rather than one per line; (?!\d) keeps "May 3" from
+# running on into "May 31". PURCHASE_PATTERN is searched within a run.
+DATE_RUN_PATTERN = re.compile(
+    rb'^(\w{3}[^\S\r\n]+\w{3}[^\S\r\n]+\d+).*(?:\n\1(?!\d).*)*', re.MULTILINE
+)
+PURCHASE_PATTERN = re.compile(
+    rb'- (\S+) bought[^\S\n]+(.+?)(?:[^\S\n]*x(\d+))?[^\S\n]+at a cost.*=[^\S\n]*(\d+)\r?$',
+    re.MULTILINE
+)
+
+# Log files at least this large are memory-mapped instead of read in one call
+MMAP_MIN_BYTES = 4 * 1024 * 1024
+
+# Suffixes of archived (compressed) log files and the module that opens them.
+# Archived logs are decompressed in chunks of ARCHIVE_CHUNK_BYTES rather than
+# read whole.
+ARCHIVE_MODULES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}
+ARCHIVE_CHUNK_BYTES = 1024 * 1024
+
+
+def default_cache_dir():
+    """Return the per-user directory the parse cache lives in"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(
+            os.path.expanduser("~"), "AppData", "Local")
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "PGStallManager")
+
+
+@contextmanager
+def log_file_bytes(file_path):
+    """
+    Context manager giving the contents of a log file as bytes, read in
+    one call, or as an mmap for files of at least MMAP_MIN_BYTES.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+        else:
+            yield f.read()
+
+
+def archive_suffix(filename):
+    """Return the compression suffix of an archived log file, or None for a plain one"""
+    _, suffix = os.path.splitext(filename)
+    return suffix if suffix in ARCHIVE_MODULES else None
+
+
+def log_file_stem(filename):
+    """
+    Return a log file's name without its compression suffix, which is the
+    key folders are listed in so that archiving a file never changes which
+    file wins a tie.
+    """
+    filename = os.path.basename(filename)
+    suffix = archive_suffix(filename)
+    return filename[:-len(suffix)] if suffix else filename
+
+
+def open_archive(file_path, mode='rb', **kwargs):
+    """Open an archived log file with the module for its suffix"""
+    module = importlib.import_module(ARCHIVE_MODULES[archive_suffix(file_path)])
+    return module.open(file_path, mode, **kwargs)
+
+
+def iter_log_chunks(file_path):
+    """
+    Yield the contents of a log file as bytes in chunks that each end at a
+    line boundary: a plain file as one chunk (see log_file_bytes), an
+    archived one decompressed ARCHIVE_CHUNK_BYTES at a time, so it is never
+    held in memory whole.
+    """
+    if archive_suffix(file_path) is None:
+        with log_file_bytes(file_path) as data:
+            yield data
+        return
+    
+    with open_archive(file_path) as f:
+        rest = b''
+        while True:
+            block = f.read(ARCHIVE_CHUNK_BYTES)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b'\n') + 1
+            rest = block[end:]
+            if end:
+                yield block[:end]
+        if rest:
+            yield rest
+
+
+def iter_date_runs(data):
+    """
+    Yield (line_date_str, line_count, start, end) for each run of
+    consecutive lines sharing a date prefix in a log file's bytes.
+    
+    Nothing is decoded apart from the date prefixes, and no object is
+    created per line.
+    """
+    date_strings = {}
+    for match in DATE_RUN_PATTERN.finditer(data):
+        line_date_bytes = match.group(1)
+        line_date_str = date_strings.get(line_date_bytes)
+        if line_date_str is None:
+            line_date_str = date_strings[line_date_bytes] = line_date_bytes.decode('ascii')
+        start, end = match.span()
+        yield line_date_str, match.group(0).count(b'\n') + 1, start, end
+
+
+def parse_log_file(file_path):
+    """
+    Read a log file once and collect everything the authority algorithm needs.
+    
+    The file is scanned as bytes by parse_log_bytes, chunk by chunk for
+    archived files.
+    
+    Returns:
+        (counts, sales), or None if the file could not be read (it may be
+        locked by the game or a damaged archive), so that it is never taken
+        for a file without lines:
+        counts: dict[line_date_str] = line_count
+        sales: dict[line_date_str] = [(buyer, item, quantity, earned), ...]
+    """
+    try:
+        counts = {}
+        sales = {}
+        for data in iter_log_chunks(file_path):
+            parse_log_bytes(data, counts, sales)
+        return counts, sales
+    except Exception:
+        return None
+
+
+def parse_log_bytes(data, counts=None, sales=None):
+    """
+    Count lines per date and extract the purchases in log file contents.
+    
+    Lines are counted per date a run at a time, and only the fields of
+    purchase lines are decoded. data must start at the beginning of a line.
+    Given counts and sales dicts are added to (for a file read in chunks).
+    
+    Returns:
+        (counts, sales) as for parse_log_file
+    """
+    if counts is None:
+        counts = {}
+    if sales is None:
+        sales = {}
+    
+    for line_date_str, line_count, start, end in iter_date_runs(data):
+        counts[line_date_str] = counts.get(line_date_str, 0) + line_count
+        
+        purchases = PURCHASE_PATTERN.findall(data, start, end)
+        if not purchases:
+            continue
+        
+        date_sales = sales.get(line_date_str)
+        if date_sales is None:
+            date_sales = sales[line_date_str] = []
+        for buyer, item, quantity, earned in purchases:
+            date_sales.append((
+                buyer.decode('utf-8', 'replace'),
+                item.decode('utf-8', 'replace').strip(),
+                int(quantity) if quantity else 1,
+                int(earned)
+            ))
+    
+    return counts, sales
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed log files for one Books folder.
+    
+    Entries are keyed by filename and remember the size and mtime the file had
+    when it was parsed. A file whose size or mtime no longer match (it grew,
+    shrank or was rewritten) is parsed again; everything else is served from
+    the cache without being opened. The same goes for archived log files:
+    archive_logs moves an entry to its archive with the archive's size and
+    mtime, so an archive that is later replaced or truncated is parsed again.
+    
+    On disk the cache is a snapshot of every entry plus a journal of the
+    entries changed since. save() appends only the changed entries to the
+    journal, so a run after the current log grew writes that one file's
+    entry rather than the whole cache; the snapshot is rewritten (and the
+    journal started afresh) once the journal would outgrow it.
+    """
+    
+    def __init__(self, folder, cache_dir=None):
+        self.folder = os.path.abspath(folder)
+        folder_key = hashlib.sha1(os.path.normcase(self.folder).encode('utf-8')).hexdigest()[:16]
+        cache_dir = cache_dir or default_cache_dir()
+        self.path = os.path.join(cache_dir, f"parse_cache_{folder_key}.pkl")
+        self.journal_path = os.path.join(cache_dir, f"parse_cache_{folder_key}.journal")
+        # filename -> (size, mtime_ns, counts, sales)
+        self.entries = {}
+        # Filenames whose entry was stored, moved or dropped since the last save
+        self.changed = set()
+        # Token tying the journal to the snapshot it follows, the sizes of
+        # both on disk, and whether the next save must write a snapshot
+        # (there is none yet, or the journal cannot be appended to)
+        self.token = None
+        self.snapshot_bytes = 0
+        self.journal_bytes = 0
+        self.rewrite = True
+        self.load()
+    
+    def load(self):
+        """Load the cache files, ignoring them if missing, corrupt or outdated"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+                snapshot_bytes = f.tell()
+        except Exception:
+            return
+        
+        if (not isinstance(data, dict) or data.get('version') != CACHE_VERSION
+                or data.get('folder') != self.folder):
+            return
+        
+        self.entries = data.get('files', {})
+        self.token = data.get('token')
+        self.snapshot_bytes = snapshot_bytes
+        if self.token is None:
+            # Written before there was a journal; rewritten on the next save
+            return
+        self.rewrite = False
+        
+        try:
+            with open(self.journal_path, 'rb') as f:
+                if pickle.load(f) != self.token:
+                    # Left over from an older snapshot; the next save replaces it
+                    return
+                while True:
+                    try:
+                        changes = pickle.load(f)
+                    except EOFError:
+                        break
+                    for filename, entry in changes:
+                        if entry is None:
+                            self.entries.pop(filename, None)
+                        else:
+                            self.entries[filename] = entry
+                    self.journal_bytes = f.tell()
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # A save cut short; keep what was read and start afresh
+            self.rewrite = True
+    
+    def save(self):
+        """
+        Write the entries changed since the last save to the journal, or
+        a new snapshot of the whole cache once the journal would grow larger
+        than the snapshot.
+        """
+        if not self.changed and not self.rewrite:
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            changes = pickle.dumps([(filename, self.entries.get(filename))
+                                    for filename in self.changed],
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+            if self.rewrite or self.journal_bytes + len(changes) > self.snapshot_bytes:
+                self.write_snapshot()
+            else:
+                self.append_journal(changes)
+            self.changed = set()
+        except OSError:
+            # The journal may end in a partial write: do not append to it
+            self.rewrite = True
+    
+    def write_snapshot(self):
+        """Write every entry to a new snapshot and drop the journal"""
+        token = os.urandom(8).hex()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'version': CACHE_VERSION,
+                'folder': self.folder,
+                'token': token,
+                'files': self.entries
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            snapshot_bytes = f.tell()
+        os.replace(tmp_path, self.path)
+        self.token = token
+        self.snapshot_bytes = snapshot_bytes
+        self.journal_bytes = 0
+        self.rewrite = False
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            # Ignored on load (its token is the old snapshot's), and
+            # overwritten by the next append
+            pass
+    
+    def append_journal(self, changes):
+        """Append pickled (filename, entry or None) changes to the journal"""
+        if self.journal_bytes:
+            with open(self.journal_path, 'ab') as f:
+                f.write(changes)
+        else:
+            with open(self.journal_path, 'wb') as f:
+                pickle.dump(self.token, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(changes)
+        self.journal_bytes = os.path.getsize(self.journal_path)
+    
+    def clear(self):
+        """Forget every entry and remove the cache files"""
+        self.entries = {}
+        self.changed = set()
+        self.token = None
+        self.snapshot_bytes = 0
+        self.journal_bytes = 0
+        self.rewrite = True
+        for path in (self.path, self.journal_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def get(self, filename, stat):
+        """
+        Return cached (counts, sales) for a file, or None if it is new or has
+        changed since it was cached.
+        """
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        if entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2], entry[3]
+        return None
+    
+    def put(self, filename, stat, counts, sales):
+        """Store freshly parsed results for a file"""
+        self.entries[filename] = (stat.st_size, stat.st_mtime_ns, counts, sales)
+        self.changed.add(filename)
+    
+    def rename(self, filename, new_filename, stat, new_stat):
+        """
+        Move the entry of a file that was archived to its new name, if it
+        was still current (stat is the file's before it was archived).
+        """
+        entry = self.entries.pop(filename, None)
+        if entry is None:
+            return
+        self.changed.add(filename)
+        if entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self.entries[new_filename] = (new_stat.st_size, new_stat.st_mtime_ns,
+                                          entry[2], entry[3])
+            self.changed.add(new_filename)
+    
+    def retain(self, filenames):
+        """Drop entries for files that are no longer in the folder"""
+        stale = [name for name in self.entries if name not in filenames]
+        for name in stale:
+            del self.entries[name]
+        self.changed.update(stale)
+
+
+# =============================================================================
+# Sales Table
+# =============================================================================
+
+class SalesTable:
+    """
+    Columnar store of sales.
+    
+    Buyer and item names are interned into string tables and referenced by
+    integer id; ids, quantities, earnings and the sale date (as a
+    date.toordinal() day number) are kept in parallel array.array columns,
+    so a sale costs a few dozen bytes instead of a dict and a datetime.
+    """
+    
+    def __init__(self):
+        self.buyer_names = []
+        self.item_names = []
+        self.buyer_ids = {}
+        self.item_ids = {}
+        
+        # Substring search over item_names (Item Filter)
+        self.item_search = NameSearch(self.item_names)
+        
+        self.buyer = array('I')
+        self.item = array('I')
+        self.quantity = array('q')
+        self.earned = array('q')
+        self.day = array('i')
+    
+    def __len__(self):
+        return len(self.day)
+    
+    def intern_buyer(self, name):
+        """Return the id of a buyer name, adding it to the table if new"""
+        buyer_id = self.buyer_ids.get(name)
+        if buyer_id is None:
+            buyer_id = self.buyer_ids[name] = len(self.buyer_names)
+            self.buyer_names.append(name)
+        return buyer_id
+    
+    def intern_item(self, name):
+        """Return the id of an item name, adding it to the table if new"""
+        item_id = self.item_ids.get(name)
+        if item_id is None:
+            item_id = self.item_ids[name] = len(self.item_names)
+            self.item_names.append(name)
+        return item_id
+    
+    def append(self, buyer, item, quantity, earned, day):
+        """Add one sale; day is a date.toordinal() day number"""
+        self.buyer.append(self.intern_buyer(buyer))
+        self.item.append(self.intern_item(item))
+        self.quantity.append(quantity)
+        self.earned.append(earned)
+        self.day.append(day)
+    
+    def extend(self, date_sales, day):
+        """Add a list of (buyer, item, quantity, earned) sales made on one day"""
+        intern_buyer = self.intern_buyer
+        intern_item = self.intern_item
+        self.buyer.extend(intern_buyer(sale[0]) for sale in date_sales)
+        self.item.extend(intern_item(sale[1]) for sale in date_sales)
+        self.quantity.extend(sale[2] for sale in date_sales)
+        self.earned.extend(sale[3] for sale in date_sales)
+        self.day.extend([day] * len(date_sales))
+    
+    def sale_date(self, row):
+        """Return the sale date of a row as a datetime"""
+        return datetime.fromordinal(self.day[row])
+    
+    @classmethod
+    def from_dicts(cls, sales):
+        """Build a table from a list of sale dicts (Buyer, Item, Quantity, Earned, SaleDate)"""
+        table = cls()
+        for sale in sales:
+            table.append(sale['Buyer'], sale['Item'], sale['Quantity'], sale['Earned'],
+                         sale['SaleDate'].toordinal())
+        return table
+
+
+class NameSearch:
+    """
+    Case-insensitive substring search over a list of distinct names that
+    only grows (such as SalesTable.item_names), for filters that are re-run
+    on every keystroke.
+    
+    Names are lowercased once and indexed by the trigrams they contain, so a
+    search of three or more characters only checks the names holding all of
+    its trigrams. Recent searches are remembered: a search that extends an
+    earlier one (typing another character) only re-checks that one's
+    matches, and going back (deleting one) is answered from memory.
+    """
+    
+    # Searches remembered before the memory is cleared
+    MAX_RECENT = 64
+    
+    def __init__(self, names):
+        self.names = names
+        self.lower = []
+        # trigram -> set of name ids
+        self.trigrams = defaultdict(set)
+        # lowercased search text -> set of matching name ids
+        self.recent = {}
+    
+    def update(self):
+        """Index names added since the last search"""
+        if len(self.lower) == len(self.names):
+            return
+        trigrams = self.trigrams
+        for name_id in range(len(self.lower), len(self.names)):
+            name = self.names[name_id].lower()
+            self.lower.append(name)
+            for start in range(len(name) - 2):
+                trigrams[name[start:start + 3]].add(name_id)
+        # New names may match remembered searches
+        self.recent = {}
+    
+    def matching(self, text):
+        """Return the set of ids of the names containing text (ignoring case)"""
+        self.update()
+        text = text.lower()
+        matches = self.recent.get(text)
+        if matches is not None:
+            return matches
+        
+        # Narrow the longest remembered search this one extends, else the
+        # names holding every trigram of the text, else all names
+        candidates = None
+        for previous, previous_matches in self.recent.items():
+            if previous in text and (candidates is None or len(previous_matches) < len(candidates)):
+                candidates = previous_matches
+        if candidates is None and len(text) >= 3:
+            postings = sorted((self.trigrams.get(text[start:start + 3], set())
+                               for start in range(len(text) - 2)), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        if candidates is None:
+            candidates = range(len(self.lower))
+        
+        lower = self.lower
+        matches = {name_id for name_id in candidates if text in lower[name_id]}
+        if len(self.recent) >= self.MAX_RECENT:
+            self.recent = {}
+        self.recent[text] = matches
+        return matches
+
+
+# =============================================================================
+# Aggregation
+# =============================================================================
+
+class GroupAccumulator:
+    """Running totals for one group, updated one sale at a time"""
+    
+    __slots__ = ('count', 'quantity', 'earned', 'min_price', 'max_price', 'last_price')
+    
+    def __init__(self):
+        self.count = 0
+        self.quantity = 0
+        self.earned = 0
+        self.min_price = None
+        self.max_price = None
+        self.last_price = None
+    
+    def add(self, quantity, earned):
+        """Fold in one sale; sales must arrive in date order for last_price"""
+        price = earned / quantity if quantity else earned
+        self.count += 1
+        self.quantity += quantity
+        self.earned += earned
+        if self.min_price is None or price < self.min_price:
+            self.min_price = price
+        if self.max_price is None or price > self.max_price:
+            self.max_price = price
+        self.last_price = price
+    
+    def merge(self, count, quantity, earned, min_price, max_price, last_price):
+        """
+        Fold in the totals of a sub-group (such as one day of a month);
+        sub-groups must arrive in order of their last sale for last_price
+        """
+        self.count += count
+        self.quantity += quantity
+        self.earned += earned
+        if self.min_price is None or min_price < self.min_price:
+            self.min_price = min_price
+        if self.max_price is None or max_price > self.max_price:
+            self.max_price = max_price
+        self.last_price = last_price
+    
+    def as_result(self, group_name):
+        """Return the result row for this group"""
+        return {
+            'Group': group_name,
+            'TotalSold': self.quantity,
+            'TotalEarned': self.earned,
+            'AvgPrice': round(self.earned / self.quantity, 0) if self.quantity > 0 else 0,
+            'Sales': self.count,
+            'MinPrice': round(self.min_price, 0),
+            'MaxPrice': round(self.max_price, 0),
+            'LastPrice': round(self.last_price, 0)
+        }
+
+
+def format_day_key(group_by, day):
+    """
+    Format a date.toordinal() day number as the group key of a date
+    dimension, matching the strftime formats ("%Y", "%Y-%m", "%Y-%U",
+    "%Y-%m-%d") without calling strftime.
+    """
+    sale_date = date.fromordinal(day)
+    if group_by == "Year":
+        return str(sale_date.year)
+    elif group_by == "Month":
+        return f"{sale_date.year}-{sale_date.month:02d}"
+    elif group_by == "Week":
+        # %U: weeks start on Sunday; days before the first Sunday are week 0
+        day_of_year = sale_date.timetuple().tm_yday - 1
+        days_since_sunday = (sale_date.weekday() + 1) % 7
+        return f"{sale_date.year}-{(day_of_year + 7 - days_since_sunday) // 7:02d}"
+    else:
+        return f"{sale_date.year}-{sale_date.month:02d}-{sale_date.day:02d}"
+
+
+class DayKeyCache(dict):
+    """Maps day numbers to group keys, formatting each distinct day only once"""
+    
+    def __init__(self, group_by):
+        super().__init__()
+        self.group_by = group_by
+    
+    def __missing__(self, day):
+        key = self[day] = format_day_key(self.group_by, day)
+        return key
+
+
+class DailyRollup:
+    """
+    Per (day, item, buyer) totals of a SalesTable, so that date grouped
+    queries fold one entry per day, item and buyer instead of every sale.
+    With detail=False there is one entry per day (item and buyer columns
+    stay empty), for date queries without buyer or item filters.
+    
+    Entries are columnar like the SalesTable and ordered by day; within a
+    day they are ordered by their last sale, so folding them in order with
+    GroupAccumulator.merge keeps last_price exact. The name lists and maps
+    are the table's own, so group_keys and match_rows work on entries as
+    they do on sale rows.
+    """
+    
+    def __init__(self, sales, detail=True):
+        self.sales = sales
+        self.detail = detail
+        self.buyer_names = sales.buyer_names
+        self.item_names = sales.item_names
+        self.buyer_ids = sales.buyer_ids
+        self.item_ids = sales.item_ids
+        self.item_search = sales.item_search
+        
+        self.day = array('i')
+        self.item = array('I')
+        self.buyer = array('I')
+        self.count = array('q')
+        self.quantity = array('q')
+        self.earned = array('q')
+        self.min_price = array('d')
+        self.max_price = array('d')
+        self.last_price = array('d')
+        
+        self.add_days(0)
+    
+    def __len__(self):
+        return len(self.day)
+    
+    def add_days(self, first_row):
+        """
+        Roll up the sales from the day of row first_row onwards, replacing
+        any entries already made for those days (a day that gains sales is
+        rolled up again as a whole).
+        """
+        sales = self.sales
+        if first_row >= len(sales):
+            return
+        sale_day = sales.day
+        first_day = sale_day[first_row]
+        cut = bisect_left(self.day, first_day)
+        columns = (self.day, self.item, self.buyer, self.count, self.quantity,
+                   self.earned, self.min_price, self.max_price, self.last_price)
+        for column in columns:
+            del column[cut:]
+        
+        item_col, buyer_col = sales.item, sales.buyer
+        quantity_col, earned_col = sales.quantity, sales.earned
+        row = bisect_left(sale_day, first_day)
+        end_row = len(sales)
+        while row < end_row:
+            day = sale_day[row]
+            day_end = bisect_right(sale_day, day, row)
+            if self.detail:
+                groups = {}
+                for r in range(row, day_end):
+                    key = (item_col[r], buyer_col[r])
+                    # Re-insert on every sale so the dict ends up ordered by last sale
+                    accumulator = groups.pop(key, None)
+                    if accumulator is None:
+                        accumulator = GroupAccumulator()
+                    groups[key] = accumulator
+                    accumulator.add(quantity_col[r], earned_col[r])
+            else:
+                accumulator = GroupAccumulator()
+                for r in range(row, day_end):
+                    accumulator.add(quantity_col[r], earned_col[r])
+                groups = {None: accumulator}
+            for key, accumulator in groups.items():
+                self.day.append(day)
+                if key is not None:
+                    self.item.append(key[0])
+                    self.buyer.append(key[1])
+                self.count.append(accumulator.count)
+                self.quantity.append(accumulator.quantity)
+                self.earned.append(accumulator.earned)
+                self.min_price.append(accumulator.min_price)
+                self.max_price.append(accumulator.max_price)
+                self.last_price.append(accumulator.last_price)
+            row = day_end
+    
+    def entries_between(self, start_date, end_date):
+        """Entries dated within [start_date, end_date]"""
+        return range(bisect_left(self.day, start_date.toordinal()),
+                     bisect_right(self.day, end_date.toordinal()))
+
+
+class LoadedDataset:
+    """
+    Sales loaded from one folder for a date range, kept between runs so that
+    changing only filters, grouping or sorting does not re-read any files.
+    
+    The dataset remembers the folder, the date range it covers and the
+    (size, mtime) fingerprint of every log file it was built from; covers()
+    tells whether a new query can be answered from it. Buyer and item row
+    indexes and the DailyRollups are built on first use.
+    """
+    
+    def __init__(self, folder, start_date, end_date, fingerprints, sales):
+        self.folder = os.path.abspath(folder)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.fingerprints = fingerprints
+        self.sales = sales
+        
+        self._buyer_index = None
+        self._item_index = None
+        self._rollups = {}
+        
+        # (source, start_date, end_date, buyer_filter, item_filter,
+        # item_exact, rows) of the last filter_dataset call
+        self.last_selection = None
+    
+    def covers(self, folder, start_date, end_date, fingerprints):
+        """True if a query over [start_date, end_date] can be served from this dataset"""
+        return (self.folder == os.path.abspath(folder)
+                and self.start_date <= start_date and end_date <= self.end_date
+                and self.fingerprints == fingerprints)
+    
+    def rows_between(self, start_date, end_date):
+        """Rows dated within [start_date, end_date] (sales are ordered by date)"""
+        day = self.sales.day
+        return range(bisect_left(day, start_date.toordinal()),
+                     bisect_right(day, end_date.toordinal()))
+    
+    def buyer_rows(self, buyer_id):
+        """Ascending row numbers of a buyer's sales"""
+        if self._buyer_index is None:
+            self._buyer_index = self._build_index(self.sales.buyer, len(self.sales.buyer_names))
+        return self._buyer_index[buyer_id]
+    
+    def item_rows(self, item_id):
+        """Ascending row numbers of an item's sales"""
+        if self._item_index is None:
+            self._item_index = self._build_index(self.sales.item, len(self.sales.item_names))
+        return self._item_index[item_id]
+    
+    def daily_rollup(self, detail=True):
+        """Return the DailyRollup of the loaded sales, per day or per (day, item, buyer)"""
+        rollup = self._rollups.get(detail)
+        if rollup is None:
+            rollup = self._rollups[detail] = DailyRollup(self.sales, detail)
+        return rollup
+    
+    def extend(self, date_sales, day):
+        """
+        Append sales made on a day no earlier than any loaded sale, keeping
+        built row indexes and the rollup up to date.
+        
+        Returns:
+            range of the new row numbers
+        """
+        sales = self.sales
+        first = len(sales)
+        sales.extend(date_sales, day)
+        
+        for index, column, names in ((self._buyer_index, sales.buyer, sales.buyer_names),
+                                     (self._item_index, sales.item, sales.item_names)):
+            if index is None:
+                continue
+            index.extend(array('I') for _ in range(len(names) - len(index)))
+            for row in range(first, len(sales)):
+                index[column[row]].append(row)
+        
+        for rollup in self._rollups.values():
+            rollup.add_days(first)
+        self.last_selection = None
+        
+        return range(first, len(sales))
+    
+    @staticmethod
+    def _build_index(column, size):
+        index = [array('I') for _ in range(size)]
+        for row, value in enumerate(column):
+            index[value].append(row)
+        return index
+
+
+class AnalysisCancelled(Exception):
+    """Raised by ingestion when its cancel_event is set"""
+
+
+# =============================================================================
+# Run Statistics
+# =============================================================================
+
+# Logger RunStats.log writes to; it has no handler until enable_stats_log
+STATS_LOGGER = logging.getLogger("PGStallManager.stats")
+
+
+class RunStats:
+    """
+    Wall time per phase and item counters recorded during one query.
+    
+    Phases are timed with `with stats.phase(name):`; timing the same phase
+    more than once adds up. Counters are integers added to with count().
+    """
+    
+    # (counter, label) in the order summary() reports them
+    COUNTERS = (
+        ('files_seen', 'files'),
+        ('files_skipped', 'skipped'),
+        ('files_cached', 'cached'),
+        ('files_read', 'read'),
+        ('lines_read', 'lines'),
+        ('bought_matched', 'bought'),
+        ('lines_non_authority', 'non-authority'),
+        ('sales_loaded', 'sales'),
+        ('rows_matched', 'matched'),
+        ('groups', 'groups')
+    )
+    
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+    
+    @contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent inside it to a phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+    
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def total_seconds(self):
+        return sum(self.phases.values())
+    
+    def summary(self):
+        """Return a compact one-line description of the run"""
+        parts = [f"{name} {format_seconds(seconds)}" for name, seconds in self.phases.items()]
+        parts.append(f"total {format_seconds(self.total_seconds())}")
+        text = " | ".join(parts)
+        
+        counts = [f"{label} {self.counters[name]:,}"
+                  for name, label in self.COUNTERS if name in self.counters]
+        if counts:
+            text += " || " + ", ".join(counts)
+        return text
+    
+    def as_dict(self):
+        return {'phases': dict(self.phases), 'counters': dict(self.counters)}
+    
+    def log(self, context=""):
+        """Write the summary to the stats log (a no-op unless enable_stats_log was called)"""
+        if context:
+            STATS_LOGGER.info("%s: %s", context, self.summary())
+        else:
+            STATS_LOGGER.info("%s", self.summary())
+
+
+def format_seconds(seconds):
+    """Format a duration as '12ms' or '1.25s'"""
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.2f}s"
+
+
+def enable_stats_log(path=None, max_bytes=1_000_000, backup_count=3):
+    """
+    Append RunStats summaries to a rotating log file.
+    
+    Args:
+        path: Log file path (default: run_stats.log in default_cache_dir())
+        max_bytes: Size at which the log is rotated
+        backup_count: Rotated files kept
+    
+    Returns:
+        The path of the log file
+    """
+    if path is None:
+        path = os.path.join(default_cache_dir(), "run_stats.log")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    STATS_LOGGER.addHandler(handler)
+    STATS_LOGGER.setLevel(logging.INFO)
+    return path
+
+
+# =============================================================================
+# Authority File Algorithm for Deduplication
+# =============================================================================
+
+# Month abbreviation to number mapping
+MONTH_MAP = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+# Below this many files to parse, ingestion stays in-process
+PARALLEL_MIN_FILES = 64
+
+
+def parse_filename_info(filename):
+    """
+    Extract date info from filename: PlayerShopLog_YYMMDD_HHMMSS.txt
+    Returns: (year, month) tuple or None if invalid
+    """
+    match = LOG_FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    
+    date_str = match.group(1)
+    yy = int(date_str[0:2])
+    mm = int(date_str[2:4])
+    
+    return (2000 + yy, mm)
+
+
+def parse_filename_date(filename):
+    """
+    Extract the full date from filename: PlayerShopLog_YYMMDD_HHMMSS.txt
+    Returns: datetime or None if invalid
+    """
+    match = LOG_FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    
+    date_str = match.group(1)
+    try:
+        return datetime(2000 + int(date_str[0:2]), int(date_str[2:4]), int(date_str[4:6]))
+    except ValueError:
+        return None
+
+
+def file_may_overlap(filename, start_date, end_date):
+    """
+    Decide from its filename whether a log file can hold lines dated
+    within [start_date, end_date].
+    
+    A file written on day D holds lines from D back into the previous
+    month (the rollover calculate_full_date resolves), so its window is
+    the first day of the previous month through D plus one day of slack
+    for lines written around midnight. Files with an unreadable date are
+    always kept.
+    """
+    file_date = parse_filename_date(filename)
+    if file_date is None:
+        return True
+    
+    if file_date.month == 1:
+        window_start = datetime(file_date.year - 1, 12, 1)
+    else:
+        window_start = datetime(file_date.year, file_date.month - 1, 1)
+    window_end = file_date + timedelta(days=1)
+    
+    return window_start <= end_date and window_end >= start_date
+
+
+def parse_line_date_string(line):
+    """
+    Extract the date string from a log line.
+    Example: "Mon Jun 2 23:46 - ..." -> "Mon Jun 2"
+    Returns the date string or None if not found.
+    """
+    # Match pattern: DayOfWeek Month DayNum Time
+    match = LINE_DATE_PATTERN.match(line)
+    if match:
+        return match.group(1)
+    return None
+
+
+@lru_cache(maxsize=8192)
+def calculate_full_date(line_date_str, file_year, file_month):
+    """
+    Calculate the full datetime from a line date string and filename info.
+    
+    Memoized: a file only holds a handful of distinct date strings, so each
+    (date string, year, month) is resolved once.
+    
+    Args:
+        line_date_str: e.g., "Sat May 31"
+        file_year: Year from filename (e.g., 2025)
+        file_month: Month from filename (e.g., 6 for June)
+    
+    Returns:
+        datetime object or None if parsing fails
+    """
+    # Parse the line date string
+    # Format: "DayOfWeek Month Day" e.g., "Sat May 31"
+    parts = line_date_str.split()
+    if len(parts) < 3:
+        return None
+    
+    month_abbr = parts[1]
+    day_num = int(parts[2])
+    
+    line_month = MONTH_MAP.get(month_abbr)
+    if line_month is None:
+        return None
+    
+    # Determine the year with rollover check
+    # If filename is January but line is December, line is from previous year
+    year = file_year
+    if file_month == 1 and line_month == 12:
+        year = file_year - 1
+    
+    try:
+        return datetime(year, line_month, day_num)
+    except ValueError:
+        return None
+
+
+def ingest_files(folder, cache=None, progress=None, cancel_event=None,
+                 start_date=None, end_date=None, workers=0, stats=None, failed=None):
+    """
+    INGESTION PHASE: Read every log file once, recording the line counts
+    per date and buffering the candidate sales of each (file, date) pair.
+    
+    When a ParseCache is given, unchanged files are served from it and only
+    new or modified files are read. Files that do need reading are parsed
+    by parse_files, in worker processes when there are enough of them.
+    
+    When a date range is given, files whose filename date shows they
+    cannot hold lines in that range are skipped without being opened.
+    Every file that could hold a line in the range is still read, so the
+    authority decision for those dates is unchanged.
+    
+    A file that cannot be read is left out and not cached, so it is read
+    again by the next call instead of being taken for an empty file.
+    
+    Args:
+        folder: Path to log folder
+        cache: Optional ParseCache for the folder
+        progress: Optional callback(phase, done, total) called per file
+        cancel_event: Optional threading.Event; checked between files
+        start_date: Optional start of the requested date range
+        end_date: Optional end of the requested date range
+        workers: Processes for parse_files (0 = one per CPU, 1 = serial)
+        stats: Optional RunStats; gets the 'list' and 'ingest' phases and
+            the file, line and bought counters (files that could not be
+            read count as skipped)
+        failed: Optional list the names of the files that could not be read
+            are appended to
+    
+    Returns:
+        counts: dict[line_date_str][filepath] = line_count
+        file_info: dict[filepath] = (file_year, file_month)
+        partitions: dict[filepath][line_date_str] = [(buyer, item, quantity, earned), ...]
+    
+    Raises:
+        AnalysisCancelled: if cancel_event is set before all files are read
+    """
+    started = time.perf_counter()
+    log_entries = []
+    listed_names = set()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            parsed = parse_filename_info(entry.name)
+            if parsed is None:
+                continue
+            listed_names.add(entry.name)
+            if (start_date is not None and end_date is not None
+                    and not file_may_overlap(entry.name, start_date, end_date)):
+                continue
+            log_entries.append((entry, parsed))
+    # Archiving a file must not change which file wins a tie
+    log_entries.sort(key=lambda log_entry: log_file_stem(log_entry[0].name))
+    
+    listed = time.perf_counter()
+    total = len(log_entries)
+    
+    # Serve what the cache can; collect the files that must be parsed
+    results = [None] * total
+    file_stats = [None] * total
+    pending = []
+    for index, (entry, parsed) in enumerate(log_entries):
+        if cache is not None:
+            try:
+                file_stats[index] = entry.stat()
+            except OSError:
+                continue
+            results[index] = cache.get(entry.name, file_stats[index])
+        if results[index] is None:
+            pending.append(index)
+    
+    cached = total - len(pending)
+    done = cached
+    if progress is not None:
+        progress("Scanning files", done, total)
+    
+    pending_paths = [os.path.join(folder, log_entries[index][0].name) for index in pending]
+    lines_read = bought_matched = unreadable = 0
+    for index, result in zip(pending, parse_files(pending_paths, progress, cancel_event,
+                                                  done, total, workers)):
+        if result is None:
+            unreadable += 1
+            if failed is not None:
+                failed.append(log_entries[index][0].name)
+            continue
+        results[index] = result
+        counts_for_file, sales_for_file = result
+        if cache is not None:
+            cache.put(log_entries[index][0].name, file_stats[index],
+                      counts_for_file, sales_for_file)
+        lines_read += sum(counts_for_file.values())
+        bought_matched += sum(map(len, sales_for_file.values()))
+    
+    # Merge in listing order so ties between files resolve exactly as in
+    # the reference scan
+    counts = defaultdict(lambda: defaultdict(int))
+    file_info = {}
+    partitions = {}
+    for (entry, parsed), result in zip(log_entries, results):
+        if result is None:
+            continue
+        file_counts, file_sales = result
+        file_path = os.path.join(folder, entry.name)
+        file_info[file_path] = parsed
+        partitions[file_path] = file_sales
+        for line_date_str, line_count in file_counts.items():
+            counts[line_date_str][file_path] += line_count
+    
+    if cache is not None:
+        cache.retain(listed_names)
+    
+    if stats is not None:
+        stats.add_time('list', listed - started)
+        stats.add_time('ingest', time.perf_counter() - listed)
+        stats.count('files_seen', len(listed_names))
+        stats.count('files_skipped', len(listed_names) - total + unreadable)
+        stats.count('files_cached', cached)
+        stats.count('files_read', len(pending) - unreadable)
+        stats.count('lines_read', lines_read)
+        stats.count('bought_matched', bought_matched)
+    
+    return counts, file_info, partitions
+
+
+def parse_files(file_paths, progress=None, cancel_event=None, done=0, total=0, workers=0):
+    """
+    Parse log files with parse_log_file, yielding (counts, sales) per file
+    in the order given (None for a file that could not be read).
+    
+    Uses a process pool of `workers` processes (0 = one per CPU), unless that
+    is 1 or there are fewer than PARALLEL_MIN_FILES files (where process
+    start-up would cost more than it saves).
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    if workers <= 1 or len(file_paths) < PARALLEL_MIN_FILES:
+        for file_path in file_paths:
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled()
+            yield parse_log_file(file_path)
+            done += 1
+            if progress is not None:
+                progress("Scanning files", done, total)
+        return
+    
+    workers = min(workers, len(file_paths))
+    chunksize = max(1, len(file_paths) // (workers * 8))
+    # Imported here so that start-up does not pay for multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for result in executor.map(parse_log_file, file_paths, chunksize=chunksize):
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled()
+            yield result
+            done += 1
+            if progress is not None:
+                progress("Scanning files", done, total)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_files_for_authority(folder):
+    """
+    SCAN PHASE: Read all log files and count lines per date per file.
+    
+    Files are scanned as bytes by iter_date_runs; nothing but the date
+    prefixes is decoded. Files are visited in order of their name without
+    compression suffix (see log_file_stem).
+    
+    Part of the reference three-phase path; see ingest_files for the
+    single-pass equivalent used by default.
+    
+    Returns:
+        counts: dict[line_date_str][filepath] = line_count
+        file_info: dict[filepath] = (file_year, file_month)
+    """
+    counts = defaultdict(lambda: defaultdict(int))
+    file_info = {}
+    
+    pattern = LOG_FILENAME_PATTERN
+    
+    for filename in sorted(os.listdir(folder), key=log_file_stem):
+        if not pattern.match(filename):
+            continue
+        
+        parsed = parse_filename_info(filename)
+        if parsed is None:
+            continue
+        
+        file_year, file_month = parsed
+        file_path = os.path.join(folder, filename)
+        file_info[file_path] = (file_year, file_month)
+        
+        try:
+            for data in iter_log_chunks(file_path):
+                for line_date_str, line_count, _, _ in iter_date_runs(data):
+                    counts[line_date_str][file_path] += line_count
+        except Exception:
+            pass
+    
+    return counts, file_info
+
+
+def select_authority_files(counts):
+    """
+    SELECTION PHASE: For each unique line date, find the file with the most lines.
+    
+    Args:
+        counts: dict[line_date_str][filepath] = line_count
+    
+    Returns:
+        best_files: dict[line_date_str] = winning_filepath
+    """
+    best_files = {}
+    
+    for line_date_str, file_counts in counts.items():
+        # Find the file with the highest count for this date
+        winning_file = max(file_counts.keys(), key=lambda fp: file_counts[fp])
+        best_files[line_date_str] = winning_file
+    
+    return best_files
+
+
+def extract_sales_with_authority(folder, best_files, file_info, start_date, end_date):
+    """
+    EXTRACTION PHASE: Parse sales only from authority files for each date.
+    
+    Part of the reference three-phase path; re-reads every authority file.
+    
+    Args:
+        folder: Path to log folder
+        best_files: dict[line_date_str] = winning_filepath
+        file_info: dict[filepath] = (file_year, file_month)
+        start_date: Filter start date
+        end_date: Filter end date
+    
+    Returns:
+        List of sales dictionaries
+    """
+    all_sales = []
+    
+    # Get unique files that are authority for at least one date
+    authority_files = set(best_files.values())
+    
+    for file_path in authority_files:
+        if file_path not in file_info:
+            continue
+        
+        try:
+            for full_date, buyer, item, quantity, earned in read_authority_sales(
+                    file_path, best_files, file_info[file_path], start_date, end_date):
+                all_sales.append({
+                    'Buyer': buyer,
+                    'Item': item,
+                    'Quantity': quantity,
+                    'Earned': earned,
+                    'SaleDate': full_date
+                })
+        except Exception:
+            pass
+    
+    # Sort by date
+    all_sales.sort(key=lambda x: x['SaleDate'])
+    
+    return all_sales
+
+
+def read_authority_sales(file_path, best_files, file_date_info, start_date, end_date):
+    """
+    Re-read one log file as text and yield the sales on the lines of the
+    dates it is the authority file for, in the order of the file.
+    
+    Args:
+        file_date_info: (file_year, file_month) of the file
+        best_files, start_date, end_date: as for extract_sales_with_authority
+    
+    Yields:
+        (full_date, buyer, item, quantity, earned)
+    """
+    file_year, file_month = file_date_info
+    
+    # Regex pattern to match purchase lines together with their date
+    sale_pattern = SALE_LINE_PATTERN
+    
+    if archive_suffix(file_path):
+        opened = open_archive(file_path, 'rt', encoding='utf-8')
+    else:
+        opened = open(file_path, 'r', encoding='utf-8')
+    with opened as f:
+        for line in f:
+            # Check if this is a purchase line (cheap test first)
+            if 'bought' not in line:
+                continue
+            
+            # Match the date and purchase fields in one go
+            match = sale_pattern.match(line)
+            if not match:
+                continue
+            line_date_str = match.group('date')
+            
+            # Check if this file is the authority for this line's date
+            if best_files.get(line_date_str) != file_path:
+                continue
+            
+            # Calculate full date
+            full_date = calculate_full_date(line_date_str, file_year, file_month)
+            if full_date is None:
+                continue
+            
+            # Filter by date range
+            if full_date < start_date or full_date > end_date:
+                continue
+            
+            yield (full_date, match.group('buyer'), match.group('item').strip(),
+                   int(match.group('qty')) if match.group('qty') else 1,
+                   int(match.group('earned')))
+
+
+def collect_authority_sales(partitions, best_files, file_info, start_date, end_date):
+    """
+    EXTRACTION PHASE (single-pass): Keep only the buffered partitions of
+    each date's authority file.
+    
+    Args:
+        partitions: dict[filepath][line_date_str] = buffered sales from ingest_files
+        best_files: dict[line_date_str] = winning_filepath
+        file_info: dict[filepath] = (file_year, file_month)
+        start_date: Filter start date
+        end_date: Filter end date
+    
+    Returns:
+        SalesTable ordered by sale date
+    """
+    kept = []
+    
+    for line_date_str, file_path in best_files.items():
+        date_sales = partitions.get(file_path, {}).get(line_date_str)
+        if not date_sales:
+            continue
+        
+        file_year, file_month = file_info[file_path]
+        full_date = calculate_full_date(line_date_str, file_year, file_month)
+        if full_date is None:
+            continue
+        
+        if full_date < start_date or full_date > end_date:
+            continue
+        
+        kept.append((full_date.toordinal(), date_sales))
+    
+    # Sort by date (whole partitions, not individual sales)
+    kept.sort(key=lambda x: x[0])
+    
+    all_sales = SalesTable()
+    for day, date_sales in kept:
+        all_sales.extend(date_sales, day)
+    
+    return all_sales
+
+
+def iter_authority_sales(partitions, best_files, file_info, start_date, end_date):
+    """
+    EXTRACTION PHASE (streaming): Yield the buffered sales of each date's
+    authority file, one at a time in date order, without collecting them.
+    
+    Every file's authority dates are streamed in date order and the
+    per-file streams are merged (heapq.merge), so no list of all sales is
+    built or sorted. Arguments are as for collect_authority_sales.
+    
+    Yields:
+        (day, buyer, item, quantity, earned) with day a date.toordinal()
+        day number
+    """
+    file_days = defaultdict(list)
+    for line_date_str, file_path in best_files.items():
+        if not partitions.get(file_path, {}).get(line_date_str):
+            continue
+        
+        file_year, file_month = file_info[file_path]
+        full_date = calculate_full_date(line_date_str, file_year, file_month)
+        if full_date is None:
+            continue
+        
+        if full_date < start_date or full_date > end_date:
+            continue
+        
+        file_days[file_path].append((full_date.toordinal(), line_date_str))
+    
+    def file_sales(file_partitions, days):
+        for day, line_date_str in sorted(days):
+            for buyer, item, quantity, earned in file_partitions[line_date_str]:
+                yield day, buyer, item, quantity, earned
+    
+    # Files in listing order, so sales of one day keep collect_authority_sales' order
+    streams = [file_sales(partitions[file_path], file_days[file_path])
+               for file_path in partitions if file_path in file_days]
+    return heapq.merge(*streams, key=itemgetter(0))
+
+
+def iter_authority_files(best_files, file_info, start_date, end_date):
+    """
+    EXTRACTION PHASE (reference, streaming): Yield the sales of each date's
+    authority file in date order, re-reading the authority files as the
+    reference path does (read_authority_sales) instead of buffering the
+    sales of every file.
+    
+    A file is only read once the sales reach the first day it is the
+    authority for, and only its authority sales are kept until they are
+    yielded, so the files read are held in memory a few at a time.
+    Arguments are as for extract_sales_with_authority.
+    
+    Yields:
+        (day, buyer, item, quantity, earned) with day a date.toordinal()
+        day number
+    """
+    first_days = {}
+    for line_date_str, file_path in best_files.items():
+        if file_path not in file_info:
+            continue
+        full_date = calculate_full_date(line_date_str, *file_info[file_path])
+        if full_date is None or full_date < start_date or full_date > end_date:
+            continue
+        day = full_date.toordinal()
+        if day < first_days.get(file_path, day + 1):
+            first_days[file_path] = day
+    
+    def file_sales(file_path):
+        sales = []
+        try:
+            for full_date, buyer, item, quantity, earned in read_authority_sales(
+                    file_path, best_files, file_info[file_path], start_date, end_date):
+                sales.append((full_date.toordinal(), buyer, item, quantity, earned))
+        except Exception:
+            pass
+        sales.sort(key=itemgetter(0))
+        return iter(sales)
+    
+    # Files by first day, then in listing order, which also breaks ties
+    # between files' sales of one day
+    order = {file_path: index for index, file_path in enumerate(file_info)}
+    files = sorted(first_days, key=lambda file_path: (first_days[file_path], order[file_path]))
+    
+    # (day, file order, sale, rest of the file's sales) of the files read
+    heap = []
+    next_file = 0
+    while heap or next_file < len(files):
+        while next_file < len(files) and (not heap or first_days[files[next_file]] <= heap[0][0]):
+            file_path = files[next_file]
+            next_file += 1
+            stream = file_sales(file_path)
+            sale = next(stream, None)
+            if sale is not None:
+                heapq.heappush(heap, (sale[0], order[file_path], sale, stream))
+        if not heap:
+            continue
+        _, file_order, sale, stream = heap[0]
+        yield sale
+        sale = next(stream, None)
+        if sale is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (sale[0], file_order, sale, stream))
+
+
+# =============================================================================
+# Filtering and Aggregation
+# =============================================================================
+
+# (result key, heading) of the columns of non-pivot results
+FLAT_COLUMNS = [
+    ('Group', 'Group'),
+    ('TotalSold', 'TotalSold'),
+    ('TotalEarned', 'TotalEarned'),
+    ('AvgPrice', 'AvgPrice'),
+    ('Sales', 'Sales'),
+    ('MinPrice', 'MinPrice'),
+    ('MaxPrice', 'MaxPrice'),
+    ('LastPrice', 'LastPrice')
+]
+
+# Measures a pivot cell can show
+PIVOT_MEASURES = ('TotalSold', 'TotalEarned', 'AvgPrice')
+
+# Group By dimensions answered from the DailyRollup
+DATE_DIMENSIONS = ("Year", "Month", "Week", "Day")
+
+# Rows from which filtering and aggregation are handed to the NumPy backend
+# (PGStallVector) when NumPy is installed; on fewer rows its set-up costs
+# more than it saves
+VECTOR_MIN_ROWS = 1024
+
+# The PGStallVector module, None when NumPy is missing or the backend is
+# turned off (use_vector_backend), False until it is first looked up
+_vector_module = False
+
+
+def vector_backend():
+    """Return the NumPy backend module (PGStallVector), or None if it is not used"""
+    global _vector_module
+    if _vector_module is False:
+        try:
+            # Imported on first use so the engine never needs NumPy
+            import PGStallVector
+        except ImportError:
+            PGStallVector = None
+        _vector_module = PGStallVector
+    return _vector_module
+
+
+def use_vector_backend(enabled):
+    """Turn the NumPy backend on (if NumPy is installed) or off for the whole process"""
+    global _vector_module
+    _vector_module = False if enabled else None
+
+
+def apply_filters(dataset, buyer_filter, item_filter, item_exact, start_date, end_date):
+    """
+    Select the rows of a LoadedDataset within a date range that match the
+    buyer and item filters.
+    
+    Filters are resolved against the distinct buyer/item names first;
+    exact matches are then served from the dataset's buyer and item row
+    indexes instead of scanning every sale.
+    
+    Returns:
+        Sequence of matching row numbers in date order
+    """
+    sales_data = dataset.sales
+    date_rows = dataset.rows_between(start_date, end_date)
+    lo, hi = date_rows.start, date_rows.stop
+    
+    candidates = None
+    
+    if buyer_filter:
+        buyer_id = sales_data.buyer_ids.get(buyer_filter)
+        if buyer_id is None:
+            return array('I')
+        buyer_rows = dataset.buyer_rows(buyer_id)
+        candidates = buyer_rows[bisect_left(buyer_rows, lo):bisect_left(buyer_rows, hi)]
+    
+    if item_filter:
+        item_ids = matching_item_ids(sales_data, item_filter, item_exact)
+        
+        if candidates is not None:
+            # Narrow the buyer's rows by item
+            candidates = rows_with_items(sales_data, candidates, item_ids)
+        else:
+            bounds = []
+            for item_id in item_ids:
+                item_rows = dataset.item_rows(item_id)
+                bounds.append((item_rows, bisect_left(item_rows, lo), bisect_left(item_rows, hi)))
+            matched = sum(stop - start for _, start, stop in bounds)
+            if len(bounds) > 1 and (4 * matched > hi - lo or vector_backend() is not None):
+                # Most of the range matches, or NumPy can mask it: scan it
+                # rather than merge and sort the item indexes
+                candidates = rows_with_items(sales_data, date_rows, item_ids)
+            else:
+                merged = array('I')
+                for item_rows, start, stop in bounds:
+                    merged.extend(item_rows[start:stop])
+                candidates = array('I', sorted(merged)) if len(bounds) > 1 else merged
+    
+    return date_rows if candidates is None else candidates
+
+
+def matching_item_ids(sales_data, item_filter, item_exact):
+    """Return the set of item ids an item filter selects"""
+    if item_exact:
+        item_id = sales_data.item_ids.get(item_filter)
+        return {item_id} if item_id is not None else set()
+    return sales_data.item_search.matching(item_filter)
+
+
+def match_rows(sales_data, rows, buyer_filter, item_filter, item_exact):
+    """
+    Select the given rows that match the buyer and item filters by checking
+    each row, for small row sets (such as sales that just arrived) where
+    apply_filters' indexes would cost more than they save.
+    """
+    buyer_id = item_ids = None
+    if buyer_filter:
+        buyer_id = sales_data.buyer_ids.get(buyer_filter)
+        if buyer_id is None:
+            return array('I')
+    if item_filter:
+        item_ids = matching_item_ids(sales_data, item_filter, item_exact)
+        if not item_ids:
+            return array('I')
+    
+    backend = vector_backend()
+    if backend is not None and len(rows) >= VECTOR_MIN_ROWS:
+        return backend.match_rows(sales_data, rows, buyer_id, item_ids)
+    
+    rows = array('I', rows)
+    if buyer_id is not None:
+        buyer_col = sales_data.buyer
+        rows = array('I', (row for row in rows if buyer_col[row] == buyer_id))
+    if item_ids is not None:
+        rows = rows_with_items(sales_data, rows, item_ids)
+    return rows
+
+
+def rows_with_items(sales_data, rows, item_ids):
+    """Select the given rows (in date order) whose item is one of item_ids"""
+    backend = vector_backend()
+    if backend is not None and len(rows) >= VECTOR_MIN_ROWS:
+        return backend.match_rows(sales_data, rows, item_ids=item_ids)
+    if isinstance(rows, range):
+        items = sales_data.item[rows.start:rows.stop]
+    else:
+        items = map(sales_data.item.__getitem__, rows)
+    return array('I', compress(rows, map(item_ids.__contains__, items)))
+
+
+def group_keys(sales_data, rows, group_by):
+    """Return an iterator over the grouping key of each given row"""
+    if group_by == "Buyer":
+        return map(sales_data.buyer_names.__getitem__, map(sales_data.buyer.__getitem__, rows))
+    elif group_by in DATE_DIMENSIONS:
+        return map(DayKeyCache(group_by).__getitem__, map(sales_data.day.__getitem__, rows))
+    else:
+        return map(sales_data.item_names.__getitem__, map(sales_data.item.__getitem__, rows))
+
+
+def group_and_aggregate(sales_data, rows, group_by, then_by=None):
+    """
+    Group the given rows of a SalesTable and calculate aggregates in a
+    single streaming pass, keeping one GroupAccumulator per group.
+    
+    With then_by set, groups are (group_by, then_by) pairs and each result
+    also carries the second key under 'Column'. Large row sets are grouped
+    by the NumPy backend when it is available.
+    """
+    backend = vector_backend()
+    if backend is not None and len(rows) >= VECTOR_MIN_ROWS:
+        results = backend.group_and_aggregate(sales_data, rows, group_by, then_by)
+        if results is not None:
+            return results
+    
+    keys = group_keys(sales_data, rows, group_by)
+    if then_by:
+        keys = zip(keys, group_keys(sales_data, rows, then_by))
+    return group_results(accumulate_sales(sales_data, rows, keys), then_by)
+
+
+def aggregate_rollup(rollup, entries, group_by, then_by=None):
+    """
+    Group the given entries of a DailyRollup like group_and_aggregate groups
+    sale rows, merging each entry's totals instead of adding single sales.
+    """
+    backend = vector_backend()
+    if backend is not None and len(entries) >= VECTOR_MIN_ROWS:
+        results = backend.aggregate_rollup(rollup, entries, group_by, then_by)
+        if results is not None:
+            return results
+    
+    keys = group_keys(rollup, entries, group_by)
+    if then_by:
+        keys = zip(keys, group_keys(rollup, entries, then_by))
+    return group_results(accumulate_entries(rollup, entries, keys), then_by)
+
+
+def accumulate_sales(sales_data, rows, keys):
+    """Return {key: GroupAccumulator} over the given rows and their grouping keys"""
+    groups = {}
+    for key, quantity, earned in zip(keys,
+                                     map(sales_data.quantity.__getitem__, rows),
+                                     map(sales_data.earned.__getitem__, rows)):
+        accumulator = groups.get(key)
+        if accumulator is None:
+            accumulator = groups[key] = GroupAccumulator()
+        accumulator.add(quantity, earned)
+    return groups
+
+
+def accumulate_entries(rollup, entries, keys):
+    """Return {key: GroupAccumulator} over the given DailyRollup entries and their keys"""
+    groups = {}
+    for key, entry in zip(keys, entries):
+        accumulator = groups.get(key)
+        if accumulator is None:
+            accumulator = groups[key] = GroupAccumulator()
+        accumulator.merge(rollup.count[entry], rollup.quantity[entry], rollup.earned[entry],
+                          rollup.min_price[entry], rollup.max_price[entry],
+                          rollup.last_price[entry])
+    return groups
+
+
+def group_results(groups, then_by=None):
+    """Turn {key: GroupAccumulator} into result rows ('Column' holds the then_by key)"""
+    if not then_by:
+        return [accumulator.as_result(key) for key, accumulator in groups.items()]
+    
+    results = []
+    for (group_name, column_name), accumulator in groups.items():
+        result = accumulator.as_result(group_name)
+        result['Column'] = column_name
+        results.append(result)
+    return results
+
+
+def merge_results(results, delta_results):
+    """
+    Fold the flat results of newly added sales into existing flat results.
+    
+    Rows of groups that already exist are updated in place; Min/Max/Last
+    prices stay exact because rounding preserves order and the new sales
+    are the latest.
+    
+    Returns:
+        (indexes of the updated rows, delta results for groups not in results)
+    """
+    positions = {r['Group']: index for index, r in enumerate(results)}
+    updated = []
+    unknown = []
+    for delta in delta_results:
+        index = positions.get(delta['Group'])
+        if index is None:
+            unknown.append(delta)
+            continue
+        r = results[index]
+        r['TotalSold'] += delta['TotalSold']
+        r['TotalEarned'] += delta['TotalEarned']
+        r['AvgPrice'] = round(r['TotalEarned'] / r['TotalSold'], 0) if r['TotalSold'] > 0 else 0
+        r['Sales'] += delta['Sales']
+        r['MinPrice'] = min(r['MinPrice'], delta['MinPrice'])
+        r['MaxPrice'] = max(r['MaxPrice'], delta['MaxPrice'])
+        r['LastPrice'] = delta['LastPrice']
+        updated.append(index)
+    return updated, unknown
+
+
+def pivot_results(results, measure):
+    """
+    Turn (group, column) results into one row per group with a cell per
+    column holding the chosen measure, plus a Total cell.
+    
+    Cells are stored under ('Column', name) keys so column names can never
+    clash with the row's own keys.
+    
+    Returns:
+        (rows, column_names) with column names in ascending order
+    """
+    pivot = {}
+    column_names = set()
+    for r in results:
+        row = pivot.get(r['Group'])
+        if row is None:
+            row = pivot[r['Group']] = {'Group': r['Group'], 'TotalSold': 0, 'TotalEarned': 0}
+        row[('Column', r['Column'])] = r[measure]
+        row['TotalSold'] += r['TotalSold']
+        row['TotalEarned'] += r['TotalEarned']
+        column_names.add(r['Column'])
+    
+    rows = list(pivot.values())
+    for row in rows:
+        row['AvgPrice'] = round(row['TotalEarned'] / row['TotalSold'], 0) if row['TotalSold'] > 0 else 0
+        if measure == 'AvgPrice':
+            row['Total'] = row['AvgPrice']
+        else:
+            row['Total'] = row[measure]
+    
+    return rows, sorted(column_names)
+
+
+class ResultSet(list):
+    """
+    The result rows of a query, with the ascending row order of each column
+    computed on first use and cached, so re-sorting by a column (in either
+    direction) only reads the cached order.
+    
+    Rows changed in place (such as by merge_results) leave the cached
+    orders stale; call invalidate() afterwards.
+    """
+    
+    def __init__(self, rows=()):
+        super().__init__(rows)
+        self._orders = {}
+    
+    def order(self, column):
+        """Return the row indexes in ascending order of a column (missing cells count as 0)"""
+        order = self._orders.get(column)
+        if order is None:
+            keys = [r.get(column, 0) for r in self]
+            order = self._orders[column] = sorted(range(len(keys)), key=keys.__getitem__)
+        return order
+    
+    def invalidate(self):
+        """Forget the cached orders after rows were changed in place"""
+        self._orders = {}
+
+
+def top_results(results, sort_by, sort_descending, top_n=0):
+    """
+    Return the results sorted by a column, cut to the first top_n when top_n
+    is set.
+    
+    Top N is selected with a heap (heapq.nlargest/nsmallest, which order
+    ties like a stable sort) so only the kept rows are sorted.
+    """
+    key = itemgetter(sort_by)
+    if 0 < top_n < len(results):
+        select = heapq.nlargest if sort_descending else heapq.nsmallest
+        return select(top_n, results, key=key)
+    results.sort(key=key, reverse=sort_descending)
+    return results
+
+
+def shape_results(results, group_by, then_by, sort_by, top_n, stats, groups=None):
+    """
+    Turn aggregated results into the outcome of a query: pivot them when
+    then_by is set, sort them and apply Top N (top_results), and describe
+    them.
+    
+    Args:
+        results: Results of group_and_aggregate (or the warehouse's)
+        stats: RunStats for the 'aggregate' (pivot) and 'sort' phases and
+            the groups counter
+        groups: Number of groups to report when results are already cut to
+            Top N (default: len of the shaped results)
+    
+    Returns:
+        (summary_text, results, columns, sort_by, sort_descending) with the
+        results as a ResultSet
+    """
+    sort_descending = True
+    if sort_by == "Group":
+        sort_descending = False
+    
+    columns = FLAT_COLUMNS
+    if then_by:
+        # Pivot: one row per group_by value, one column per then_by value
+        with stats.phase('aggregate'):
+            measure = sort_by if sort_by in PIVOT_MEASURES else 'TotalEarned'
+            results, column_names = pivot_results(results, measure)
+            columns = ([('Group', group_by)]
+                       + [(('Column', name), name) for name in column_names]
+                       + [('Total', 'Total')])
+            if sort_by != "Group":
+                sort_by = 'Total'
+    stats.count('groups', len(results) if groups is None else groups)
+    
+    # Sort results and apply the top N filter
+    with stats.phase('sort'):
+        results = ResultSet(top_results(results, sort_by, sort_descending, top_n))
+    
+    if then_by:
+        summary_text = f"Showing {measure} by {group_by} and {then_by}"
+    else:
+        summary_text = f"Showing totals grouped by {group_by} (sorted by {sort_by})"
+    if top_n > 0:
+        summary_text += f" - Top {top_n} results"
+    
+    return summary_text, results, columns, sort_by, sort_descending
+
+
+def filter_dataset(dataset, params, stats):
+    """
+    Select the sales of a LoadedDataset that a query's date range and
+    filters match: sale rows, or entries of a DailyRollup when grouping by
+    a date dimension (SalesEngine.select_rows).
+    
+    Returns:
+        (source, rows, message) as for SalesEngine.select_rows
+    """
+    group_by = params['group_by']
+    then_by = params.get('then_by')
+    start_date = params['start_date']
+    end_date = params['end_date']
+    
+    buyer_filter = params['buyer_filter']
+    item_filter = params['item_filter']
+    item_exact = params['item_exact']
+    
+    if group_by in DATE_DIMENSIONS:
+        # Date groups are folded from a daily rollup, filtered by entry
+        # instead of by sale; per-day totals do unless a buyer or item
+        # is filtered or grouped on
+        detail = bool(buyer_filter or item_filter or then_by in ("Buyer", "Item"))
+        with stats.phase('rollup'):
+            source = dataset.daily_rollup(detail)
+    else:
+        source = dataset.sales
+    
+    # An item filter extended by typing can only match rows the previous
+    # one matched, so only those are checked again
+    previous = dataset.last_selection
+    narrow = (previous is not None and item_filter and not item_exact
+              and previous[:4] == (source, start_date, end_date, buyer_filter)
+              and previous[4] and not previous[5]
+              and previous[4].lower() in item_filter.lower())
+    
+    with stats.phase('filter'):
+        if narrow:
+            rows = match_rows(source, previous[6], "", item_filter, False)
+        elif source is dataset.sales:
+            rows = apply_filters(dataset, buyer_filter, item_filter, item_exact,
+                                 start_date, end_date)
+        else:
+            rows = match_rows(source, source.entries_between(start_date, end_date),
+                              buyer_filter, item_filter, item_exact)
+    dataset.last_selection = (source, start_date, end_date, buyer_filter,
+                              item_filter, item_exact, rows)
+    
+    if source is dataset.sales:
+        stats.count('rows_matched', len(rows))
+    else:
+        stats.count('rows_matched', sum(map(source.count.__getitem__, rows)))
+    
+    if not rows:
+        if not dataset.rows_between(start_date, end_date):
+            return None, (), "No sales data found in the specified date range."
+        return None, (), "No sales found for the applied filters."
+    
+    return source, rows, None
+
+
+def aggregate_selection(params, source, rows, message, stats):
+    """
+    Group and aggregate the rows SalesEngine.select_rows selected and shape
+    them (shape_results) into the outcome of run_query.
+    """
+    group_by = params['group_by']
+    then_by = params.get('then_by')
+    sort_by = params['sort_by']
+    if message is not None:
+        return message, ResultSet(), FLAT_COLUMNS, sort_by, sort_by != "Group"
+    
+    with stats.phase('aggregate'):
+        if isinstance(source, DailyRollup):
+            results = aggregate_rollup(source, rows, group_by, then_by)
+        else:
+            results = group_and_aggregate(source, rows, group_by, then_by)
+    
+    return shape_results(results, group_by, then_by, sort_by, params['top_n'], stats)
+
+
+def folder_fingerprints(folder):
+    """Return {filename: (size, mtime_ns)} for every log file in a folder"""
+    fingerprints = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not LOG_FILENAME_PATTERN.match(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            fingerprints[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return fingerprints
+
+
+# =============================================================================
+# Archiving
+# =============================================================================
+
+def archive_logs(folder, older_than_days, compression='gz', cache=None, today=None,
+                 progress=None, cancel_event=None, archived=None):
+    """
+    Compress the plain log files of a folder whose filename date is at least
+    older_than_days days before today, replacing each with PlayerShopLog_
+    ..._N.txt.gz (or .bz2, .xz).
+    
+    A file's contents and modification time are kept, and folders are
+    listed by name without compression suffix (log_file_stem), so the
+    authority file of every date stays the same. Each archive is written
+    under a temporary name first; the original is removed only once the
+    archive is in place. A file that already has an archive of the same
+    name (the game wrote the plain file again) is left alone, so no
+    archive is ever overwritten.
+    
+    Args:
+        folder: Path to log folder
+        older_than_days: Files dated at least this many days ago are
+            archived; at least 1, as today's log is still being written
+        compression: 'gz', 'bz2' or 'xz'
+        cache: Optional ParseCache; entries move to the archive's name, so
+            archives are never decompressed to be parsed
+        today: Date to count back from (default: today)
+        progress: Optional callback(phase, done, total)
+        cancel_event: Optional threading.Event checked between files
+        archived: Optional list the files archived are appended to as they
+            are archived, so the caller has them when archiving stops part
+            way through
+    
+    Returns:
+        [(filename, archive_filename), ...] of the files archived (archived
+        when given)
+    
+    Raises:
+        ValueError: for an unknown compression or older_than_days below 1
+        AnalysisCancelled: if cancel_event is set before all files are done
+    """
+    suffix = '.' + compression
+    if suffix not in ARCHIVE_MODULES:
+        raise ValueError(f"Unknown compression: {compression}")
+    if older_than_days < 1:
+        raise ValueError(f"Cannot archive logs newer than a day: {older_than_days}")
+    module = importlib.import_module(ARCHIVE_MODULES[suffix])
+    cutoff = datetime.combine(today or date.today(), datetime.min.time())
+    cutoff -= timedelta(days=older_than_days)
+    
+    listed = sorted(os.listdir(folder))
+    existing = set(listed)
+    filenames = []
+    for filename in listed:
+        if archive_suffix(filename) or not LOG_FILENAME_PATTERN.match(filename):
+            continue
+        if any(filename + other in existing for other in ARCHIVE_MODULES):
+            continue
+        file_date = parse_filename_date(filename)
+        if file_date is not None and file_date <= cutoff:
+            filenames.append(filename)
+    
+    if archived is None:
+        archived = []
+    for index, filename in enumerate(filenames):
+        if cancel_event is not None and cancel_event.is_set():
+            raise AnalysisCancelled()
+        if progress is not None:
+            progress("Archiving files", index, len(filenames))
+        
+        file_path = os.path.join(folder, filename)
+        archive_path = file_path + suffix
+        tmp_path = archive_path + ".tmp"
+        try:
+            stat = os.stat(file_path)
+            with open(file_path, 'rb') as src, module.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, ARCHIVE_CHUNK_BYTES)
+            os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_path, archive_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            continue
+        
+        try:
+            os.remove(file_path)
+        except OSError:
+            # Keep the original (it may be open elsewhere); drop the copy
+            try:
+                os.remove(archive_path)
+            except OSError:
+                pass
+            continue
+        
+        if cache is not None:
+            cache.rename(filename, filename + suffix, stat, os.stat(archive_path))
+        archived.append((filename, filename + suffix))
+    
+    if progress is not None:
+        progress("Archiving files", len(filenames), len(filenames))
+    return archived
+
+
+# =============================================================================
+# Engine
+# =============================================================================
+
+class SalesEngine:
+    """
+    Answers sales queries against Books folders.
+    
+    Keeps the parse cache of the current folder and the LoadedDataset of the
+    last query, so follow-up queries that only change filters, grouping or
+    sorting never touch the log files.
+    """
+    
+    def __init__(self, reference_mode=False, workers=0, cache_dir=None, warehouse=False):
+        # Use the original scan/select/extract path instead of single-pass
+        # ingestion (uncached; kept to check results against)
+        self.reference_mode = reference_mode
+        
+        # Answer queries from the SQLite sales warehouse of the folder
+        # instead of loading sales into memory (ignored in reference mode)
+        self.use_warehouse = warehouse and not reference_mode
+        self.warehouse = None
+        
+        # Processes used to parse log files (0 = one per CPU, 1 = serial)
+        self.workers = workers
+        
+        # Where parse caches live (None = default_cache_dir())
+        self.cache_dir = cache_dir
+        
+        # Parsed-file cache for the folder of the last query
+        self.parse_cache = None
+        
+        # Sales loaded by the last query, reused while the folder is unchanged
+        self.dataset = None
+        
+        # RunStats of the last query
+        self.last_stats = None
+    
+    def get_parse_cache(self, folder):
+        """Return the parse cache for a folder, loading it on first use"""
+        if self.parse_cache is None or self.parse_cache.folder != os.path.abspath(folder):
+            self.parse_cache = ParseCache(folder, self.cache_dir)
+        return self.parse_cache
+    
+    def get_warehouse(self, folder):
+        """Return the sales warehouse for a folder, opening it on first use"""
+        if self.warehouse is None or self.warehouse.folder != os.path.abspath(folder):
+            # Imported here so the in-memory engine does not load sqlite3
+            from PGStallWarehouse import SalesWarehouse
+            if self.warehouse is not None:
+                self.warehouse.close()
+            self.warehouse = SalesWarehouse(folder, self.cache_dir)
+        return self.warehouse
+    
+    def rebuild_cache(self, folder):
+        """Discard the parse cache and loaded sales so the next query re-reads every file"""
+        self.get_parse_cache(folder).clear()
+        self.dataset = None
+        if self.use_warehouse:
+            self.get_warehouse(folder).clear()
+    
+    def archive_logs(self, folder, older_than_days, compression='gz',
+                     progress=None, cancel_event=None):
+        """
+        Compress old log files of a folder (see archive_logs) and carry their
+        parse cache entries, and warehouse rows with the warehouse enabled,
+        over to the archives so none of them has to be decompressed.
+        
+        Returns:
+            [(filename, archive_filename), ...] of the files archived
+        """
+        cache = self.get_parse_cache(folder)
+        if self.use_warehouse:
+            # Rows can only be carried over for files the warehouse is current with
+            warehouse = self.get_warehouse(folder)
+            warehouse.update(progress, cancel_event, self.workers)
+        # Filled in as files are archived, so files archived before a cancel
+        # or an error are carried over too
+        archived = []
+        try:
+            archive_logs(folder, older_than_days, compression, cache,
+                         progress=progress, cancel_event=cancel_event, archived=archived)
+        finally:
+            cache.save()
+            if self.use_warehouse:
+                warehouse.rename_files(archived)
+        return archived
+    
+    def run_query(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Run the whole pipeline (ingest, select, extract, filter, aggregate)
+        for one query. With the warehouse enabled, the query is handed to
+        SalesWarehouse.run_query instead.
+        
+        Args:
+            params: dict with folder, group_by, then_by (or None),
+                buyer_filter, item_filter, item_exact, sort_by, top_n,
+                start_date and end_date
+            progress: Optional callback(phase, done, total)
+            cancel_event: Optional threading.Event checked between files
+            stats: Optional RunStats to record phase times and counters in
+                (a new one is used otherwise); kept as self.last_stats
+        
+        Returns:
+            (summary_text, results, columns, sort_by, sort_descending) where
+            columns is a list of (result key, heading)
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        if stats is None:
+            stats = RunStats()
+        self.last_stats = stats
+        
+        if self.use_warehouse:
+            return self.get_warehouse(params['folder']).run_query(params, progress, cancel_event,
+                                                                  self.workers, stats)
+        
+        source, rows, message = self.select_rows(params, progress, cancel_event, stats)
+        return aggregate_selection(params, source, rows, message, stats)
+    
+    def loaded_dataset(self, params):
+        """
+        Return the loaded dataset if it covers a query's folder and date
+        range (without listing the folder, so changed files go unnoticed),
+        otherwise None. Always None with the warehouse or in reference mode.
+        """
+        dataset = self.dataset
+        if (self.use_warehouse or self.reference_mode or dataset is None
+                or dataset.folder != os.path.abspath(params['folder'])
+                or params['start_date'] < dataset.start_date
+                or dataset.end_date < params['end_date']):
+            return None
+        return dataset
+    
+    def refilter(self, params, stats=None):
+        """
+        Answer a query from the loaded sales only, for filters that change
+        while they are typed: the folder is not listed and no file is read
+        (see loaded_dataset).
+        
+        Returns:
+            as run_query, or None if the loaded sales do not cover the query
+        """
+        dataset = self.loaded_dataset(params)
+        if dataset is None:
+            return None
+        if stats is None:
+            stats = RunStats()
+        self.last_stats = stats
+        
+        source, rows, message = filter_dataset(dataset, params, stats)
+        return aggregate_selection(params, source, rows, message, stats)
+    
+    def iter_sales(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Yield the sales a query's date range and filters match, one at a time
+        in date order, without building a list of them (for exports).
+        
+        Loaded sales that cover the query are streamed from memory. Otherwise
+        the folder is ingested like a query would (through the parse cache)
+        and the authority sales are streamed from the ingested files
+        (iter_authority_sales); with the warehouse enabled they are streamed
+        from it. In reference mode the folder is scanned and the authority
+        files re-read as they are reached (iter_authority_files), so the
+        sales of every file are never buffered. Grouping, sorting and Top N
+        do not apply.
+        
+        Args:
+            params, progress, cancel_event, stats: as for run_query
+        
+        Yields:
+            (day, buyer, item, quantity, earned) with day a date.toordinal()
+            day number
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        folder = params['folder']
+        start_date = params['start_date']
+        end_date = params['end_date']
+        buyer_filter = params['buyer_filter']
+        item_filter = params['item_filter']
+        item_exact = params['item_exact']
+        
+        if stats is None:
+            stats = RunStats()
+        
+        if self.use_warehouse:
+            yield from self.get_warehouse(folder).iter_sales(params, progress, cancel_event,
+                                                             self.workers, stats)
+            return
+        
+        cache = None if self.reference_mode else self.get_parse_cache(folder)
+        dataset = self.dataset
+        if cache is not None and dataset is not None:
+            with stats.phase('list'):
+                fingerprints = folder_fingerprints(folder)
+            if dataset.covers(folder, start_date, end_date, fingerprints):
+                sales = dataset.sales
+                with stats.phase('filter'):
+                    rows = apply_filters(dataset, buyer_filter, item_filter, item_exact,
+                                         start_date, end_date)
+                buyer_names, item_names = sales.buyer_names, sales.item_names
+                buyer_col, item_col = sales.buyer, sales.item
+                for row in rows:
+                    yield (sales.day[row], buyer_names[buyer_col[row]],
+                           item_names[item_col[row]], sales.quantity[row], sales.earned[row])
+                return
+        
+        if cache is None:
+            # Reference path: scan, select, then re-read authority files
+            if progress is not None:
+                progress("Scanning files", 0, 0)
+            with stats.phase('scan'):
+                counts, file_info = scan_files_for_authority(folder)
+            stats.count('files_seen', len(file_info))
+            stats.count('files_read', len(file_info))
+        else:
+            counts, file_info, partitions = ingest_files(
+                folder, cache, progress, cancel_event, start_date, end_date, self.workers, stats
+            )
+            with stats.phase('cache_save'):
+                cache.save()
+        with stats.phase('select'):
+            best_files = select_authority_files(counts)
+        
+        if cache is None:
+            sales = iter_authority_files(best_files, file_info, start_date, end_date)
+        else:
+            sales = iter_authority_sales(partitions, best_files, file_info, start_date, end_date)
+        
+        # Item names seen so far -> whether the item filter matches them
+        item_matches = {}
+        item_lower = item_filter.lower()
+        for sale in sales:
+            if buyer_filter and sale[1] != buyer_filter:
+                continue
+            if item_filter:
+                matches = item_matches.get(sale[2])
+                if matches is None:
+                    if item_exact:
+                        matches = sale[2] == item_filter
+                    else:
+                        matches = item_lower in sale[2].lower()
+                    item_matches[sale[2]] = matches
+                if not matches:
+                    continue
+            yield sale
+    
+    def select_rows(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Load the sales of a query's folder and date range (or reuse the
+        loaded ones) and select what its filters match: rows of the sales,
+        or entries of a DailyRollup when grouping by a date dimension.
+        
+        Args:
+            params: as for run_query (sort_by and top_n are not used)
+        
+        Returns:
+            (source, rows, message): the SalesTable or DailyRollup and the
+            matching rows of it, or (None, (), message) saying why nothing
+            matched
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        folder = params['folder']
+        start_date = params['start_date']
+        end_date = params['end_date']
+        
+        if stats is None:
+            stats = RunStats()
+        
+        if self.reference_mode:
+            # Reference path: always re-read everything
+            dataset = self.load_dataset(folder, None, start_date, end_date, stats=stats)
+        else:
+            dataset = self.current_dataset(folder, start_date, end_date, progress,
+                                           cancel_event, stats)
+        
+        if dataset is None:
+            if self.reference_mode:
+                return None, (), "No log files found in the folder."
+            return None, (), "No log files found in the folder for the specified date range."
+        
+        if progress is not None:
+            progress("Aggregating", 0, 0)
+        
+        return filter_dataset(dataset, params, stats)
+    
+    def current_dataset(self, folder, start_date, end_date, progress=None, cancel_event=None,
+                        stats=None):
+        """
+        Return the loaded sales if they cover a folder and date range and no
+        log file changed since; otherwise load them through the parse cache
+        (load_dataset) and keep them as self.dataset.
+        
+        Args:
+            progress, cancel_event, stats: as for run_query
+        
+        Returns:
+            LoadedDataset, or None if no log files were found
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        if stats is None:
+            stats = RunStats()
+        
+        cache = self.get_parse_cache(folder)
+        with stats.phase('list'):
+            fingerprints = folder_fingerprints(folder)
+        dataset = self.dataset
+        if dataset is None or not dataset.covers(folder, start_date, end_date, fingerprints):
+            if (dataset is not None and dataset.folder == os.path.abspath(folder)
+                    and dataset.fingerprints == fingerprints):
+                # Same files, wider range: load the union so going back
+                # to the old range needs no reload either
+                start_date = min(start_date, dataset.start_date)
+                end_date = max(end_date, dataset.end_date)
+            dataset = self.load_dataset(folder, cache, start_date, end_date,
+                                        progress, cancel_event, fingerprints, stats)
+            self.dataset = dataset
+        return dataset
+    
+    def prewarm(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Do the work of a query that does not depend on its filters before it
+        is asked: list the folder, refresh its parse cache, select authority
+        files and load the sales of the date range (current_dataset), so the
+        query itself only filters and aggregates. With the warehouse enabled
+        the warehouse is brought up to date instead. Reference mode keeps
+        nothing between queries, so there is nothing to prepare.
+        
+        Args:
+            params: as for run_query (only folder, start_date and end_date
+                are used)
+            progress, cancel_event, stats: as for run_query
+        
+        Returns:
+            Number of sales loaded (0 with the warehouse or in reference mode)
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        if stats is None:
+            stats = RunStats()
+        
+        if self.use_warehouse:
+            self.get_warehouse(params['folder']).update(progress, cancel_event, self.workers,
+                                                        stats)
+            return 0
+        if self.reference_mode:
+            return 0
+        
+        dataset = self.current_dataset(params['folder'], params['start_date'],
+                                       params['end_date'], progress, cancel_event, stats)
+        return 0 if dataset is None else len(dataset.sales)
+    
+    def load_dataset(self, folder, cache, start_date, end_date, progress=None,
+                     cancel_event=None, fingerprints=None, stats=None):
+        """
+        Run the authority file algorithm over a folder and wrap the sales
+        dated within [start_date, end_date] in a LoadedDataset.
+        
+        With no cache the reference scan/select/extract path is used.
+        Phase times and counters go to stats when one is given.
+        
+        Returns:
+            LoadedDataset, or None if no log files were found
+        """
+        # =====================================================
+        # NEW: Authority File Algorithm
+        # =====================================================
+        
+        if stats is None:
+            stats = RunStats()
+        
+        if cache is None:
+            # Reference path: scan, select, then re-read authority files
+            if progress is not None:
+                progress("Scanning files", 0, 0)
+            with stats.phase('scan'):
+                counts, file_info = scan_files_for_authority(folder)
+            stats.count('files_seen', len(file_info))
+            stats.count('files_read', len(file_info))
+            stats.count('lines_read', sum(sum(file_counts.values())
+                                          for file_counts in counts.values()))
+        else:
+            # Phase 1: Read each file once, counting lines per date and
+            # buffering candidate sales per (file, date)
+            failed = []
+            counts, file_info, partitions = ingest_files(
+                folder, cache, progress, cancel_event, start_date, end_date, self.workers, stats,
+                failed
+            )
+            with stats.phase('cache_save'):
+                cache.save()
+            if failed and fingerprints is not None:
+                # Leave files that could not be read out, so the dataset
+                # does not cover the folder and the next query reads them
+                fingerprints = {name: fingerprint for name, fingerprint in fingerprints.items()
+                                if name not in failed}
+        
+        if not counts:
+            return None
+        
+        # Phase 2: Select the authority file for each date
+        if progress is not None:
+            progress("Selecting authority files", 0, 0)
+        with stats.phase('select'):
+            best_files = select_authority_files(counts)
+        
+        # Lines in files that lost their date to another file
+        non_authority = 0
+        for line_date_str, file_counts in counts.items():
+            non_authority += sum(file_counts.values()) - file_counts[best_files[line_date_str]]
+        stats.count('lines_non_authority', non_authority)
+        
+        # Phase 3: Keep sales from authority files only
+        if progress is not None:
+            progress("Extracting sales", 0, 0)
+        with stats.phase('extract'):
+            if cache is None:
+                all_sales = SalesTable.from_dicts(extract_sales_with_authority(
+                    folder, best_files, file_info, start_date, end_date
+                ))
+            else:
+                all_sales = collect_authority_sales(
+                    partitions, best_files, file_info, start_date, end_date
+                )
+        stats.count('sales_loaded', len(all_sales))
+        
+        # =====================================================
+        # END: Authority File Algorithm
+        # =====================================================
+        
+        return LoadedDataset(folder, start_date, end_date, fingerprints, all_sales)
+
+
+# =============================================================================
+# Live Tail
+# =============================================================================
+
+def read_complete_lines(file_path, offset):
+    """
+    Read a log file from a byte offset up to the end of its last complete line.
+    
+    Returns:
+        (data, new_offset); a partly written last line is left for the next read
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    return data[:end], offset + end
+
+
+class LiveTail:
+    """
+    Follows the log files behind the engine's loaded dataset while the game
+    keeps writing to them.
+    
+    poll() compares the size and mtime of every log file with what was last
+    read (plain polling, so no OS-specific change notification is needed)
+    and reads only the bytes appended since then. Line counts per date are
+    updated in place and the authority file is re-selected only for the
+    dates that changed. Sales appended to a date's authority file are
+    appended to the dataset; when the authority for a date moves to another
+    file, the dataset's sales are rebuilt from the buffered partitions,
+    still without reading any other file.
+    """
+    
+    def __init__(self, engine):
+        """
+        Set up from the engine's current dataset. The buffered partitions of
+        its files are taken from the parse cache, so this reads no log file
+        that has not changed.
+        """
+        self.engine = engine
+        self.dataset = engine.dataset
+        self.folder = self.dataset.folder
+        
+        cache = self.cache = engine.get_parse_cache(self.folder)
+        failed = []
+        self.counts, self.file_info, self.partitions = ingest_files(
+            self.folder, cache, start_date=self.dataset.start_date,
+            end_date=self.dataset.end_date, workers=engine.workers, failed=failed
+        )
+        cache.save()
+        self.best_files = select_authority_files(self.counts)
+        
+        # file_counts[filepath][line_date_str] = line_count
+        self.file_counts = defaultdict(dict)
+        for line_date_str, file_counts in self.counts.items():
+            for file_path, line_count in file_counts.items():
+                self.file_counts[file_path][line_date_str] = line_count
+        
+        # (size, mtime_ns) of every log file as last read, and for files read
+        # here, the offset just past their last complete line
+        self.seen = folder_fingerprints(self.folder)
+        for file_path in self.file_info:
+            entry = cache.entries.get(os.path.basename(file_path))
+            if entry is not None:
+                self.seen[os.path.basename(file_path)] = (entry[0], entry[1])
+        # Files that could not be read count as changed, so poll() retries them
+        for name in failed:
+            self.seen.pop(name, None)
+        self.offsets = {}
+        
+        if self.seen != self.dataset.fingerprints:
+            # Files changed between the run and now
+            self.rebuild()
+    
+    def is_current(self):
+        """False once the engine has loaded another dataset"""
+        return self.engine.dataset is self.dataset
+    
+    def rebuild(self):
+        """Replace the dataset with one rebuilt from the buffered partitions"""
+        old = self.dataset
+        sales = collect_authority_sales(self.partitions, self.best_files, self.file_info,
+                                        old.start_date, old.end_date)
+        self.dataset = LoadedDataset(self.folder, old.start_date, old.end_date,
+                                     dict(self.seen), sales)
+        self.engine.dataset = self.dataset
+    
+    def poll(self):
+        """
+        Read whatever was appended to the log files since the last poll.
+        
+        Returns:
+            None if no log file changed, otherwise (new_rows, rebuilt): the
+            range of rows appended to the dataset, and whether its sales
+            were rebuilt instead (new_rows is then empty)
+        """
+        fingerprints = folder_fingerprints(self.folder)
+        changed = [name for name, fingerprint in fingerprints.items()
+                   if self.seen.get(name) != fingerprint]
+        removed = [name for name in self.seen if name not in fingerprints]
+        if not changed and not removed:
+            return None
+        
+        dataset = self.dataset
+        cache = self.cache
+        touched = set()
+        reread = set()
+        appended = {}
+        
+        for name in removed:
+            del self.seen[name]
+            file_path = os.path.join(self.folder, name)
+            if file_path in self.file_info:
+                touched.update(self.replace_file_counts(file_path, {}))
+                reread.add(file_path)
+                del self.file_info[file_path]
+                self.partitions.pop(file_path, None)
+                self.offsets.pop(file_path, None)
+        
+        for name in changed:
+            file_path = os.path.join(self.folder, name)
+            if (file_path not in self.file_info
+                    and not file_may_overlap(name, dataset.start_date, dataset.end_date)):
+                self.seen[name] = fingerprints[name]
+                continue
+            
+            try:
+                stat = os.stat(file_path)
+                offset = self.offsets.get(file_path)
+                if archive_suffix(name):
+                    # Archives are never appended to: take them from the
+                    # cache (archive_logs moves entries over) or parse whole
+                    parsed = cache.get(name, stat) or parse_log_file(file_path)
+                    if parsed is None:
+                        # Unreadable for now; retried next poll
+                        continue
+                    new_offset = stat.st_size
+                    tail = False
+                elif offset is None or offset > stat.st_size:
+                    # New, rewritten or never read here: read it from the start
+                    data, new_offset = read_complete_lines(file_path, 0)
+                    parsed = parse_log_bytes(data)
+                    tail = False
+                else:
+                    data, new_offset = read_complete_lines(file_path, offset)
+                    parsed = parse_log_bytes(data)
+                    tail = True
+            except OSError:
+                continue
+            
+            counts, sales = parsed
+            self.offsets[file_path] = new_offset
+            self.file_info[file_path] = parse_filename_info(name)
+            
+            old_counts = self.file_counts.get(file_path, {})
+            old_sales = self.partitions.get(file_path, {})
+            if tail:
+                new_counts = dict(old_counts)
+                for line_date_str, line_count in counts.items():
+                    new_counts[line_date_str] = new_counts.get(line_date_str, 0) + line_count
+                new_sales = dict(old_sales)
+                for line_date_str, date_sales in sales.items():
+                    new_sales[line_date_str] = old_sales.get(line_date_str, []) + date_sales
+                    appended[(line_date_str, file_path)] = date_sales
+            else:
+                new_counts = counts
+                new_sales = sales
+                reread.add(file_path)
+                # Its sales may have changed even where its counts did not
+                touched.update(old_counts)
+                touched.update(new_counts)
+            
+            touched.update(self.replace_file_counts(file_path, new_counts))
+            self.partitions[file_path] = new_sales
+            
+            if new_offset == stat.st_size:
+                self.seen[name] = (stat.st_size, stat.st_mtime_ns)
+                cache.put(name, stat, new_counts, new_sales)
+            else:
+                # A line is still being written; look again next poll
+                self.seen[name] = (new_offset, None)
+        
+        # Re-select the authority file of the dates that changed only
+        rebuild = False
+        new_sales = []
+        for line_date_str in touched:
+            file_counts = self.counts.get(line_date_str)
+            old_best = self.best_files.pop(line_date_str, None)
+            if not file_counts:
+                rebuild = True
+                continue
+            
+            # Ties go to the file listed first, as in select_authority_files
+            best = min(file_counts.keys(),
+                       key=lambda fp: (-file_counts[fp], log_file_stem(fp)))
+            self.best_files[line_date_str] = best
+            if best != old_best and old_best is not None:
+                rebuild = True
+            elif best in reread and old_best is not None:
+                rebuild = True
+            elif old_best is None:
+                date_sales = self.partitions[best].get(line_date_str)
+                if date_sales:
+                    new_sales.append((line_date_str, best, date_sales))
+            elif (line_date_str, best) in appended:
+                new_sales.append((line_date_str, best, appended[(line_date_str, best)]))
+        
+        if not rebuild:
+            dated = []
+            for line_date_str, file_path, date_sales in new_sales:
+                full_date = calculate_full_date(line_date_str, *self.file_info[file_path])
+                if full_date is None or not dataset.start_date <= full_date <= dataset.end_date:
+                    continue
+                dated.append((full_date.toordinal(), date_sales))
+            dated.sort(key=lambda x: x[0])
+            
+            sales_data = dataset.sales
+            if dated and len(sales_data) and dated[0][0] < sales_data.day[-1]:
+                # Sales for an earlier day than the latest loaded one
+                rebuild = True
+        
+        if rebuild:
+            self.rebuild()
+            return range(0), True
+        
+        first = len(dataset.sales)
+        for day, date_sales in dated:
+            dataset.extend(date_sales, day)
+        dataset.fingerprints = dict(self.seen)
+        return range(first, len(dataset.sales)), False
+    
+    def replace_file_counts(self, file_path, new_counts):
+        """
+        Set a file's line counts per date, updating the per-date counts in
+        place.
+        
+        Returns:
+            the dates whose counts changed
+        """
+        old_counts = self.file_counts.get(file_path, {})
+        touched = []
+        for line_date_str in set(old_counts) | set(new_counts):
+            line_count = new_counts.get(line_date_str, 0)
+            if line_count == old_counts.get(line_date_str, 0):
+                continue
+            touched.append(line_date_str)
+            date_counts = self.counts[line_date_str]
+            if line_count:
+                date_counts[file_path] = line_count
+            else:
+                date_counts.pop(file_path, None)
+                if not date_counts:
+                    del self.counts[line_date_str]
+        self.file_counts[file_path] = dict(new_counts)
+        return touched
+    
+    def stop(self):
+        """Write the parse cache entries of files read while following"""
+        self.cache.save()
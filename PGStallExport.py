@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Sales Export - streaming CSV and JSON Lines export of sales and results
+
+Writes the sales a query matches (one row per sale, as SalesEngine.iter_sales
+or SalesFederation.iter_sales yield them) or the grouped results of a query
+to a CSV or JSON Lines file. Records flow through generators and are written
+EXPORT_CHUNK_ROWS at a time, so memory use does not grow with the number of
+rows exported and no list of them is ever built.
+
+Files are written under a temporary name and renamed when complete, so a
+failed or cancelled export leaves no partial file behind.
+"""
+
+import csv
+import json
+import os
+from itertools import islice
+
+from PGStallEngine import AnalysisCancelled, DayKeyCache
+from PGStallFederation import SalesFederation
+
+
+# Formats export_sales and export_results can write, by file extension
+EXPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl'}
+
+# Records written per chunk (and between checks of the cancel event)
+EXPORT_CHUNK_ROWS = 1000
+
+# Headings of exported sales; federated sales also carry the Character
+SALE_HEADINGS = ('SaleDate', 'Buyer', 'Item', 'Quantity', 'Earned')
+CHARACTER_SALE_HEADINGS = ('SaleDate', 'Character', 'Buyer', 'Item', 'Quantity', 'Earned')
+
+
+def export_format(path):
+    """Return the export format a file name asks for by its extension (CSV by default)"""
+    return EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def sale_headings(engine):
+    """Return the headings of the sales an engine (or SalesFederation) exports"""
+    return CHARACTER_SALE_HEADINGS if isinstance(engine, SalesFederation) else SALE_HEADINGS
+
+
+def sale_records(sales):
+    """Turn (day, ...) sale tuples into records with the day as a YYYY-MM-DD date"""
+    # Day group keys are ISO dates, formatted once per day
+    day_keys = DayKeyCache("Day")
+    for sale in sales:
+        yield (day_keys[sale[0]],) + tuple(sale[1:])
+
+
+def result_records(results, columns):
+    """Yield each result as a tuple of values in column order (None for empty pivot cells)"""
+    keys = [key for key, _ in columns]
+    for r in results:
+        yield tuple(r.get(key) for key in keys)
+
+
+def write_records(out, headings, records, file_format, cancel_event=None):
+    """
+    Write records to an open text file, EXPORT_CHUNK_ROWS at a time.
+    
+    Args:
+        out: Text file opened with newline=''
+        headings: Column headings (the CSV header row, the JSON Lines keys)
+        records: Iterable of value tuples in heading order
+        file_format: 'csv' or 'jsonl'
+        cancel_event: Optional threading.Event checked between chunks
+    
+    Returns:
+        Number of records written
+    
+    Raises:
+        AnalysisCancelled: if cancel_event is set before all records are written
+    """
+    headings = [str(heading) for heading in headings]
+    if file_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(headings)
+    
+    records = iter(records)
+    written = 0
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise AnalysisCancelled()
+        chunk = list(islice(records, EXPORT_CHUNK_ROWS))
+        if not chunk:
+            return written
+        if file_format == 'csv':
+            writer.writerows(["" if value is None else value for value in record]
+                             for record in chunk)
+        else:
+            out.write("".join(json.dumps(dict(zip(headings, record))) + "\n"
+                              for record in chunk))
+        written += len(chunk)
+
+
+def write_file(path, headings, records, file_format=None, cancel_event=None):
+    """
+    Write records to a file (write_records), replacing it only once every
+    record is written.
+    
+    Args:
+        file_format: 'csv' or 'jsonl'; by default chosen by export_format
+    
+    Returns:
+        Number of records written
+    """
+    if file_format is None:
+        file_format = export_format(path)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+            written = write_records(out, headings, records, file_format, cancel_event)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def export_sales(engine, params, path, file_format=None, progress=None, cancel_event=None,
+                 stats=None):
+    """
+    Stream the sales a query matches to a file, one row per sale in date
+    order.
+    
+    Args:
+        engine: SalesEngine, or SalesFederation (rows then name the Character)
+        params: as for engine.run_query
+        path, file_format: as for write_file
+        progress, cancel_event, stats: as for engine.iter_sales
+    
+    Returns:
+        Number of sales written
+    """
+    sales = engine.iter_sales(params, progress, cancel_event, stats)
+    return write_file(path, sale_headings(engine), sale_records(sales), file_format,
+                      cancel_event)
+
+
+def export_results(results, columns, path, file_format=None):
+    """
+    Write the results of a query (as shown, flat or pivoted) to a file.
+    
+    Args:
+        results, columns: as returned by run_query
+        path, file_format: as for write_file
+    
+    Returns:
+        Number of result rows written
+    """
+    headings = [heading for _, heading in columns]
+    return write_file(path, headings, result_records(results, columns), file_format)
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Character Federation - sales queries across several characters' Books folders
+
+Each character plays with its own Books folder, and the "Authority File"
+deduplication only holds within one character's logs. A SalesFederation
+keeps one SalesEngine per registered character, so every folder has its own
+parse cache, authority selection and loaded sales, and answers a query by:
+
+- selecting the matching rows of every character's sales in parallel
+  threads (SalesEngine.select_rows; folders whose files have not changed
+  are not read again, so registering a character only ingests its folder),
+- grouping each character's rows, with the Character dimension fixed to
+  the character's name,
+- merging the groups of all characters and shaping them like
+  SalesEngine.run_query.
+
+iter_sales streams the matching sales of all characters in date order for
+exports, after ingesting their folders in parallel threads the same way.
+
+Registered characters are kept in characters.json in the cache folder.
+"""
+
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, repeat
+from operator import itemgetter
+
+from PGStallEngine import (DailyRollup, GroupAccumulator, ResultSet, RunStats, SalesEngine,
+                           FLAT_COLUMNS, accumulate_entries, accumulate_sales,
+                           default_cache_dir, folder_fingerprints, group_keys, group_results,
+                           shape_results)
+
+
+# Group By / Then By dimension naming the character a sale was made by
+CHARACTER_DIMENSION = "Character"
+
+
+def characters_path():
+    """Return the path of the file registered characters are saved in"""
+    return os.path.join(default_cache_dir(), "characters.json")
+
+
+def load_characters(path=None):
+    """
+    Load the registered characters.
+    
+    Returns:
+        [(name, folder), ...] in registration order; empty if the file is
+        missing or unreadable
+    """
+    try:
+        with open(path or characters_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [(str(entry['name']), str(entry['folder'])) for entry in data['characters']]
+    except Exception:
+        return []
+
+
+def save_characters(characters, path=None):
+    """Save [(name, folder), ...] as the registered characters"""
+    path = path or characters_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'characters': [{'name': name, 'folder': folder}
+                                  for name, folder in characters]}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def dimension_keys(source, rows, dimension, character):
+    """group_keys, extended with the Character dimension (the same for every row)"""
+    if dimension == CHARACTER_DIMENSION:
+        return repeat(character, len(rows))
+    return group_keys(source, rows, dimension)
+
+
+def character_keys(source, rows, character, group_by, then_by=None):
+    """Return an iterator over the grouping key of each of a character's rows"""
+    keys = dimension_keys(source, rows, group_by, character)
+    if then_by:
+        keys = zip(keys, dimension_keys(source, rows, then_by, character))
+    return keys
+
+
+def merge_character_groups(selections, group_by, then_by=None):
+    """
+    Group every character's selected rows and merge the groups.
+    
+    A group's LastPrice is that of the character whose last sale in the
+    group is the latest (the last registered one on the same day), so
+    groups are merged in order of the day of their last sale.
+    
+    Args:
+        selections: [(character, source, rows), ...] as returned by
+            SalesEngine.select_rows, in registration order
+    
+    Returns:
+        Results as for group_and_aggregate
+    """
+    ordered = []
+    for index, (character, source, rows) in enumerate(selections):
+        keys = character_keys(source, rows, character, group_by, then_by)
+        if isinstance(source, DailyRollup):
+            groups = accumulate_entries(source, rows, keys)
+        else:
+            groups = accumulate_sales(source, rows, keys)
+        # Rows are in date order, so the last day seen for a key is its latest
+        last_days = dict(zip(character_keys(source, rows, character, group_by, then_by),
+                             map(source.day.__getitem__, rows)))
+        ordered.extend((last_days[key], index, key, accumulator)
+                       for key, accumulator in groups.items())
+    ordered.sort(key=itemgetter(0, 1))
+    
+    merged = {}
+    for _, _, key, accumulator in ordered:
+        total = merged.get(key)
+        if total is None:
+            total = merged[key] = GroupAccumulator()
+        total.merge(accumulator.count, accumulator.quantity, accumulator.earned,
+                    accumulator.min_price, accumulator.max_price, accumulator.last_price)
+    return group_results(merged, then_by)
+
+
+class SalesFederation:
+    """
+    Answers sales queries across the Books folders of several characters.
+    
+    Keeps a SalesEngine per character (registration order is kept), so the
+    parse cache and loaded sales of every folder survive between queries
+    and registering or removing a character leaves the others untouched.
+    Queries are always answered from memory, never from the warehouse.
+    """
+    
+    def __init__(self, characters=(), reference_mode=False, workers=0, cache_dir=None):
+        self.reference_mode = reference_mode
+        self.workers = workers
+        self.cache_dir = cache_dir
+        
+        # name -> (folder, SalesEngine)
+        self.engines = {}
+        
+        # name -> folder_fingerprints of the character's folder as of its
+        # last query (kept even when nothing was loaded, so is_current
+        # also holds for empty folders, empty date ranges and reference
+        # mode, where engines keep no sales)
+        self.fingerprints = {}
+        for name, folder in characters:
+            self.add_character(name, folder)
+        
+        # RunStats of the last query
+        self.last_stats = None
+    
+    def characters(self):
+        """Return [(name, folder), ...] in registration order"""
+        return [(name, folder) for name, (folder, _) in self.engines.items()]
+    
+    def add_character(self, name, folder):
+        """
+        Register a character, or point an existing one at another folder.
+        
+        Raises:
+            ValueError: if another character is registered with the same
+                folder (its sales would be counted twice, and both engines
+                would write the folder's parse cache at once)
+        """
+        current = self.engines.get(name)
+        if current is not None and current[0] == folder:
+            return
+        key = os.path.normcase(os.path.abspath(folder))
+        for other, (other_folder, _) in self.engines.items():
+            if other != name and os.path.normcase(os.path.abspath(other_folder)) == key:
+                raise ValueError(f"{folder} is already registered for {other}")
+        self.fingerprints.pop(name, None)
+        self.engines[name] = (folder, SalesEngine(reference_mode=self.reference_mode,
+                                                  cache_dir=self.cache_dir))
+        self.share_workers()
+    
+    def remove_character(self, name):
+        """Forget a character and the sales loaded for it"""
+        self.engines.pop(name, None)
+        self.fingerprints.pop(name, None)
+        self.share_workers()
+    
+    def share_workers(self):
+        """
+        Split the parse processes (workers; 0 = one per CPU) between the
+        characters' engines, which ingest their folders at the same time,
+        so that together they never start more processes than that.
+        """
+        workers = self.workers or os.cpu_count() or 1
+        share = max(1, workers // max(len(self.engines), 1))
+        for _, engine in self.engines.values():
+            engine.workers = share
+    
+    def rebuild_cache(self):
+        """Discard every character's parse cache and loaded sales"""
+        for folder, engine in self.engines.values():
+            engine.rebuild_cache(folder)
+        self.fingerprints.clear()
+    
+    def is_current(self):
+        """Tell whether no character's folder changed since the character was last queried"""
+        for name, (folder, _) in self.engines.items():
+            fingerprints = self.fingerprints.get(name)
+            if fingerprints is None or folder_fingerprints(folder) != fingerprints:
+                return False
+        return True
+    
+    def run_query(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Run one query over every registered character.
+        
+        Args:
+            params: as for SalesEngine.run_query, without folder; group_by
+                and then_by may also be CHARACTER_DIMENSION
+            progress: Optional callback(phase, done, total); phases are
+                prefixed with the character's name
+            cancel_event: Optional threading.Event checked between files
+            stats: Optional RunStats; gets the 'characters' phase (wall time
+                of the parallel selection), the counters of all characters
+                and the 'aggregate' and 'sort' phases
+        
+        Returns:
+            (summary_text, results, columns, sort_by, sort_descending), as
+            SalesEngine.run_query
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        group_by = params['group_by']
+        then_by = params.get('then_by')
+        sort_by = params['sort_by']
+        sort_descending = sort_by != "Group"
+        
+        if stats is None:
+            stats = RunStats()
+        self.last_stats = stats
+        
+        if not self.engines:
+            return ("No characters registered.", ResultSet(), FLAT_COLUMNS,
+                    sort_by, sort_descending)
+        
+        # Rows are selected per character by the other dimensions; without
+        # one, per-day totals are enough
+        dimensions = [dimension for dimension in (group_by, then_by)
+                      if dimension and dimension != CHARACTER_DIMENSION]
+        select_params = dict(params, group_by=dimensions[0] if dimensions else "Day",
+                             then_by=dimensions[1] if len(dimensions) > 1 else None)
+        
+        characters = list(self.engines.items())
+        with stats.phase('characters'):
+            with ThreadPoolExecutor(max_workers=len(characters)) as pool:
+                futures = [pool.submit(self.select_character, name, folder, engine,
+                                       select_params, progress, cancel_event)
+                           for name, (folder, engine) in characters]
+                outcomes = [future.result() for future in futures]
+        
+        selections = []
+        messages = set()
+        for (name, _), (source, rows, message, fingerprints, character_stats) in zip(characters,
+                                                                                     outcomes):
+            self.fingerprints[name] = fingerprints
+            for counter, amount in character_stats.counters.items():
+                stats.count(counter, amount)
+            if message is None:
+                selections.append((name, source, rows))
+            else:
+                messages.add(message)
+        
+        if not selections:
+            message = "No sales found for the applied filters."
+            if len(messages) == 1:
+                message = messages.pop()
+            return message, ResultSet(), FLAT_COLUMNS, sort_by, sort_descending
+        
+        with stats.phase('aggregate'):
+            results = merge_character_groups(selections, group_by, then_by)
+        
+        return shape_results(results, group_by, then_by, sort_by, params['top_n'], stats)
+    
+    def iter_sales(self, params, progress=None, cancel_event=None, stats=None):
+        """
+        Yield the sales of every registered character that a query's date
+        range and filters match, in date order, merging the characters'
+        SalesEngine.iter_sales streams (heapq.merge) instead of collecting
+        them. The characters' folders are ingested in parallel threads, as
+        run_query does, before the first sale is yielded.
+        
+        Args:
+            params, progress, cancel_event: as for run_query
+            stats: Optional RunStats; gets the 'characters' phase (wall time
+                of the parallel ingestion) and the counters of all characters
+        
+        Yields:
+            (day, character, buyer, item, quantity, earned)
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set during ingestion
+        """
+        if stats is None:
+            stats = RunStats()
+        if not self.engines:
+            return
+        
+        characters = list(self.engines.items())
+        with stats.phase('characters'):
+            with ThreadPoolExecutor(max_workers=len(characters)) as pool:
+                futures = [pool.submit(self.start_character_sales, name, folder, engine,
+                                       params, progress, cancel_event)
+                           for name, (folder, engine) in characters]
+                started = [future.result() for future in futures]
+        
+        streams = []
+        for sales, character_stats in started:
+            for counter, amount in character_stats.counters.items():
+                stats.count(counter, amount)
+            streams.append(sales)
+        
+        # Characters in registration order, so sales of one day keep it
+        yield from heapq.merge(*streams, key=itemgetter(0))
+    
+    def start_character_sales(self, name, folder, engine, params, progress, cancel_event):
+        """
+        Worker thread body: start SalesEngine.iter_sales for one character
+        and run it up to its first sale, which ingests the folder.
+        
+        Returns:
+            (sales, character_stats): an iterator over the character's
+            (day, character, buyer, item, quantity, earned) sales
+        """
+        def character_progress(phase, done, total):
+            progress(f"{name}: {phase}", done, total)
+        
+        character_stats = RunStats()
+        sales = engine.iter_sales(dict(params, folder=folder),
+                                  character_progress if progress is not None else None,
+                                  cancel_event, character_stats)
+        first = next(sales, None)
+        if first is None:
+            return iter(()), character_stats
+        return ((day, name, *sale) for day, *sale in chain((first,), sales)), character_stats
+    
+    def select_character(self, name, folder, engine, params, progress, cancel_event):
+        """
+        Worker thread body: SalesEngine.select_rows for one character.
+        
+        Returns:
+            (source, rows, message, fingerprints, character_stats) with the
+            folder's fingerprints as the selection saw them
+        """
+        def character_progress(phase, done, total):
+            progress(f"{name}: {phase}", done, total)
+        
+        character_stats = RunStats()
+        if engine.reference_mode:
+            # Reference mode keeps no dataset to take the fingerprints from;
+            # list the folder before it is read, so changes made while it is
+            # are noticed
+            fingerprints = folder_fingerprints(folder)
+        source, rows, message = engine.select_rows(
+            dict(params, folder=folder), character_progress if progress is not None else None,
+            cancel_event, character_stats
+        )
+        if not engine.reference_mode:
+            dataset = engine.dataset
+            if dataset is not None:
+                fingerprints = dataset.fingerprints
+            else:
+                # No log files in the folder or the date range
+                fingerprints = folder_fingerprints(folder)
+        return source, rows, message, fingerprints, character_stats
@@ -3,32 +3,113 @@
 Sales Summary GUI - Python/Tkinter Version
 Analyzes Project Gorgon Player Shop Log files
 
-Uses "Authority File" algorithm to prevent duplicate counting:
-- For each unique line date, only process lines from the file that has
-  the most entries for that date (the authority file).
+Parsing, the "Authority File" deduplication and aggregation live in the
+headless PGStallEngine module; this file only builds and drives the window.
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
+import argparse
 import os
-import re
+import queue
+import threading
+import time
 from datetime import datetime
-from pathlib import Path
-from collections import defaultdict
+
+from PGStallEngine import (AnalysisCancelled, FLAT_COLUMNS, LiveTail, ResultSet, RunStats,
+                           SalesEngine, default_books_folder, default_cache_dir,
+                           enable_stats_log, format_seconds, group_and_aggregate, match_rows,
+                           merge_results, use_vector_backend)
+from PGStallExport import export_results, export_sales
+from PGStallFederation import (CHARACTER_DIMENSION, SalesFederation, load_characters,
+                               save_characters)
 
 
 class SalesViewerGUI:
-    def __init__(self, root):
+    # How often the Tk thread polls the analysis worker for progress (more
+    # often while a filter is re-applied from the loaded sales, which takes
+    # milliseconds)
+    POLL_INTERVAL_MS = 100
+    REFILTER_POLL_MS = 10
+    
+    # Rows inserted into the results view at a time, and how far down (as a
+    # fraction of the materialized rows) the view may scroll before the next
+    # chunk is inserted
+    VIEW_CHUNK = 200
+    VIEW_PREFETCH = 0.9
+    
+    # How often live mode checks the log files for new lines
+    LIVE_POLL_MS = 2000
+    
+    # Delay after the last key typed in a filter before the results follow it
+    FILTER_DEBOUNCE_MS = 250
+    
+    # Delay after the window is first shown before the start-up pre-warm
+    # starts, so it does not compete with the first redraws
+    PREWARM_DELAY_MS = 200
+    
+    def __init__(self, root, reference_mode=False, workers=0, profile_path=None, warehouse=False,
+                 started=None):
         self.root = root
         self.root.title("Sales Viewer")
-        self.root.geometry("480x570")
+        self.root.geometry("720x600")
         
         # Center window on screen
         self.center_window()
         
+        # Headless engine doing the parsing and aggregation; it keeps the
+        # parse cache and the loaded sales between runs
+        self.engine = SalesEngine(reference_mode=reference_mode, workers=workers,
+                                  warehouse=warehouse)
+        
+        # One engine per registered character, used when All Characters is
+        # ticked
+        self.federation = SalesFederation(reference_mode=reference_mode, workers=workers)
+        for name, folder in load_characters():
+            try:
+                self.federation.add_character(name, folder)
+            except ValueError:
+                # A folder saved twice; the first character keeps it
+                pass
+        
+        # Background analysis state (worker thread, its message queue and
+        # the event used to cancel it)
+        self.worker = None
+        self.worker_queue = None
+        self.cancel_event = None
+        self.poll_interval = self.POLL_INTERVAL_MS
+        
+        # When set, the next run is profiled with cProfile and the report
+        # written to this file
+        self.profile_path = profile_path
+        
+        # Live mode: parameters of the last run, the LiveTail following its
+        # folder, the pending poll_live callback and whether the worker is
+        # polling the LiveTail
+        self.last_params = None
+        self.summary_text = ""
+        self.live_tail = None
+        self.live_job = None
+        self.live_polling = False
+        
+        # Pending apply_filter_change callback while a filter is being typed
+        self.filter_job = None
+        
+        # Start-up: when the program started (time.perf_counter()), seconds
+        # until the window was first shown, whether the worker is the
+        # pre-warm (and its folder) and a Run clicked while it works
+        self.started = time.perf_counter() if started is None else started
+        self.first_paint = None
+        self.prewarming = False
+        self.prewarm_folder = None
+        self.pending_params = None
+        
         # Create GUI elements
         self.create_widgets()
         
+        # Idle callbacks run once the window is laid out and drawn
+        self.root.after_idle(self.on_first_paint)
+        
     def center_window(self):
         """Center the window on screen"""
         self.root.update_idletasks()
@@ -49,15 +130,21 @@ class SalesViewerGUI:
         
         self.txt_folder = tk.Entry(folder_frame, width=35)
         # Set default folder path
-        default_path = os.path.join(
-            os.path.expanduser("~"),
-            "AppData", "LocalLow", "Elder Game", "Project Gorgon", "Books"
-        )
-        self.txt_folder.insert(0, default_path)
+        self.txt_folder.insert(0, default_books_folder())
         self.txt_folder.pack(side='left', padx=(0, 10))
         
         btn_browse = tk.Button(folder_frame, text="Browse...", command=self.browse_folder)
-        btn_browse.pack(side='left')
+        btn_browse.pack(side='left', padx=(0, 5))
+        
+        # Query the folders of all registered characters instead
+        btn_characters = tk.Button(folder_frame, text="Characters...",
+                                   command=self.edit_characters)
+        btn_characters.pack(side='left', padx=(0, 5))
+        
+        self.chk_characters_var = tk.BooleanVar()
+        self.chk_characters = tk.Checkbutton(folder_frame, text="All Characters",
+                                             variable=self.chk_characters_var)
+        self.chk_characters.pack(side='left')
         
         # --- Group By ---
         group_frame = tk.Frame(self.root)
@@ -66,9 +153,19 @@ class SalesViewerGUI:
         tk.Label(group_frame, text="Group By:").pack(side='left', padx=(0, 10))
         
         self.cmb_group = ttk.Combobox(group_frame, width=20, state='readonly')
-        self.cmb_group['values'] = ("Buyer", "Item", "Year", "Month", "Week", "Day")
+        self.cmb_group['values'] = ("Buyer", "Item", "Year", "Month", "Week", "Day",
+                                    CHARACTER_DIMENSION)
         self.cmb_group.current(1)  # Default to Item
-        self.cmb_group.pack(side='left')
+        self.cmb_group.pack(side='left', padx=(0, 10))
+        
+        tk.Label(group_frame, text="Then By:").pack(side='left', padx=(0, 10))
+        
+        # A second dimension turns the output into a pivot table
+        self.cmb_then = ttk.Combobox(group_frame, width=10, state='readonly')
+        self.cmb_then['values'] = ("None", "Buyer", "Item", "Year", "Month", "Week", "Day",
+                                   CHARACTER_DIMENSION)
+        self.cmb_then.current(0)
+        self.cmb_then.pack(side='left')
         
         # --- Buyer Filter ---
         buyer_frame = tk.Frame(self.root)
@@ -78,6 +175,7 @@ class SalesViewerGUI:
         
         self.txt_buyer = tk.Entry(buyer_frame, width=20)
         self.txt_buyer.pack(side='left')
+        self.txt_buyer.bind('<KeyRelease>', self.on_filter_changed)
         
         # --- Item Filter ---
         item_frame = tk.Frame(self.root)
@@ -87,9 +185,11 @@ class SalesViewerGUI:
         
         self.txt_item = tk.Entry(item_frame, width=20)
         self.txt_item.pack(side='left', padx=(0, 10))
+        self.txt_item.bind('<KeyRelease>', self.on_filter_changed)
         
         self.chk_exact_var = tk.BooleanVar()
-        self.chk_exact = tk.Checkbutton(item_frame, text="Exact", variable=self.chk_exact_var)
+        self.chk_exact = tk.Checkbutton(item_frame, text="Exact", variable=self.chk_exact_var,
+                                        command=self.on_filter_changed)
         self.chk_exact.pack(side='left')
         
         # --- Date Filters ---
@@ -134,15 +234,44 @@ class SalesViewerGUI:
         self.cmb_sort.current(2)  # Default to TotalEarned
         self.cmb_sort.pack(side='left')
         
-        # --- Run Button ---
-        btn_run = tk.Button(self.root, text="Run", command=self.run_analysis, 
-                           width=10, height=1)
-        btn_run.pack(pady=8)
+        # --- Run / Rebuild Cache Buttons ---
+        button_frame = tk.Frame(self.root)
+        button_frame.pack(pady=8)
+        
+        self.btn_run = tk.Button(button_frame, text="Run", command=self.run_analysis, 
+                                width=10, height=1)
+        self.btn_run.pack(side='left', padx=5)
+        
+        self.btn_cancel = tk.Button(button_frame, text="Cancel", command=self.cancel_analysis,
+                                   width=10, height=1, state='disabled')
+        self.btn_cancel.pack(side='left', padx=5)
+        
+        self.btn_rebuild = tk.Button(button_frame, text="Rebuild Cache", command=self.rebuild_cache,
+                                    height=1)
+        self.btn_rebuild.pack(side='left', padx=5)
+        
+        self.btn_export = tk.Button(button_frame, text="Export...", command=self.export_data,
+                                    height=1)
+        self.btn_export.pack(side='left', padx=5)
+        
+        self.chk_live_var = tk.BooleanVar()
+        self.chk_live = tk.Checkbutton(button_frame, text="Live", variable=self.chk_live_var,
+                                       command=self.toggle_live)
+        self.chk_live.pack(side='left', padx=5)
+        
+        # --- Progress ---
+        self.progress_bar = ttk.Progressbar(self.root, mode='determinate')
+        self.progress_bar.pack(pady=(0, 3), padx=15, fill='x')
         
         # --- Summary Label ---
         self.lbl_summary = tk.Label(self.root, text="", anchor='w', justify='left')
         self.lbl_summary.pack(pady=(3, 1), padx=15, fill='x')
         
+        # --- Stats Label (phase times and counters of the last run) ---
+        self.lbl_stats = tk.Label(self.root, text="", anchor='w', justify='left',
+                                  fg='gray40', font=('TkDefaultFont', 8), wraplength=690)
+        self.lbl_stats.pack(pady=(0, 1), padx=15, fill='x')
+        
         # --- Total Earned Label (pack FIRST with side='bottom' so it stays at bottom) ---
         self.lbl_total = tk.Label(self.root, text="Total Earned: 0", 
                                  font=('TkDefaultFont', 10, 'bold'), anchor='e')
@@ -152,34 +281,34 @@ class SalesViewerGUI:
         output_frame = tk.Frame(self.root)
         output_frame.pack(pady=(3, 0), padx=(15, 5), fill='both', expand=True)
         
-        # Create Treeview with columns
-        self.tree = ttk.Treeview(output_frame, columns=('Group', 'TotalSold', 'TotalEarned', 'AvgPrice'), 
-                                 show='headings')
+        # Create Treeview; columns are set per result by configure_columns
+        self.tree = ttk.Treeview(output_frame, show='headings')
+        self.result_columns = []
+        self.configure_columns(FLAT_COLUMNS)
         
-        # Define column headings and make them clickable for sorting
-        self.tree.heading('Group', text='Group', command=lambda: self.sort_treeview('Group', False))
-        self.tree.heading('TotalSold', text='TotalSold', command=lambda: self.sort_treeview('TotalSold', True))
-        self.tree.heading('TotalEarned', text='TotalEarned', command=lambda: self.sort_treeview('TotalEarned', True))
-        self.tree.heading('AvgPrice', text='AvgPrice', command=lambda: self.sort_treeview('AvgPrice', True))
-        
-        # Configure column widths and alignment
-        self.tree.column('Group', width=90, anchor='w')
-        self.tree.column('TotalSold', width=100, anchor='e')
-        self.tree.column('TotalEarned', width=120, anchor='e')
-        self.tree.column('AvgPrice', width=100, anchor='e')
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(output_frame, orient='vertical', command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Add scrollbar; scrolling near the end materializes more rows
+        self.scrollbar = ttk.Scrollbar(output_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
         
         self.tree.pack(side='left', fill='both', expand=True)
-        scrollbar.pack(side='right', fill='y')
+        self.scrollbar.pack(side='right', fill='y')
         
-        # Store current results for sorting
-        self.current_results = []
+        # Store current results for sorting; the ResultSet caches the
+        # ascending row order of each column
+        self.current_results = ResultSet()
         self.sort_column = None
         self.sort_reverse = False
         
+        # Windowed view state: only the first rows_shown rows of the current
+        # display order exist in the Treeview
+        self.view_order = range(0)
+        self.view_reverse = False
+        self.rows_shown = 0
+        self.materialize_pending = False
+        
+        # Treeview item of each materialized result row, by result index
+        self.row_items = {}
+        
     def browse_folder(self):
         """Open folder browser dialog"""
         folder = filedialog.askdirectory(initialdir=self.txt_folder.get())
@@ -187,7 +316,105 @@ class SalesViewerGUI:
             self.txt_folder.delete(0, tk.END)
             self.txt_folder.insert(0, folder)
     
-    def sort_treeview(self, column, is_numeric):
+    def edit_characters(self):
+        """Open the dialog registering the characters (Books folders) queried together"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Characters")
+        dialog.transient(self.root)
+        
+        listbox = tk.Listbox(dialog, width=70, height=8)
+        listbox.pack(padx=10, pady=(10, 5), fill='both', expand=True)
+        
+        def refresh():
+            listbox.delete(0, tk.END)
+            for name, folder in self.federation.characters():
+                listbox.insert(tk.END, f"{name}  -  {folder}")
+        
+        def changed():
+            refresh()
+            try:
+                save_characters(self.federation.characters())
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save characters: {e}", parent=dialog)
+        
+        def add():
+            if self.worker is not None:
+                return
+            folder = filedialog.askdirectory(initialdir=self.txt_folder.get(), parent=dialog)
+            if not folder:
+                return
+            name = simpledialog.askstring("Add Character", "Character name:", parent=dialog)
+            if not name or not name.strip():
+                return
+            try:
+                self.federation.add_character(name.strip(), folder)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+                return
+            changed()
+        
+        def remove():
+            if self.worker is not None:
+                return
+            characters = self.federation.characters()
+            for index in listbox.curselection():
+                self.federation.remove_character(characters[index][0])
+            changed()
+        
+        button_frame = tk.Frame(dialog)
+        button_frame.pack(pady=(0, 10))
+        tk.Button(button_frame, text="Add...", width=10, command=add).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Remove", width=10, command=remove).pack(side='left', padx=5)
+        tk.Button(button_frame, text="Close", width=10,
+                  command=dialog.destroy).pack(side='left', padx=5)
+        refresh()
+    
+    def query_engine(self, params):
+        """Return the SalesEngine or SalesFederation that answers a query"""
+        return self.federation if params['characters'] else self.engine
+    
+    def rebuild_cache(self):
+        """Discard the parse cache for the current folder and re-run the analysis"""
+        if self.worker is not None:
+            return
+        
+        if self.chk_characters_var.get():
+            self.federation.rebuild_cache()
+            self.run_analysis()
+            return
+        
+        folder = self.txt_folder.get()
+        if not os.path.exists(folder):
+            messagebox.showerror("Error", "Please select a valid folder.")
+            return
+        
+        self.engine.rebuild_cache(folder)
+        self.run_analysis()
+    
+    def configure_columns(self, columns):
+        """
+        Set the Treeview columns.
+        
+        Args:
+            columns: list of (result key, heading); the first is the group name
+        """
+        if columns == self.result_columns:
+            return
+        
+        self.result_columns = list(columns)
+        column_ids = [f"c{i}" for i in range(len(columns))]
+        self.tree['columns'] = column_ids
+        
+        # Headings are clickable for sorting
+        for i, (column_id, (key, heading)) in enumerate(zip(column_ids, columns)):
+            self.tree.heading(column_id, text=heading,
+                              command=lambda k=key: self.sort_treeview(k))
+            if i == 0:
+                self.tree.column(column_id, width=120, anchor='w')
+            else:
+                self.tree.column(column_id, width=80, anchor='e')
+    
+    def sort_treeview(self, column):
         """Sort treeview by column when header is clicked"""
         # Toggle sort direction if clicking same column
         if self.sort_column == column:
@@ -196,405 +423,684 @@ class SalesViewerGUI:
             self.sort_column = column
             self.sort_reverse = False if column == 'Group' else True  # Group ascending by default, others descending
         
-        # Map column names to result dict keys
-        col_map = {
-            'Group': 'Group',
-            'TotalSold': 'TotalSold',
-            'TotalEarned': 'TotalEarned',
-            'AvgPrice': 'AvgPrice'
-        }
-        
-        # Sort the current results
-        sort_key = col_map[column]
-        self.current_results.sort(key=lambda x: x[sort_key], reverse=self.sort_reverse)
+        # Sort orders are computed once per column and result set; toggling
+        # the direction just reads the cached order backwards
+        order = self.current_results.order(column)
         
         # Refresh display
-        self.display_results(self.current_results)
+        self.show_view(order, self.sort_reverse)
     
     def display_results(self, results):
-        """Display results in the treeview"""
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Insert new items
-        total_earned_sum = 0
-        for r in results:
-            self.tree.insert('', 'end', values=(
-                r['Group'],
-                f"{r['TotalSold']:,}",
-                f"{r['TotalEarned']:,}",
-                f"{int(r['AvgPrice']):,}"
-            ))
-            total_earned_sum += r['TotalEarned']
-        
+        """Display a new result set in the treeview"""
         # Update total earned label
+        total_earned_sum = sum(r['TotalEarned'] for r in results)
         self.lbl_total.config(text=f"Total Earned: {total_earned_sum:,}")
+        
+        # Results arrive already sorted
+        self.show_view(range(len(results)), False)
     
-    # =========================================================================
-    # NEW: Authority File Algorithm for Deduplication
-    # =========================================================================
+    def show_view(self, order, reverse):
+        """Show current_results in the given row order, materializing only the first chunk"""
+        # Clear existing items
+        self.tree.delete(*self.tree.get_children())
+        self.tree.yview_moveto(0)
+        
+        self.view_order = order
+        self.view_reverse = reverse
+        self.rows_shown = 0
+        self.row_items = {}
+        self.materialize_rows()
     
-    # Month abbreviation to number mapping
-    MONTH_MAP = {
-        'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
-        'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
-    }
+    def materialize_rows(self):
+        """Insert the next VIEW_CHUNK rows of the current view into the treeview"""
+        results = self.current_results
+        order = self.view_order
+        total = len(order)
+        stop = min(self.rows_shown + self.VIEW_CHUNK, total)
+        
+        for position in range(self.rows_shown, stop):
+            index = order[total - 1 - position] if self.view_reverse else order[position]
+            self.row_items[index] = self.tree.insert('', 'end', values=self.row_values(results[index]))
+        
+        self.rows_shown = stop
+        self.materialize_pending = False
     
-    def parse_filename_info(self, filename):
-        """
-        Extract date info from filename: PlayerShopLog_YYMMDD_HHMMSS.txt
-        Returns: (year, month) tuple or None if invalid
-        """
-        match = re.match(r'^PlayerShopLog_(\d{6})_(\d+)\.txt$', filename)
-        if not match:
+    def row_values(self, r):
+        """Format a result row for the treeview"""
+        values = [r['Group']]
+        for key, _ in self.result_columns[1:]:
+            value = r.get(key)
+            values.append(f"{int(value):,}" if value is not None else "")
+        return values
+    
+    def on_tree_scroll(self, first, last):
+        """Treeview scroll callback: update the scrollbar and fill in more rows near the end"""
+        self.scrollbar.set(first, last)
+        if (float(last) >= self.VIEW_PREFETCH and self.rows_shown < len(self.view_order)
+                and not self.materialize_pending):
+            # Insert outside the scroll callback
+            self.materialize_pending = True
+            self.root.after_idle(self.materialize_rows)
+    
+    def run_analysis(self):
+        """Main analysis function - triggered by Run button"""
+        # Never start a second scan while one is still running; a Run during
+        # the start-up pre-warm or a live poll waits for it
+        if self.worker is not None and not (self.prewarming or self.live_polling):
+            return
+        
+        params = self.read_params()
+        if params is None:
+            return
+        if self.prewarming:
+            self.run_after_prewarm(params)
+        elif self.live_polling:
+            self.pending_params = params
+            self.btn_run.config(state='disabled')
+        else:
+            self.start_analysis(params)
+    
+    def read_params(self):
+        """Read the query parameters from the widgets, or None if they are invalid"""
+        # Get parameters from GUI
+        folder = self.txt_folder.get()
+        characters = self.chk_characters_var.get()
+        group_by = self.cmb_group.get()
+        then_by = None if self.cmb_then.get() == "None" else self.cmb_then.get()
+        
+        if characters:
+            if not self.federation.characters():
+                messagebox.showerror("Error", "Please register characters (Characters...).")
+                return None
+            for name, character_folder in self.federation.characters():
+                if not os.path.exists(character_folder):
+                    messagebox.showerror("Error", f"The folder of {name} does not exist.")
+                    return None
+        elif CHARACTER_DIMENSION in (group_by, then_by):
+            messagebox.showerror("Error", "Tick All Characters to group by Character.")
+            return None
+        elif not os.path.exists(folder):
+            messagebox.showerror("Error", "Please select a valid folder.")
             return None
         
-        date_str = match.group(1)
-        yy = int(date_str[0:2])
-        mm = int(date_str[2:4])
+        try:
+            top_n = int(self.txt_top.get())
+        except ValueError:
+            top_n = 0
+            
+        try:
+            start_date = datetime.strptime(self.txt_start.get(), "%m/%d/%Y")
+            end_date = datetime.strptime(self.txt_end.get(), "%m/%d/%Y")
+        except ValueError:
+            messagebox.showerror("Error", "Invalid date format. Use MM/DD/YYYY")
+            return None
         
-        return (2000 + yy, mm)
+        return {
+            'folder': folder,
+            'characters': characters,
+            'group_by': group_by,
+            'then_by': then_by,
+            'buyer_filter': self.txt_buyer.get().strip(),
+            'item_filter': self.txt_item.get().strip(),
+            'item_exact': self.chk_exact_var.get(),
+            'sort_by': self.cmb_sort.get(),
+            'top_n': top_n,
+            'start_date': start_date,
+            'end_date': end_date,
+        }
+    
+    def on_filter_changed(self, event=None):
+        """Buyer/Item filter edited: follow it once typing pauses (debounced)"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(self.FILTER_DEBOUNCE_MS, self.apply_filter_change)
     
-    def parse_line_date_string(self, line):
+    def apply_filter_change(self):
         """
-        Extract the date string from a log line.
-        Example: "Mon Jun 2 23:46 - ..." -> "Mon Jun 2"
-        Returns the date string or None if not found.
+        Re-run the last query with the filters as typed, from the sales it
+        loaded (SalesEngine.refilter), so no log file is read. Does nothing
+        before the first Run or when the loaded sales cannot answer it; Run
+        still applies the filters then.
         """
-        # Match pattern: DayOfWeek Month DayNum Time
-        match = re.match(r'^(\w{3}\s+\w{3}\s+\d+)', line)
-        if match:
-            return match.group(1)
-        return None
+        self.filter_job = None
+        params = self.last_params
+        if params is None or params['characters']:
+            return
+        if self.worker is not None:
+            # Try again once the running query is done
+            self.filter_job = self.root.after(self.FILTER_DEBOUNCE_MS, self.apply_filter_change)
+            return
+        
+        params = dict(params,
+                      buyer_filter=self.txt_buyer.get().strip(),
+                      item_filter=self.txt_item.get().strip(),
+                      item_exact=self.chk_exact_var.get())
+        if params == self.last_params or self.engine.loaded_dataset(params) is None:
+            return
+        self.start_analysis(params, refilter=True)
     
-    def calculate_full_date(self, line_date_str, file_year, file_month):
+    def start_analysis(self, params, refilter=False):
         """
-        Calculate the full datetime from a line date string and filename info.
-        
-        Args:
-            line_date_str: e.g., "Sat May 31"
-            file_year: Year from filename (e.g., 2025)
-            file_month: Month from filename (e.g., 6 for June)
-        
-        Returns:
-            datetime object or None if parsing fails
+        Run a query in the background worker thread; with refilter, from
+        the loaded sales only (SalesEngine.refilter)
         """
-        # Parse the line date string
-        # Format: "DayOfWeek Month Day" e.g., "Sat May 31"
-        parts = line_date_str.split()
-        if len(parts) < 3:
-            return None
+        self.last_params = params
+        self.cancel_event = threading.Event()
+        self.worker_queue = queue.Queue()
+        self.worker = threading.Thread(
+            target=self.analysis_worker,
+            args=(params, self.cancel_event, self.worker_queue, self.chk_live_var.get(),
+                  refilter),
+            daemon=True
+        )
         
-        month_abbr = parts[1]
-        day_num = int(parts[2])
+        self.btn_run.config(state='disabled')
+        self.btn_rebuild.config(state='disabled')
+        self.btn_export.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        self.progress_bar.config(value=0, maximum=1)
+        self.lbl_summary.config(text="Filtering..." if refilter else "Starting...")
         
-        line_month = self.MONTH_MAP.get(month_abbr)
-        if line_month is None:
-            return None
-        
-        # Determine the year with rollover check
-        # If filename is January but line is December, line is from previous year
-        year = file_year
-        if file_month == 1 and line_month == 12:
-            year = file_year - 1
+        self.poll_interval = self.REFILTER_POLL_MS if refilter else self.POLL_INTERVAL_MS
+        self.worker.start()
+        self.root.after(self.poll_interval, self.poll_analysis)
+    
+    def cancel_analysis(self):
+        """Ask the running worker to stop at the next file boundary"""
+        if self.worker is not None:
+            self.pending_params = None
+            self.cancel_event.set()
+            self.btn_cancel.config(state='disabled')
+            self.lbl_summary.config(text="Cancelling...")
+    
+    def analysis_worker(self, params, cancel_event, out_queue, live=False, refilter=False):
+        """
+        Background thread body: run the query on the engine and post the
+        outcome. In live mode a LiveTail for the loaded sales is set up here
+        too, since that may need the parse cache.
+        """
+        def progress(phase, done, total):
+            out_queue.put(('progress', phase, done, total))
         
+        stats = RunStats()
         try:
-            return datetime(year, line_month, day_num)
-        except ValueError:
-            return None
+            outcome = None
+            if refilter:
+                # None if the loaded sales were replaced meanwhile
+                outcome = self.engine.refilter(params, stats)
+            if outcome is None and self.profile_path:
+                outcome = self.profile_query(params, progress, cancel_event, stats)
+            elif outcome is None:
+                outcome = self.query_engine(params).run_query(params, progress,
+                                                              cancel_event, stats)
+            
+            live_tail = None
+            if (live and not params['characters'] and self.engine.dataset is not None
+                    and (self.live_tail is None or not self.live_tail.is_current())):
+                live_tail = LiveTail(self.engine)
+            out_queue.put(('done', outcome, stats, live_tail))
+        except AnalysisCancelled:
+            out_queue.put(('cancelled',))
+        except Exception as e:
+            out_queue.put(('error', str(e)))
+    
+    def on_first_paint(self):
+        """Record the time to first paint and schedule the start-up pre-warm"""
+        self.first_paint = time.perf_counter() - self.started
+        self.lbl_stats.config(text=f"first paint {format_seconds(self.first_paint)}")
+        self.root.after(self.PREWARM_DELAY_MS, self.start_prewarm)
     
-    def scan_files_for_authority(self, folder):
+    def start_prewarm(self):
         """
-        SCAN PHASE: Read all log files and count lines per date per file.
-        
-        Returns:
-            counts: dict[line_date_str][filepath] = line_count
-            file_info: dict[filepath] = (file_year, file_month)
+        Load the sales of the query shown at start-up (the folder and the
+        default date range) in the background worker thread, so the first
+        Run only filters and aggregates them (SalesEngine.prewarm). Skipped
+        once a query ran or when the form does not name a usable folder.
         """
-        counts = defaultdict(lambda: defaultdict(int))
-        file_info = {}
+        if (self.worker is not None or self.last_params is not None
+                or self.chk_characters_var.get()):
+            return
+        folder = self.txt_folder.get()
+        if not os.path.isdir(folder):
+            return
+        try:
+            start_date = datetime.strptime(self.txt_start.get(), "%m/%d/%Y")
+            end_date = datetime.strptime(self.txt_end.get(), "%m/%d/%Y")
+        except ValueError:
+            return
+        
+        params = {'folder': folder, 'start_date': start_date, 'end_date': end_date}
+        self.prewarming = True
+        self.prewarm_folder = os.path.abspath(folder)
+        self.cancel_event = threading.Event()
+        self.worker_queue = queue.Queue()
+        self.worker = threading.Thread(
+            target=self.prewarm_worker,
+            args=(params, self.cancel_event, self.worker_queue),
+            daemon=True
+        )
         
-        pattern = re.compile(r'^PlayerShopLog_(\d{6})_(\d+)\.txt$')
+        # Run stays enabled: it waits for the pre-warm (run_after_prewarm)
+        self.btn_rebuild.config(state='disabled')
+        self.btn_export.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        self.progress_bar.config(value=0, maximum=1)
+        self.lbl_summary.config(text="Loading sales in the background...")
         
-        for filename in os.listdir(folder):
-            if not pattern.match(filename):
-                continue
-            
-            parsed = self.parse_filename_info(filename)
-            if parsed is None:
-                continue
-            
-            file_year, file_month = parsed
-            file_path = os.path.join(folder, filename)
-            file_info[file_path] = (file_year, file_month)
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line_date_str = self.parse_line_date_string(line)
-                        if line_date_str:
-                            counts[line_date_str][file_path] += 1
-            except Exception:
-                pass
+        self.poll_interval = self.POLL_INTERVAL_MS
+        self.worker.start()
+        self.root.after(self.poll_interval, self.poll_analysis)
+    
+    def prewarm_worker(self, params, cancel_event, out_queue):
+        """Background thread body: pre-warm the engine for a folder and date range"""
+        def progress(phase, done, total):
+            out_queue.put(('progress', phase, done, total))
         
-        return counts, file_info
+        stats = RunStats()
+        try:
+            loaded = self.engine.prewarm(params, progress, cancel_event, stats)
+            out_queue.put(('prewarmed', loaded, time.perf_counter() - self.started, stats))
+        except AnalysisCancelled:
+            out_queue.put(('cancelled',))
+        except Exception as e:
+            out_queue.put(('error', str(e)))
     
-    def select_authority_files(self, counts):
+    def run_after_prewarm(self, params):
         """
-        SELECTION PHASE: For each unique line date, find the file with the most lines.
-        
-        Args:
-            counts: dict[line_date_str][filepath] = line_count
-        
-        Returns:
-            best_files: dict[line_date_str] = winning_filepath
+        Run a query once the start-up pre-warm is done. The pre-warm is
+        cancelled if the query cannot use what it loads (another folder, or
+        All Characters).
         """
-        best_files = {}
-        
-        for line_date_str, file_counts in counts.items():
-            # Find the file with the highest count for this date
-            winning_file = max(file_counts.keys(), key=lambda fp: file_counts[fp])
-            best_files[line_date_str] = winning_file
-        
-        return best_files
+        self.pending_params = params
+        self.btn_run.config(state='disabled')
+        if params['characters'] or os.path.abspath(params['folder']) != self.prewarm_folder:
+            self.cancel_event.set()
     
-    def extract_sales_with_authority(self, folder, best_files, file_info, start_date, end_date):
+    def export_data(self):
         """
-        EXTRACTION PHASE: Parse sales only from authority files for each date.
-        
-        Args:
-            folder: Path to log folder
-            best_files: dict[line_date_str] = winning_filepath
-            file_info: dict[filepath] = (file_year, file_month)
-            start_date: Filter start date
-            end_date: Filter end date
-        
-        Returns:
-            List of sales dictionaries
+        Export button: write the results shown (in their display order), or
+        every sale the query matches, to a CSV or JSON Lines file. Sales are
+        streamed to the file by the background worker.
         """
-        all_sales = []
+        if self.worker is not None:
+            return
         
-        # Regex pattern to match purchase lines
-        buy_pattern = re.compile(
-            r"- (?P<buyer>\S+) bought\s+(?P<item>.+?)(?:\s*x(?P<qty>\d+))?\s+at a cost.*=\s*(?P<earned>\d+)$"
+        export_sales_rows = messagebox.askyesnocancel(
+            "Export", "Export every sale matching the query, one row per sale?\n\n"
+                      "Yes: the sales\nNo: the results shown"
+        )
+        if export_sales_rows is None:
+            return
+        params = None
+        if export_sales_rows:
+            params = self.read_params()
+            if params is None:
+                return
+        elif not self.current_results:
+            messagebox.showinfo("Export", "There are no results to export yet; click Run first.")
+            return
+        
+        path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"),
+                                                       ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        
+        if params is not None:
+            self.start_export(params, path)
+            return
+        
+        order = self.view_order
+        results = (self.current_results[index]
+                   for index in (reversed(order) if self.view_reverse else order))
+        try:
+            written = export_results(results, self.result_columns, path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not export: {e}")
+            return
+        self.lbl_summary.config(text=f"Exported {written:,} rows to {path}")
+    
+    def start_export(self, params, path):
+        """Stream the sales a query matches to a file in the background worker thread"""
+        self.cancel_event = threading.Event()
+        self.worker_queue = queue.Queue()
+        self.worker = threading.Thread(
+            target=self.export_worker,
+            args=(params, path, self.cancel_event, self.worker_queue),
+            daemon=True
         )
         
-        # Get unique files that are authority for at least one date
-        authority_files = set(best_files.values())
-        
-        for file_path in authority_files:
-            if file_path not in file_info:
-                continue
-            
-            file_year, file_month = file_info[file_path]
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        # Extract line date string
-                        line_date_str = self.parse_line_date_string(line)
-                        if not line_date_str:
-                            continue
-                        
-                        # Check if this file is the authority for this line's date
-                        if best_files.get(line_date_str) != file_path:
-                            continue
-                        
-                        # Calculate full date
-                        full_date = self.calculate_full_date(line_date_str, file_year, file_month)
-                        if full_date is None:
-                            continue
-                        
-                        # Filter by date range
-                        if full_date < start_date or full_date > end_date:
-                            continue
-                        
-                        # Check if this is a purchase line
-                        if 'bought' not in line:
-                            continue
-                        
-                        match = buy_pattern.search(line)
-                        if match:
-                            all_sales.append({
-                                'Buyer': match.group('buyer'),
-                                'Item': match.group('item').strip(),
-                                'Quantity': int(match.group('qty')) if match.group('qty') else 1,
-                                'Earned': int(match.group('earned')),
-                                'SaleDate': full_date
-                            })
-            except Exception:
-                pass
+        self.btn_run.config(state='disabled')
+        self.btn_rebuild.config(state='disabled')
+        self.btn_export.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        self.progress_bar.config(value=0, maximum=1)
+        self.lbl_summary.config(text="Exporting...")
         
-        # Sort by date
-        all_sales.sort(key=lambda x: x['SaleDate'])
+        self.poll_interval = self.POLL_INTERVAL_MS
+        self.worker.start()
+        self.root.after(self.poll_interval, self.poll_analysis)
+    
+    def export_worker(self, params, path, cancel_event, out_queue):
+        """Background thread body: stream the matching sales to path (export_sales)"""
+        def progress(phase, done, total):
+            out_queue.put(('progress', phase, done, total))
         
-        return all_sales
+        stats = RunStats()
+        try:
+            written = export_sales(self.query_engine(params), params, path,
+                                   progress=progress, cancel_event=cancel_event, stats=stats)
+            out_queue.put(('exported', written, path, stats))
+        except AnalysisCancelled:
+            out_queue.put(('cancelled',))
+        except Exception as e:
+            out_queue.put(('error', str(e)))
     
-    # =========================================================================
-    # END: Authority File Algorithm
-    # =========================================================================
+    def profile_query(self, params, progress, cancel_event, stats):
+        """Run one query under cProfile and write the report to profile_path"""
+        import cProfile
+        import pstats
         
-    def apply_filters(self, sales_data, buyer_filter, item_filter, item_exact):
-        """Apply buyer and item filters to sales data"""
-        filtered = sales_data
+        profile_path = self.profile_path
+        self.profile_path = None
         
-        if buyer_filter:
-            filtered = [s for s in filtered if s['Buyer'] == buyer_filter]
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.query_engine(params).run_query, params, progress,
+                                    cancel_event, stats)
+        finally:
+            with open(profile_path, 'w', encoding='utf-8') as f:
+                report = pstats.Stats(profiler, stream=f)
+                report.sort_stats('cumulative').print_stats(60)
+    
+    def poll_analysis(self):
+        """Drain worker messages on the Tk thread; reschedules itself until done"""
+        finished = None
+        try:
+            while True:
+                message = self.worker_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, phase, done, total = message
+                    self.progress_bar.config(value=done, maximum=max(total, 1))
+                    if total:
+                        self.lbl_summary.config(text=f"{phase}... {done:,}/{total:,}")
+                    else:
+                        self.lbl_summary.config(text=f"{phase}...")
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
+        
+        if finished is None:
+            self.root.after(self.poll_interval, self.poll_analysis)
+            return
+        
+        self.worker = None
+        prewarmed = self.prewarming
+        self.prewarming = False
+        live_polled = self.live_polling
+        self.live_polling = False
+        pending_params = self.pending_params
+        self.pending_params = None
+        self.btn_run.config(state='normal')
+        self.btn_rebuild.config(state='normal')
+        self.btn_export.config(state='normal')
+        self.btn_cancel.config(state='disabled')
+        
+        if live_polled and not self.chk_live_var.get() and self.live_tail is not None:
+            # Live mode was turned off during the poll
+            self.live_tail.stop()
+            self.live_tail = None
+        
+        if pending_params is not None:
+            # A Run clicked during the pre-warm or a live poll; whatever
+            # they left undone (or failed on) is done and reported by the
+            # query itself
+            self.start_analysis(pending_params)
+        elif finished[0] == 'prewarmed':
+            _, loaded, cache_ready, stats = finished
+            self.progress_bar.config(value=0)
+            self.lbl_summary.config(text=f"Ready: {loaded:,} sales loaded.")
+            startup = (f"first paint {format_seconds(self.first_paint)}, "
+                       f"cache ready {format_seconds(cache_ready)}")
+            self.lbl_stats.config(text=f"start-up: {startup} || {stats.summary()}")
+            stats.log(f"start-up ({startup}) {self.prewarm_folder}")
+        elif prewarmed:
+            # Cancelled or failed; the first Run loads the sales instead
+            self.progress_bar.config(value=0)
+            self.lbl_summary.config(text="")
+        elif finished[0] == 'done':
+            stats = finished[2]
+            with stats.phase('display'):
+                self.show_analysis(*finished[1])
+            self.lbl_stats.config(text=stats.summary())
+            # The folder the run used, not the field (it may have been edited since)
+            if self.last_params['characters']:
+                stats.log("characters")
+            else:
+                stats.log(self.last_params['folder'])
             
-        if item_filter:
-            if item_exact:
-                filtered = [s for s in filtered if s['Item'] == item_filter]
+            if finished[3] is not None:
+                if self.live_tail is not None:
+                    self.live_tail.stop()
+                self.live_tail = finished[3]
+            if self.chk_live_var.get():
+                self.schedule_live_poll()
+        elif finished[0] == 'polled':
+            self.finish_live_poll(finished[1])
+        elif finished[0] == 'exported':
+            _, written, path, stats = finished
+            self.progress_bar.config(value=0)
+            self.lbl_summary.config(text=f"Exported {written:,} sales to {path}")
+            self.lbl_stats.config(text=stats.summary())
+        elif finished[0] == 'cancelled':
+            self.progress_bar.config(value=0)
+            self.lbl_summary.config(text="Run cancelled.")
+        else:
+            self.lbl_summary.config(text="")
+            messagebox.showerror("Error", f"An error occurred: {finished[1]}")
+    
+    def show_analysis(self, summary_text, results, columns, sort_by, sort_descending):
+        """Display the outcome of SalesEngine.run_query"""
+        self.configure_columns(columns)
+        self.current_results = results
+        self.sort_column = sort_by
+        self.sort_reverse = sort_descending
+        self.summary_text = summary_text
+        self.lbl_summary.config(text=summary_text)
+        self.display_results(results)
+    
+    def toggle_live(self):
+        """Live checkbox: follow the log files of the last run, or stop following"""
+        if not self.chk_live_var.get():
+            if self.live_job is not None:
+                self.root.after_cancel(self.live_job)
+                self.live_job = None
+            if self.live_tail is not None and not self.live_polling:
+                # (during a poll it is stopped once the poll is done)
+                self.live_tail.stop()
+                self.live_tail = None
+            return
+        
+        if self.worker is not None:
+            # The running analysis sets live mode up when it finishes; during
+            # the start-up pre-warm, run the query once it is done
+            if self.prewarming:
+                self.run_analysis()
+            return
+        if self.last_params is not None and self.last_params['characters']:
+            if self.federation.is_current():
+                self.schedule_live_poll()
             else:
-                item_lower = item_filter.lower()
-                filtered = [s for s in filtered if item_lower in s['Item'].lower()]
-                
-        return filtered
-        
-    def get_group_key(self, sale, group_by):
-        """Get the grouping key for a sale based on group_by option"""
-        if group_by == "Buyer":
-            return sale['Buyer']
-        elif group_by == "Item":
-            return sale['Item']
-        elif group_by == "Year":
-            return str(sale['SaleDate'].year)
-        elif group_by == "Month":
-            return sale['SaleDate'].strftime("%Y-%m")
-        elif group_by == "Week":
-            # Python's strftime %U for week number (Sunday as first day)
-            return sale['SaleDate'].strftime("%Y-%U")
-        elif group_by == "Day":
-            return sale['SaleDate'].strftime("%Y-%m-%d")
+                self.start_analysis(self.last_params)
+        elif ((self.live_tail is not None and self.live_tail.is_current())
+                or self.warehouse_is_current()):
+            self.schedule_live_poll()
+        elif self.last_params is not None:
+            self.start_analysis(self.last_params)
         else:
-            return sale['Item']
-            
-    def group_and_aggregate(self, sales_data, group_by):
-        """Group sales data and calculate aggregates"""
-        groups = defaultdict(list)
-        
-        for sale in sales_data:
-            key = self.get_group_key(sale, group_by)
-            groups[key].append(sale)
-            
-        results = []
-        for group_name, group_sales in groups.items():
-            total_sold = sum(s['Quantity'] for s in group_sales)
-            total_earned = sum(s['Earned'] for s in group_sales)
-            avg_price = round(total_earned / total_sold, 0) if total_sold > 0 else 0
-            
-            results.append({
-                'Group': group_name,
-                'TotalSold': total_sold,
-                'TotalEarned': total_earned,
-                'AvgPrice': avg_price
-            })
-            
-        return results
-        
-    def run_analysis(self):
-        """Main analysis function - triggered by Run button"""
+            self.run_analysis()
+    
+    def warehouse_is_current(self):
+        """Tell whether the sales warehouse of the last run still matches its folder"""
+        warehouse = self.engine.warehouse
+        if not self.engine.use_warehouse or warehouse is None:
+            return False
         try:
-            # Get parameters from GUI
-            folder = self.txt_folder.get()
-            
-            if not os.path.exists(folder):
-                messagebox.showerror("Error", "Please select a valid folder.")
-                return
-                
-            group_by = self.cmb_group.get()
-            buyer_filter = self.txt_buyer.get().strip()
-            item_filter = self.txt_item.get().strip()
-            item_exact = self.chk_exact_var.get()
-            sort_by = self.cmb_sort.get()
-            
-            try:
-                top_n = int(self.txt_top.get())
-            except ValueError:
-                top_n = 0
-                
+            return warehouse.is_current()
+        except OSError:
+            # Leave an unreadable folder for the next Run to report
+            return True
+    
+    def schedule_live_poll(self):
+        if self.live_job is None:
+            self.live_job = self.root.after(self.LIVE_POLL_MS, self.poll_live)
+    
+    def poll_live(self):
+        """Check the log files for new lines; reschedules itself while live mode is on"""
+        self.live_job = None
+        if not self.chk_live_var.get():
+            return
+        
+        if self.worker is None and self.last_params['characters']:
+            # Characters have no LiveTail; re-run the query (only changed
+            # folders are read) whenever a log file changes
             try:
-                start_date = datetime.strptime(self.txt_start.get(), "%m/%d/%Y")
-                end_date = datetime.strptime(self.txt_end.get(), "%m/%d/%Y")
-            except ValueError:
-                messagebox.showerror("Error", "Invalid date format. Use MM/DD/YYYY")
-                return
-            
-            # =====================================================
-            # NEW: Authority File Algorithm
-            # =====================================================
-            
-            # Phase 1: Scan all files and count lines per date per file
-            counts, file_info = self.scan_files_for_authority(folder)
-            
-            if not counts:
-                self.lbl_summary.config(text="No log files found in the folder.")
-                self.current_results = []
-                self.display_results([])
+                current = self.federation.is_current()
+            except OSError:
+                current = True
+            if not current:
+                self.start_analysis(self.last_params)
                 return
-            
-            # Phase 2: Select the authority file for each date
-            best_files = self.select_authority_files(counts)
-            
-            # Phase 3: Extract sales using authority files only
-            all_sales = self.extract_sales_with_authority(
-                folder, best_files, file_info, start_date, end_date
-            )
-            
-            # =====================================================
-            # END: Authority File Algorithm
-            # =====================================================
-                
-            if not all_sales:
-                self.lbl_summary.config(text="No sales data found in the specified date range.")
-                self.current_results = []
-                self.display_results([])
+        elif self.worker is None and self.live_tail is not None:
+            if not self.live_tail.is_current():
+                # Another run replaced the loaded sales; follow those instead
+                self.start_analysis(self.last_params)
                 return
-                
-            # Apply filters
-            filtered_sales = self.apply_filters(all_sales, buyer_filter, item_filter, item_exact)
-            
-            if not filtered_sales:
-                self.lbl_summary.config(text="No sales found for the applied filters.")
-                self.current_results = []
-                self.display_results([])
+            # Reading the files (and rebuilding the sales when an authority
+            # file changes) can take a while; the next poll is scheduled
+            # once this one is done (finish_live_poll)
+            self.start_live_poll()
+            return
+        elif self.worker is None and self.engine.use_warehouse:
+            # The warehouse has no LiveTail; re-run the query (only changed
+            # files are read) whenever a log file changes
+            if not self.warehouse_is_current():
+                self.start_analysis(self.last_params)
                 return
-                
-            # Group and aggregate
-            results = self.group_and_aggregate(filtered_sales, group_by)
-            
-            # Sort results
-            sort_descending = True
-            if sort_by == "Group":
-                sort_descending = False
-                
-            results.sort(key=lambda x: x[sort_by], reverse=sort_descending)
-            
-            # Apply top N filter
-            if top_n > 0:
-                results = results[:top_n]
-            
-            # Store results and display
-            self.current_results = results
-            self.sort_column = sort_by
-            self.sort_reverse = sort_descending
-            
-            # Update summary label
-            summary_text = f"Showing totals grouped by {group_by} (sorted by {sort_by})"
-            if top_n > 0:
-                summary_text += f" - Top {top_n} results"
-            self.lbl_summary.config(text=summary_text)
-            
-            # Display results in treeview
-            self.display_results(results)
-            
+        
+        self.schedule_live_poll()
+    
+    def start_live_poll(self):
+        """Poll the LiveTail (LiveTail.poll) in the background worker thread"""
+        self.live_polling = True
+        self.cancel_event = threading.Event()
+        self.worker_queue = queue.Queue()
+        self.worker = threading.Thread(
+            target=self.live_worker,
+            args=(self.live_tail, self.worker_queue),
+            daemon=True
+        )
+        
+        # Buttons stay as they are: a Run waits for the poll (run_analysis)
+        self.poll_interval = self.POLL_INTERVAL_MS
+        self.worker.start()
+        self.root.after(self.poll_interval, self.poll_analysis)
+    
+    def live_worker(self, live_tail, out_queue):
+        """Background thread body: read what was appended to the log files"""
+        try:
+            update = live_tail.poll()
+        except OSError:
+            # Leave an unreadable folder for the next poll
+            update = None
         except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            out_queue.put(('error', str(e)))
+            return
+        out_queue.put(('polled', update))
+    
+    def finish_live_poll(self, update):
+        """Show what a live poll added and schedule the next poll"""
+        if self.live_tail is None:
+            # Live mode was turned off during the poll
+            return
+        if update is not None:
+            self.apply_live_update(*update)
+        self.schedule_live_poll()
+    
+    def apply_live_update(self, new_rows, rebuilt):
+        """
+        Show sales LiveTail added. Rows of existing groups are updated in
+        place; anything else (rebuilt sales, new groups, Top N or Then By
+        results) re-runs the query, which is served from the loaded sales.
+        """
+        params = self.last_params
+        if rebuilt or params['then_by'] or params['top_n'] > 0:
+            self.start_analysis(params)
+            return
+        
+        dataset = self.engine.dataset
+        in_range = dataset.rows_between(params['start_date'], params['end_date'])
+        new_rows = range(max(new_rows.start, in_range.start), min(new_rows.stop, in_range.stop))
+        rows = match_rows(dataset.sales, new_rows, params['buyer_filter'],
+                          params['item_filter'], params['item_exact'])
+        if not rows:
+            return
+        
+        delta = group_and_aggregate(dataset.sales, rows, params['group_by'])
+        updated, unknown = merge_results(self.current_results, delta)
+        if unknown:
+            self.start_analysis(params)
+            return
+        
+        for index in updated:
+            item = self.row_items.get(index)
+            if item is not None:
+                self.tree.item(item, values=self.row_values(self.current_results[index]))
+        self.current_results.invalidate()
+        
+        total_earned_sum = sum(r['TotalEarned'] for r in self.current_results)
+        self.lbl_total.config(text=f"Total Earned: {total_earned_sum:,}")
+        self.lbl_summary.config(
+            text=f"{self.summary_text} - live: {len(rows):,} new sales at "
+                 f"{datetime.now().strftime('%H:%M:%S')}"
+        )
+    
 
 
 def main():
+    # Start-up times are measured from here
+    started = time.perf_counter()
+    
+    parser = argparse.ArgumentParser(description="Project Gorgon Sales Viewer")
+    parser.add_argument('--reference-mode', action='store_true',
+                        help="use the original three-phase scan/extract path (no cache)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes used to parse log files (0 = one per CPU, 1 = serial)")
+    parser.add_argument('--profile', nargs='?', metavar='FILE',
+                        const=os.path.join(default_cache_dir(), "profile.txt"),
+                        help="write a cProfile report of the first run to FILE "
+                             "(default: profile.txt in the cache folder)")
+    parser.add_argument('--stats-log', nargs='?', metavar='FILE', const="",
+                        help="append the stats of every run to a rotating log file "
+                             "(default: run_stats.log in the cache folder)")
+    parser.add_argument('--warehouse', action='store_true',
+                        help="answer queries from an indexed SQLite sales warehouse "
+                             "instead of loading sales into memory")
+    parser.add_argument('--no-numpy', action='store_true',
+                        help="filter and aggregate in pure Python even if NumPy is installed")
+    args = parser.parse_args()
+    
+    if args.profile:
+        os.makedirs(os.path.dirname(os.path.abspath(args.profile)), exist_ok=True)
+    if args.stats_log is not None:
+        enable_stats_log(args.stats_log or None)
+    if args.no_numpy:
+        use_vector_backend(False)
+    
     root = tk.Tk()
-    app = SalesViewerGUI(root)
+    app = SalesViewerGUI(root, reference_mode=args.reference_mode, workers=args.workers,
+                         profile_path=args.profile, warehouse=args.warehouse, started=started)
     root.mainloop()
 
 
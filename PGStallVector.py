@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Vectorized Backend - NumPy filtering and aggregation for the Sales Engine
+
+Used by PGStallEngine automatically when NumPy is installed (see
+vector_backend) for row sets of VECTOR_MIN_ROWS or more; the pure-Python
+path stays as the fallback and as the reference the results are checked
+against (tests/test_vector_parity.py; PGStallBench.py --parity times both).
+
+The engine's columns already hold what a vectorized backend needs: buyer
+and item ids are categorical codes into the interned name lists, and sale
+dates are date.toordinal() day numbers. The columns are array.array, which
+cannot grow while NumPy views them, so every call copies the span of the
+columns it works on instead of keeping views.
+
+- match_rows filters rows with boolean masks (a buyer id comparison and an
+  item id lookup table).
+- group_and_aggregate and aggregate_rollup group rows by one stable argsort
+  of their group codes and fold each group with ufunc.reduceat, so totals,
+  minimums and maximums are exact and the last row of a group is its latest
+  sale. Result rows are built straight from the folded arrays, in order of
+  the group's first row as the engine's own functions return them.
+"""
+
+from array import array
+
+import numpy
+
+from PGStallEngine import DATE_DIMENSIONS, format_day_key
+
+
+class RowSpan:
+    """
+    Ascending row numbers (a range or an array('I')) to read column values
+    at, copying only the span of each column between the first and last row.
+    """
+    
+    def __init__(self, rows):
+        if isinstance(rows, range) and rows.step == 1:
+            self.start = rows.start
+            self.stop = rows.stop
+            self.offsets = None
+        else:
+            positions = numpy.asarray(rows, dtype=numpy.int64)
+            self.start = int(positions[0])
+            self.stop = int(positions[-1]) + 1
+            self.offsets = positions - self.start
+    
+    def values(self, column):
+        """Return the values of an array.array column at the rows as a NumPy array"""
+        window = numpy.frombuffer(column[self.start:self.stop], dtype=column.typecode)
+        return window if self.offsets is None else window[self.offsets]
+    
+    def select(self, mask):
+        """Return the rows a boolean mask over them keeps, as an array('I')"""
+        if self.offsets is None:
+            kept = numpy.flatnonzero(mask)
+        else:
+            kept = self.offsets[mask]
+        rows = array('I')
+        rows.frombytes((kept + self.start).astype(rows.typecode).tobytes())
+        return rows
+
+
+def match_rows(sales_data, rows, buyer_id=None, item_ids=None):
+    """
+    Select the given rows of a SalesTable or DailyRollup sold to buyer_id
+    (any buyer if None) of an item in item_ids (any item if None).
+    
+    Returns:
+        array('I') of the matching rows in their given order
+    """
+    span = RowSpan(rows)
+    mask = numpy.ones(span.stop - span.start if span.offsets is None else len(span.offsets),
+                      dtype=bool)
+    if buyer_id is not None:
+        mask &= span.values(sales_data.buyer) == buyer_id
+    if item_ids is not None:
+        wanted = numpy.zeros(len(sales_data.item_names), dtype=bool)
+        wanted[numpy.fromiter(item_ids, dtype=numpy.int64, count=len(item_ids))] = True
+        mask &= wanted[span.values(sales_data.item)]
+    return span.select(mask)
+
+
+def dimension_codes(source, span, dimension):
+    """
+    Return (codes, keys) for one grouping dimension: the group code of every
+    row and the group key of every code.
+    """
+    if dimension == "Buyer":
+        return span.values(source.buyer).astype(numpy.int64), source.buyer_names
+    if dimension in DATE_DIMENSIONS:
+        # Format every distinct day once; days of one week, month or year
+        # share a code
+        days, day_codes = numpy.unique(span.values(source.day), return_inverse=True)
+        key_codes = {}
+        codes = [key_codes.setdefault(format_day_key(dimension, day), len(key_codes))
+                 for day in days.tolist()]
+        return numpy.array(codes, dtype=numpy.int64)[day_codes], list(key_codes)
+    return span.values(source.item).astype(numpy.int64), source.item_names
+
+
+def group_codes(source, span, group_by, then_by=None):
+    """
+    Return (codes, names): the group code of every row, and a function
+    turning an array of codes into the lists of their group_by keys and
+    then_by keys (None without then_by).
+    """
+    codes, keys = dimension_codes(source, span, group_by)
+    if not then_by:
+        def names(group_codes):
+            return list(map(keys.__getitem__, group_codes.tolist())), None
+        
+        return codes, names
+    
+    column_codes, column_keys = dimension_codes(source, span, then_by)
+    width = max(len(column_keys), 1)
+    
+    def names(group_codes):
+        row_codes, column_codes = numpy.divmod(group_codes, width)
+        return (list(map(keys.__getitem__, row_codes.tolist())),
+                list(map(column_keys.__getitem__, column_codes.tolist())))
+    
+    return codes * width + column_codes, names
+
+
+def fold(codes, count, quantity, earned, min_price, max_price, last_price):
+    """
+    Fold rows into per-group totals by their group codes, as
+    GroupAccumulator.merge would fold them in row order.
+    
+    Args:
+        codes: Group code of every row
+        count: Sales of every row, or None for single sales
+        quantity, earned, min_price, max_price, last_price: Values of every row
+    
+    Returns:
+        (codes, counts, quantities, earnings, min prices, max prices, last
+        prices) with one element per group, in order of the group's first row
+    """
+    order = numpy.argsort(codes, kind='stable')
+    ordered = codes[order]
+    starts = numpy.flatnonzero(numpy.concatenate(([True], ordered[1:] != ordered[:-1])))
+    ends = numpy.append(starts[1:], len(order))
+    
+    if count is None:
+        counts = ends - starts
+    else:
+        counts = numpy.add.reduceat(count[order], starts)
+    columns = (
+        ordered[starts],
+        counts,
+        numpy.add.reduceat(quantity[order], starts),
+        numpy.add.reduceat(earned[order], starts),
+        numpy.minimum.reduceat(min_price[order], starts),
+        numpy.maximum.reduceat(max_price[order], starts),
+        # The stable sort keeps rows in order within a group
+        last_price[order[ends - 1]],
+    )
+    
+    appearance = numpy.argsort(order[starts])
+    return tuple(column[appearance] for column in columns)
+
+
+def aggregate(codes, names, count, quantity, earned, min_price, max_price, last_price):
+    """
+    Group rows by their codes into result rows like GroupAccumulator.as_result
+    (and group_results with then_by) makes them.
+    
+    Args:
+        codes, names: as returned by group_codes
+        count, quantity, earned, min_price, max_price, last_price: as for fold
+    """
+    (group_codes, counts, quantities, earnings,
+     min_prices, max_prices, last_prices) = fold(codes, count, quantity, earned,
+                                                 min_price, max_price, last_price)
+    group_names, column_names = names(group_codes)
+    
+    # numpy.round and round() both round halves to even
+    results = [
+        {
+            'Group': group_name,
+            'TotalSold': total_sold,
+            'TotalEarned': total_earned,
+            'AvgPrice': avg_price,
+            'Sales': sales,
+            'MinPrice': min_sold,
+            'MaxPrice': max_sold,
+            'LastPrice': last_sold
+        }
+        for group_name, total_sold, total_earned, avg_price, sales, min_sold, max_sold, last_sold
+        in zip(group_names, quantities.tolist(), earnings.tolist(),
+               numpy.round(earnings / quantities, 0).tolist(), counts.tolist(),
+               numpy.round(min_prices, 0).tolist(), numpy.round(max_prices, 0).tolist(),
+               numpy.round(last_prices, 0).tolist())
+    ]
+    if column_names is not None:
+        for result, column_name in zip(results, column_names):
+            result['Column'] = column_name
+    return results
+
+
+def group_and_aggregate(sales_data, rows, group_by, then_by=None):
+    """
+    Group the given rows of a SalesTable like PGStallEngine.group_and_aggregate.
+    
+    Returns:
+        Result rows, or None if a row has quantity 0 (its prices are its
+        earnings as ints, which only the engine's own path keeps)
+    """
+    span = RowSpan(rows)
+    quantity = span.values(sales_data.quantity)
+    if not quantity.all():
+        return None
+    earned = span.values(sales_data.earned)
+    price = earned / quantity
+    
+    codes, names = group_codes(sales_data, span, group_by, then_by)
+    return aggregate(codes, names, None, quantity, earned, price, price, price)
+
+
+def aggregate_rollup(rollup, entries, group_by, then_by=None):
+    """
+    Group the given entries of a DailyRollup like PGStallEngine.aggregate_rollup.
+    
+    Returns:
+        Result rows, or None if an entry has quantity 0 (as for
+        group_and_aggregate)
+    """
+    span = RowSpan(entries)
+    quantity = span.values(rollup.quantity)
+    if not quantity.all():
+        return None
+    
+    codes, names = group_codes(rollup, span, group_by, then_by)
+    return aggregate(codes, names, span.values(rollup.count), quantity,
+                     span.values(rollup.earned), span.values(rollup.min_price),
+                     span.values(rollup.max_price), span.values(rollup.last_price))
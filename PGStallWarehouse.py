@@ -0,0 +1,715 @@
+#!/usr/bin/env python3
+"""
+Sales Warehouse - SQLite storage backend for the Sales Engine
+
+Keeps the authority-deduplicated sales of one Books folder in an indexed
+SQLite database (standard library sqlite3) under the cache folder, so that
+queries over the whole history run as indexed SQL instead of loading every
+sale into memory:
+
+- files / file_dates remember the (size, mtime) of every log file and its
+  line count per date, so an update only reads new or changed files and
+  re-selects the authority file only for the dates those files hold.
+- authority holds the winning file and resolved day of every date string.
+- sales holds the sales of the authority files only, indexed by day, buyer
+  and item.
+- daily and daily_totals roll the sales up per (day, item, buyer) and per
+  day; Year, Month, Week and Day queries are answered from them.
+
+Used by SalesEngine(warehouse=True); see SalesWarehouse.run_query.
+"""
+
+import os
+import hashlib
+import sqlite3
+
+from PGStallEngine import (DATE_DIMENSIONS, FLAT_COLUMNS, DayKeyCache, GroupAccumulator,
+                           ResultSet, RunStats, calculate_full_date, default_cache_dir,
+                           log_file_stem, parse_filename_info, parse_files, parse_log_file,
+                           shape_results)
+
+
+# Bump whenever the schema or the parsing rules change so older databases
+# are rebuilt instead of misread.
+WAREHOUSE_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    stem TEXT NOT NULL
+);
+CREATE TABLE file_dates (
+    line_date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    line_count INTEGER NOT NULL,
+    PRIMARY KEY (line_date, name)
+) WITHOUT ROWID;
+CREATE INDEX file_dates_name ON file_dates (name);
+CREATE TABLE authority (
+    line_date TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    day INTEGER
+);
+CREATE TABLE buyers (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE sales (
+    day INTEGER NOT NULL,
+    buyer_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    earned INTEGER NOT NULL,
+    line_date TEXT NOT NULL
+);
+CREATE INDEX sales_day ON sales (day);
+CREATE INDEX sales_buyer ON sales (buyer_id, day);
+CREATE INDEX sales_item ON sales (item_id, day);
+CREATE INDEX sales_line_date ON sales (line_date);
+CREATE TABLE daily (
+    day INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    buyer_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    earned INTEGER NOT NULL,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    last_key INTEGER NOT NULL,
+    PRIMARY KEY (day, item_id, buyer_id)
+) WITHOUT ROWID;
+CREATE TABLE daily_totals (
+    day INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    earned INTEGER NOT NULL,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    last_key INTEGER NOT NULL
+);
+"""
+
+TABLES = ('files', 'file_dates', 'authority', 'buyers', 'items', 'sales',
+          'daily', 'daily_totals')
+
+# Grouping key of each dimension. Sales store date.toordinal() day numbers;
+# adding JULIAN_OFFSET makes them Julian days for SQLite's strftime. Weeks
+# (%U, which older SQLite lacks) are grouped by day and folded afterwards.
+JULIAN_OFFSET = 1721424.5
+DIMENSION_KEYS = {
+    'Buyer': "buyer_id",
+    'Item': "item_id",
+    'Year': f"strftime('%Y', day + {JULIAN_OFFSET})",
+    'Month': f"strftime('%Y-%m', day + {JULIAN_OFFSET})",
+    'Day': f"strftime('%Y-%m-%d', day + {JULIAN_OFFSET})",
+}
+
+# Group names of the id keys; other keys are their own names
+LABEL_SQL = {
+    'buyer_id': "(SELECT name FROM buyers WHERE id = g.k{i})",
+    'item_id': "(SELECT name FROM items WHERE id = g.k{i})",
+}
+
+# Price per item of one sale, as GroupAccumulator.add computes it
+PRICE_SQL = "CASE WHEN {t}quantity THEN CAST({t}earned AS REAL) / {t}quantity ELSE {t}earned END"
+
+# ORDER BY of the flat queries that are sorted in SQL. Ties keep the order
+# of the group's first sale, like the stable sort of the in-memory engine.
+# AvgPrice is sorted after rounding, which SQLite does half away from zero
+# and Python half to even, so those queries are sorted by shape_results.
+ORDER_SQL = {
+    'Group': "{label}, g.first_key",
+    'TotalSold': "g.quantity DESC, g.first_key",
+    'TotalEarned': "g.earned DESC, g.first_key",
+}
+
+# Sales rows are inserted in date order, so day * LAST_KEY_SCALE + rowid
+# orders them the way the in-memory engine does for LastPrice
+LAST_KEY_SCALE = 1 << 32
+
+# Totals of a group of sales and of a group of rollup rows, in the column
+# order of the daily tables
+TOTALS_COLUMNS = ('count', 'quantity', 'earned', 'min_price', 'max_price', 'last_key')
+SALES_TOTALS = (
+    "COUNT(*)", "SUM(quantity)", "SUM(earned)",
+    f"MIN({PRICE_SQL.format(t='')})", f"MAX({PRICE_SQL.format(t='')})",
+    f"MAX(day * {LAST_KEY_SCALE} + rowid)"
+)
+ROLLUP_TOTALS = ("SUM(count)", "SUM(quantity)", "SUM(earned)",
+                 "MIN(min_price)", "MAX(max_price)", "MAX(last_key)")
+
+# Key of the first sale of a group of sales and of a group of rollup rows
+# (the in-memory rollups of a day are ordered by their last sale), which
+# orders groups as the in-memory engine makes them
+SALES_FIRST_KEY = f"MIN(day * {LAST_KEY_SCALE} + rowid)"
+ROLLUP_FIRST_KEY = "MIN(last_key)"
+
+
+def intern_name(name_ids, pending, name):
+    """Return the id of a buyer/item name, assigning the next one to new names"""
+    name_id = name_ids.get(name)
+    if name_id is None:
+        name_id = name_ids[name] = len(name_ids) + 1
+        pending.append((name_id, name))
+    return name_id
+
+
+class SalesWarehouse:
+    """
+    SQLite database of the authority-deduplicated sales of one Books folder.
+    
+    update() brings it in line with the folder, reading only new or changed
+    log files; run_query() answers a query with indexed SQL. Memory use does
+    not grow with the size of the history: sales never leave the database
+    except as aggregated groups.
+    """
+    
+    def __init__(self, folder, cache_dir=None):
+        self.folder = os.path.abspath(folder)
+        folder_key = hashlib.sha1(os.path.normcase(self.folder).encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(cache_dir or default_cache_dir(), f"warehouse_{folder_key}.sqlite")
+        # {filename: (size, mtime_ns)} of the log files the last update saw
+        self.fingerprints = None
+        # Name -> id maps and names not yet written, while an update runs
+        self.buyer_ids = self.item_ids = None
+        self.new_buyers = self.new_items = None
+        self.db = None
+        self.open()
+    
+    def open(self):
+        """Open the database, rebuilding it if it is corrupt or outdated"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            self.db = self.connect()
+        except sqlite3.DatabaseError:
+            self.remove_files()
+            self.db = self.connect()
+    
+    def connect(self):
+        # Queries run on whichever worker thread the caller uses, one at a time
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            if db.execute("PRAGMA user_version").fetchone()[0] != WAREHOUSE_VERSION:
+                db.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in TABLES)
+                                 + SCHEMA + f"PRAGMA user_version = {WAREHOUSE_VERSION};")
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+        return db
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+    
+    def remove_files(self):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+    
+    def clear(self):
+        """Delete the database so the next update reads every log file again"""
+        self.close()
+        self.remove_files()
+        self.fingerprints = None
+        self.open()
+    
+    def is_current(self):
+        """Tell whether the log files still match what the last update saw"""
+        if self.fingerprints is None:
+            return False
+        return list_log_files(self.folder, fingerprints_only=True) == self.fingerprints
+    
+    # =========================================================================
+    # Ingestion
+    # =========================================================================
+    
+    def rename_files(self, renamed):
+        """
+        Follow log files that were archived under a new name (see
+        archive_logs) without reading them: their line counts, authority
+        dates and sales carry over. Only files unchanged since the last
+        update may be passed.
+        
+        Args:
+            renamed: [(filename, new_filename), ...]
+        """
+        db = self.db
+        with db:
+            for name, new_name in renamed:
+                try:
+                    stat = os.stat(os.path.join(self.folder, new_name))
+                except OSError:
+                    continue
+                db.execute("UPDATE files SET name = ?, size = ?, mtime_ns = ? WHERE name = ?",
+                           (new_name, stat.st_size, stat.st_mtime_ns, name))
+                db.execute("UPDATE file_dates SET name = ? WHERE name = ?", (new_name, name))
+                db.execute("UPDATE authority SET name = ? WHERE name = ?", (new_name, name))
+        self.fingerprints = None
+    
+    def update(self, progress=None, cancel_event=None, workers=0, stats=None):
+        """
+        Ingest new and changed log files and forget removed ones.
+        
+        All changes are made in one transaction: line counts of the files
+        read replace their old ones, the authority file is re-selected for
+        every date those files hold (or held), the sales of each date whose
+        authority changed are replaced by the new authority file's, and the
+        rollups of the days those sales fall on are rebuilt.
+        Ties are broken by file name without compression suffix, like the
+        listing order of the in-memory engine.
+        
+        Args:
+            progress: Optional callback(phase, done, total)
+            cancel_event: Optional threading.Event; checked between files
+            workers: Processes for parse_files (0 = one per CPU, 1 = serial)
+            stats: Optional RunStats; gets the 'list', 'ingest', 'select',
+                'extract' and 'rollup' phases and the file, line and sales
+                counters
+        
+        Raises:
+            AnalysisCancelled: if cancel_event is set before all files are
+                read; the database is left as it was
+            OSError: if an unchanged file that wins a date cannot be read
+                again for its sales; the database is left as it was
+        """
+        if stats is None:
+            stats = RunStats()
+        
+        with stats.phase('list'):
+            listing = list_log_files(self.folder)
+            fingerprints = {name: (size, mtime_ns) for name, size, mtime_ns, _ in listing}
+        stats.count('files_seen', len(listing))
+        
+        if fingerprints == self.fingerprints:
+            stats.count('files_cached', len(listing))
+            return
+        
+        db = self.db
+        known = {name: (size, mtime_ns) for name, size, mtime_ns
+                 in db.execute("SELECT name, size, mtime_ns FROM files")}
+        changed = [entry for entry in listing if known.get(entry[0]) != (entry[1], entry[2])]
+        removed = [name for name in known if name not in fingerprints]
+        stats.count('files_cached', len(listing) - len(changed))
+        
+        if changed or removed:
+            with db:
+                failed = self.ingest(changed, removed, known, progress, cancel_event, workers,
+                                     stats)
+            stats.count('files_read', len(changed) - len(failed))
+            stats.count('files_skipped', len(failed))
+            # Files that could not be read are not current, so the next
+            # update reads them again
+            for name in failed:
+                del fingerprints[name]
+        
+        self.fingerprints = fingerprints
+    
+    def ingest(self, changed, removed, known, progress, cancel_event, workers, stats):
+        """
+        update() body, run inside its transaction.
+        
+        Returns:
+            Names of the changed files that could not be read; they are left
+            out of the files table, as if they were new
+        """
+        db = self.db
+        self.buyer_ids = dict(db.execute("SELECT name, id FROM buyers"))
+        self.item_ids = dict(db.execute("SELECT name, id FROM items"))
+        self.new_buyers = []
+        self.new_items = []
+        
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS staged (name TEXT, line_date TEXT, seq INTEGER,"
+                   " buyer_id INTEGER, item_id INTEGER, quantity INTEGER, earned INTEGER)")
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS replaced (line_date TEXT PRIMARY KEY)")
+        db.execute("DELETE FROM staged")
+        db.execute("DELETE FROM replaced")
+        
+        with stats.phase('ingest'):
+            # Dates whose authority may change: every date a changed or
+            # removed file held before and every date a changed file holds now
+            touched = set()
+            for name in removed + [entry[0] for entry in changed if entry[0] in known]:
+                touched.update(line_date for (line_date,) in db.execute(
+                    "SELECT line_date FROM file_dates WHERE name = ?", (name,)))
+                db.execute("DELETE FROM file_dates WHERE name = ?", (name,))
+            db.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in removed])
+            
+            total = len(changed)
+            paths = [os.path.join(self.folder, entry[0]) for entry in changed]
+            lines_read = bought_matched = 0
+            failed = []
+            for (name, size, mtime_ns, (year, month)), parsed in zip(
+                    changed, parse_files(paths, progress, cancel_event, 0, total, workers)):
+                if parsed is None:
+                    failed.append(name)
+                    db.execute("DELETE FROM files WHERE name = ?", (name,))
+                    continue
+                counts, sales = parsed
+                db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                           (name, size, mtime_ns, year, month, log_file_stem(name)))
+                db.executemany("INSERT INTO file_dates VALUES (?, ?, ?)",
+                               [(line_date, name, line_count)
+                                for line_date, line_count in counts.items()])
+                touched.update(counts)
+                self.stage(name, sales)
+                lines_read += sum(counts.values())
+                bought_matched += sum(map(len, sales.values()))
+        stats.count('lines_read', lines_read)
+        stats.count('bought_matched', bought_matched)
+        
+        with stats.phase('select'):
+            replaced = self.select_authority(touched, {entry[0] for entry in changed})
+        
+        with stats.phase('extract'):
+            db.executemany("INSERT INTO buyers VALUES (?, ?)", self.new_buyers)
+            db.executemany("INSERT INTO items VALUES (?, ?)", self.new_items)
+            db.executemany("INSERT INTO replaced VALUES (?)", [(line_date,) for line_date in replaced])
+            # Days whose sales change: those the replaced dates had and have
+            replaced_days = {day for (day,) in db.execute(
+                "SELECT DISTINCT day FROM sales WHERE line_date IN (SELECT line_date FROM replaced)"
+                " UNION SELECT day FROM authority WHERE day IS NOT NULL"
+                " AND line_date IN (SELECT line_date FROM replaced)")}
+            db.execute("DELETE FROM sales WHERE line_date IN (SELECT line_date FROM replaced)")
+            cursor = db.execute(
+                "INSERT INTO sales (day, buyer_id, item_id, quantity, earned, line_date)"
+                " SELECT a.day, s.buyer_id, s.item_id, s.quantity, s.earned, s.line_date"
+                " FROM staged AS s JOIN authority AS a"
+                " ON a.line_date = s.line_date AND a.name = s.name"
+                " WHERE a.day IS NOT NULL AND s.line_date IN (SELECT line_date FROM replaced)"
+                " ORDER BY a.day, s.line_date, s.seq"
+            )
+            stats.count('sales_loaded', cursor.rowcount)
+        
+        with stats.phase('rollup'):
+            self.roll_up(replaced_days)
+        
+        db.execute("DELETE FROM staged")
+        db.execute("DELETE FROM replaced")
+        return failed
+    
+    def roll_up(self, days):
+        """
+        Rebuild the daily and daily_totals rows of the given days from their
+        sales, so the rollups follow every change of authority file.
+        """
+        db = self.db
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_days (day INTEGER PRIMARY KEY)")
+        db.execute("DELETE FROM rollup_days")
+        db.executemany("INSERT INTO rollup_days VALUES (?)", [(day,) for day in days])
+        for table in ('daily', 'daily_totals'):
+            db.execute(f"DELETE FROM {table} WHERE day IN (SELECT day FROM rollup_days)")
+        db.execute(f"INSERT INTO daily SELECT day, item_id, buyer_id, {', '.join(SALES_TOTALS)}"
+                   " FROM sales WHERE day IN (SELECT day FROM rollup_days)"
+                   " GROUP BY day, item_id, buyer_id")
+        db.execute(f"INSERT INTO daily_totals SELECT day, {', '.join(ROLLUP_TOTALS)} FROM daily"
+                   " WHERE day IN (SELECT day FROM rollup_days) GROUP BY day")
+        db.execute("DELETE FROM rollup_days")
+    
+    def stage(self, name, sales, line_dates=None):
+        """Buffer the candidate sales of one file in the staged temp table"""
+        rows = []
+        buyer_ids, item_ids = self.buyer_ids, self.item_ids
+        for line_date, date_sales in sales.items():
+            if line_dates is not None and line_date not in line_dates:
+                continue
+            for seq, (buyer, item, quantity, earned) in enumerate(date_sales):
+                rows.append((name, line_date, seq,
+                             intern_name(buyer_ids, self.new_buyers, buyer),
+                             intern_name(item_ids, self.new_items, item),
+                             quantity, earned))
+        self.db.executemany("INSERT INTO staged VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    
+    def select_authority(self, touched, staged_names):
+        """
+        Re-select the authority file of the touched dates.
+        
+        Returns:
+            Set of dates whose sales must be replaced: the authority file
+            changed, was read again, or no file holds the date any more
+        """
+        db = self.db
+        current = dict(db.execute("SELECT line_date, name FROM authority"))
+        replaced = set()
+        # Unchanged files that won a date they did not hold the authority for
+        unstaged = {}
+        
+        for line_date in touched:
+            row = db.execute(
+                "SELECT f.name, f.year, f.month FROM file_dates AS fd"
+                " JOIN files AS f ON f.name = fd.name WHERE fd.line_date = ?"
+                " ORDER BY fd.line_count DESC, f.stem LIMIT 1", (line_date,)
+            ).fetchone()
+            if row is None:
+                if line_date in current:
+                    db.execute("DELETE FROM authority WHERE line_date = ?", (line_date,))
+                    replaced.add(line_date)
+                continue
+            
+            name, year, month = row
+            if name == current.get(line_date) and name not in staged_names:
+                continue
+            
+            full_date = calculate_full_date(line_date, year, month)
+            day = full_date.toordinal() if full_date is not None else None
+            db.execute("INSERT OR REPLACE INTO authority VALUES (?, ?, ?)", (line_date, name, day))
+            replaced.add(line_date)
+            if name not in staged_names:
+                unstaged.setdefault(name, set()).add(line_date)
+        
+        for name, line_dates in unstaged.items():
+            parsed = parse_log_file(os.path.join(self.folder, name))
+            if parsed is None:
+                # Rolls the update back rather than store the dates it won
+                # without their sales
+                raise OSError(f"Could not read {name}")
+            self.stage(name, parsed[1], line_dates)
+        
+        return replaced
+    
+    # =========================================================================
+    # Queries
+    # =========================================================================
+    
+    def run_query(self, params, progress=None, cancel_event=None, workers=0, stats=None):
+        """
+        Update the warehouse and answer one query with SQL.
+        
+        Filtering and grouping run in SQL; flat queries are also sorted and
+        cut to Top N there. Date groups are summed from the daily rollups.
+        Weeks are grouped by day in SQL and folded afterwards.
+        
+        Args:
+            params, progress, cancel_event, stats: as for SalesEngine.run_query
+            workers: Processes for parse_files
+        
+        Returns:
+            (summary_text, results, columns, sort_by, sort_descending), as
+            SalesEngine.run_query
+        """
+        if stats is None:
+            stats = RunStats()
+        
+        self.update(progress, cancel_event, workers, stats)
+        
+        sort_by = params['sort_by']
+        sort_descending = sort_by != "Group"
+        columns = FLAT_COLUMNS
+        
+        if not self.fingerprints:
+            return ("No log files found in the folder.",
+                    ResultSet(), columns, sort_by, sort_descending)
+        
+        if progress is not None:
+            progress("Aggregating", 0, 0)
+        with stats.phase('aggregate'):
+            results, matched, groups = self.aggregate(params)
+        stats.count('rows_matched', matched)
+        
+        if not results:
+            start_day = params['start_date'].toordinal()
+            end_day = params['end_date'].toordinal()
+            if not self.db.execute("SELECT EXISTS (SELECT 1 FROM sales WHERE day BETWEEN ? AND ?)",
+                                   (start_day, end_day)).fetchone()[0]:
+                return ("No sales data found in the specified date range.",
+                        ResultSet(), columns, sort_by, sort_descending)
+            return ("No sales found for the applied filters.",
+                    ResultSet(), columns, sort_by, sort_descending)
+        
+        return shape_results(results, params['group_by'], params.get('then_by'), sort_by,
+                             params['top_n'], stats, groups)
+    
+    def iter_sales(self, params, progress=None, cancel_event=None, workers=0, stats=None):
+        """
+        Update the warehouse and yield the sales a query's date range and
+        filters match, one at a time in date order, straight from the cursor.
+        
+        Args:
+            params, progress, cancel_event, workers, stats: as for run_query
+        
+        Yields:
+            (day, buyer, item, quantity, earned), as SalesEngine.iter_sales
+        """
+        self.update(progress, cancel_event, workers, stats)
+        
+        where = self.filter_sql(params)
+        if where is None:
+            return
+        conditions, args = where
+        yield from self.db.execute(
+            "SELECT s.day, b.name, i.name, s.quantity, s.earned FROM sales AS s"
+            " JOIN buyers AS b ON b.id = s.buyer_id JOIN items AS i ON i.id = s.item_id"
+            f" WHERE {' AND '.join(conditions)} ORDER BY s.day, s.rowid", args
+        )
+    
+    def filter_sql(self, params):
+        """
+        Return (conditions, args) selecting the sales a query's date range,
+        buyer and item filters match, or None if no item matches.
+        """
+        conditions = ["day BETWEEN ? AND ?"]
+        args = [params['start_date'].toordinal(), params['end_date'].toordinal()]
+        
+        if params['buyer_filter']:
+            conditions.append("buyer_id = (SELECT id FROM buyers WHERE name = ?)")
+            args.append(params['buyer_filter'])
+        
+        item_filter = params['item_filter']
+        if item_filter:
+            if params['item_exact']:
+                conditions.append("item_id = (SELECT id FROM items WHERE name = ?)")
+                args.append(item_filter)
+            else:
+                # Substring matches use Python's case folding, like
+                # matching_item_ids, so resolve them against the item names
+                item_lower = item_filter.lower()
+                item_ids = [(item_id,) for item_id, name in self.db.execute("SELECT id, name FROM items")
+                            if item_lower in name.lower()]
+                if not item_ids:
+                    return None
+                with self.db:
+                    self.db.execute("CREATE TEMP TABLE IF NOT EXISTS item_filter (id INTEGER PRIMARY KEY)")
+                    self.db.execute("DELETE FROM item_filter")
+                    self.db.executemany("INSERT INTO item_filter VALUES (?)", item_ids)
+                conditions.append("item_id IN (SELECT id FROM item_filter)")
+        
+        return conditions, args
+    
+    def aggregate(self, params):
+        """
+        Filter and group the sales of a query.
+        
+        Returns:
+            (results, matched, groups): results as group_and_aggregate's,
+            the number of matching sales and the number of groups before
+            Top N
+        """
+        group_by = params['group_by']
+        then_by = params.get('then_by')
+        
+        where = self.filter_sql(params)
+        if where is None:
+            return [], 0, 0
+        conditions, args = where
+        
+        dimensions = [group_by] + ([then_by] if then_by else [])
+        keys = [DIMENSION_KEYS.get(dimension, 'day') for dimension in dimensions]
+        labels = [LABEL_SQL.get(key, "g.k{i}").format(i=i) for i, key in enumerate(keys)]
+        key_names = [f"k{i}" for i in range(len(keys))]
+        
+        if group_by in DATE_DIMENSIONS:
+            # Date groups come from the rollups; per-day totals do unless a
+            # buyer or item is filtered or grouped on
+            detail = bool(params['buyer_filter'] or params['item_filter']
+                          or then_by in ("Buyer", "Item"))
+            source = 'daily' if detail else 'daily_totals'
+            totals, first_key = ROLLUP_TOTALS, ROLLUP_FIRST_KEY
+        else:
+            source = 'sales'
+            totals, first_key = SALES_TOTALS, SALES_FIRST_KEY
+        totals = ", ".join(f"{expression} AS {name}"
+                           for expression, name in zip(totals, TOTALS_COLUMNS))
+        totals += f", {first_key} AS first_key"
+        
+        # One row per group: totals, price range, the rowid of its last
+        # sale, whose price is joined back in as the LastPrice, and the key
+        # of its first sale
+        sql = (
+            f"SELECT {', '.join(labels)}, g.count, g.quantity, g.earned, g.min_price,"
+            f" g.max_price, {PRICE_SQL.format(t='s.')}, g.first_key, COUNT(*) OVER (),"
+            f" SUM(g.count) OVER ()"
+            f" FROM (SELECT {', '.join(f'{key} AS {name}' for key, name in zip(keys, key_names))},"
+            f" {totals} FROM {source} WHERE {' AND '.join(conditions)}"
+            f" GROUP BY {', '.join(key_names)}) AS g"
+            f" JOIN sales AS s ON s.rowid = g.last_key % {LAST_KEY_SCALE}"
+        )
+        
+        # Weeks are grouped by day in SQL and folded here afterwards, in
+        # order of their last sale; other groups come in order of their
+        # first sale, as the in-memory engine makes them
+        fold = 'day' in keys
+        order = ORDER_SQL.get(params['sort_by']) if not then_by and not fold else None
+        if order is not None:
+            sql += f" ORDER BY {order.format(label=labels[0])}"
+            if params['top_n'] > 0:
+                sql += " LIMIT ?"
+                args.append(params['top_n'])
+        elif fold:
+            sql += " ORDER BY g.last_key"
+        else:
+            sql += " ORDER BY g.first_key"
+        
+        rows = self.db.execute(sql, args).fetchall()
+        if not rows:
+            return [], 0, 0
+        groups, matched = rows[0][-2:]
+        width = len(dimensions)
+        
+        if not fold:
+            results = []
+            for row in rows:
+                accumulator = GroupAccumulator()
+                accumulator.merge(*row[width:width + 6])
+                result = accumulator.as_result(row[0])
+                if then_by:
+                    result['Column'] = row[1]
+                results.append(result)
+            return results, matched, groups
+        
+        # Fold the per-day groups into weeks, in date order of their last
+        # sale, then order the weeks by their first sale
+        day_keys = [DayKeyCache(dimension) if key == 'day' else None
+                    for dimension, key in zip(dimensions, keys)]
+        folded = {}
+        first_keys = {}
+        for row in rows:
+            key = tuple(row[i] if keys_for_day is None else keys_for_day[row[i]]
+                        for i, keys_for_day in enumerate(day_keys))
+            accumulator = folded.get(key)
+            if accumulator is None:
+                accumulator = folded[key] = GroupAccumulator()
+                first_keys[key] = row[width + 6]
+            else:
+                first_keys[key] = min(first_keys[key], row[width + 6])
+            accumulator.merge(*row[width:width + 6])
+        
+        results = []
+        for key in sorted(folded, key=first_keys.__getitem__):
+            accumulator = folded[key]
+            result = accumulator.as_result(key[0])
+            if then_by:
+                result['Column'] = key[1]
+            results.append(result)
+        return results, matched, len(results)
+
+
+def list_log_files(folder, fingerprints_only=False):
+    """
+    List the log files of a folder.
+    
+    Returns:
+        [(filename, size, mtime_ns, (year, month)), ...] sorted by name
+        without compression suffix, or {filename: (size, mtime_ns)} with
+        fingerprints_only
+    """
+    listing = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            parsed = parse_filename_info(entry.name)
+            if parsed is None:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            listing.append((entry.name, stat.st_size, stat.st_mtime_ns, parsed))
+    if fingerprints_only:
+        return {name: (size, mtime_ns) for name, size, mtime_ns, _ in listing}
+    listing.sort(key=lambda entry: log_file_stem(entry[0]))
+    return listing
@@ -41,6 +41,7 @@ if errorlevel 1 (
 :: --------------------------------------------
 :: RUN GUI SILENTLY (NO CMD WINDOW)
 :: --------------------------------------------
-start "" %PYTHONW_EXE% "%~dp0%SCRIPT_NAME%"
+:: Extra arguments (e.g. --profile or --stats-log) are passed to the GUI
+start "" %PYTHONW_EXE% "%~dp0%SCRIPT_NAME%" %*
 
 exit
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Archived Logs - SalesEngine.archive_logs round trip
+
+Old log files of a generated Books folder are compressed with every
+supported format. Queries must give the same outcome before and after, and
+the same as the reference path (the original scan, select and extract
+phases) over the archived folder. The parse cache entries, and the rows of
+the sales warehouse, are carried over to the archives, so no archive is
+decompressed to answer them. A plain file the game wrote again next to its
+archive is left alone, and an archive replaced by another file of the same
+name is read again.
+
+Each test works on its own copy of the folder and its own parse cache.
+    
+    python -m unittest discover -s tests
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import format_line, generate_books, outcome_signature
+
+
+# Generated folder: four weeks, the first two of which are archived
+BOOKS = dict(days=28, files_per_day=3, buyers=10, items=15, sales_per_day=25,
+             start=datetime(2025, 2, 1), seed=9)
+ARCHIVE_UNTIL = datetime(2025, 2, 14)
+
+# Date range of every query (all of the sales)
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2099, 12, 31)
+
+# Query shapes compared before and after archiving
+SHAPES = (("Item", None), ("Day", None), ("Buyer", "Month"))
+
+
+def query(folder, group_by, then_by=None):
+    """Return the params of one query over all of a folder's sales"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': group_by, 'then_by': then_by,
+        'buyer_filter': "", 'item_filter': "", 'item_exact': False,
+        'sort_by': "TotalEarned", 'top_n': 0,
+        'start_date': START_DATE, 'end_date': END_DATE,
+    }
+
+
+def archive_days():
+    """Return the older_than_days that archives the files dated up to ARCHIVE_UNTIL"""
+    return (date.today() - ARCHIVE_UNTIL.date()).days
+
+
+class ArchiveTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_archive_")
+        cls.books = os.path.join(cls.tmp_dir, "books")
+        generate_books(cls.books, **BOOKS)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def copy_books(self):
+        """Give the test a fresh copy of the folder and an empty parse cache"""
+        test_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        self.folder = os.path.join(test_dir, "books")
+        self.cache_dir = os.path.join(test_dir, "cache")
+        shutil.copytree(self.books, self.folder)
+    
+    def sales_engine(self, warehouse=False):
+        """Return an engine over this test's parse cache, closing its warehouse afterwards"""
+        sales_engine = engine.SalesEngine(workers=1, cache_dir=self.cache_dir,
+                                          warehouse=warehouse)
+        self.addCleanup(self.close_warehouse, sales_engine)
+        return sales_engine
+    
+    def close_warehouse(self, sales_engine):
+        if sales_engine.warehouse is not None:
+            sales_engine.warehouse.close()
+    
+    def outcomes(self, sales_engine, stats=None):
+        """Return the outcome signature of every query shape"""
+        return [outcome_signature(sales_engine.run_query(query(self.folder, group_by, then_by),
+                                                         stats=stats))
+                for group_by, then_by in SHAPES]
+    
+    def round_trip(self, compression, warehouse):
+        self.copy_books()
+        before = self.outcomes(self.sales_engine(warehouse))
+        archived = self.sales_engine(warehouse).archive_logs(self.folder, archive_days(),
+                                                             compression)
+        
+        # Every file dated up to ARCHIVE_UNTIL, and no other, was archived
+        names = sorted(os.listdir(self.folder))
+        self.assertTrue(archived)
+        self.assertEqual(len(archived), BOOKS['files_per_day'] * ARCHIVE_UNTIL.day)
+        for filename, archive_filename in archived:
+            self.assertEqual(archive_filename, filename + '.' + compression)
+            self.assertIn(archive_filename, names)
+            self.assertNotIn(filename, names)
+        
+        # A fresh engine answers from the carried-over cache or warehouse rows
+        stats = engine.RunStats()
+        after = self.outcomes(self.sales_engine(warehouse), stats)
+        self.assertEqual(stats.counters.get('files_read', 0), 0)
+        self.assertEqual(after, before)
+        self.assertEqual(after, self.outcomes(engine.SalesEngine(reference_mode=True)))
+    
+    def test_round_trip(self):
+        for compression in ("gz", "bz2", "xz"):
+            with self.subTest(compression=compression):
+                self.round_trip(compression, warehouse=False)
+    
+    def test_round_trip_with_warehouse(self):
+        self.round_trip("gz", warehouse=True)
+    
+    def test_recreated_plain_file_is_left_alone(self):
+        self.copy_books()
+        sales_engine = self.sales_engine()
+        sales_engine.run_query(query(self.folder, "Item"))
+        filename, archive_filename = sales_engine.archive_logs(self.folder, archive_days())[0]
+        archive_path = os.path.join(self.folder, archive_filename)
+        with open(archive_path, 'rb') as f:
+            archive_bytes = f.read()
+        
+        # The game writes the plain file again
+        with open(os.path.join(self.folder, filename), 'w', encoding='utf-8') as f:
+            f.write(format_line(BOOKS['start'], "Again visited your shop") + "\n")
+        self.assertEqual(sales_engine.archive_logs(self.folder, archive_days()), [])
+        with open(archive_path, 'rb') as f:
+            self.assertEqual(f.read(), archive_bytes)
+        self.assertIn(filename, os.listdir(self.folder))
+    
+    def test_replaced_archive_is_read_again(self):
+        self.copy_books()
+        sales_engine = self.sales_engine()
+        sales_engine.run_query(query(self.folder, "Item"))
+        archived = sales_engine.archive_logs(self.folder, archive_days())
+        
+        # Replace the last archive with one whose many sales take over its day
+        archive_path = os.path.join(self.folder, archived[-1][1])
+        day = ARCHIVE_UNTIL + timedelta(hours=12)
+        with gzip.open(archive_path, 'wt', encoding='utf-8') as f:
+            f.write("".join(format_line(day + timedelta(minutes=n),
+                                        "Replacer bought Fresh Bread x4 at a cost of 9 per 1 = 36")
+                            + "\n" for n in range(1000)))
+        
+        stats = engine.RunStats()
+        after = self.outcomes(self.sales_engine(), stats)
+        self.assertEqual(stats.counters['files_read'], 1)
+        self.assertEqual(after, self.outcomes(engine.SalesEngine(reference_mode=True)))
+        self.assertIn("Replacer", self.sales_engine().current_dataset(
+            self.folder, START_DATE, END_DATE).sales.buyer_names)
+    
+    def test_days_below_one_are_refused(self):
+        self.copy_books()
+        for days in (0, -1):
+            with self.subTest(days=days):
+                with self.assertRaises(ValueError):
+                    engine.archive_logs(self.folder, days)
+                with self.assertRaises(ValueError):
+                    self.sales_engine().archive_logs(self.folder, days)
+        self.assertEqual(sorted(os.listdir(self.folder)), sorted(os.listdir(self.books)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Export - PGStallExport against the reference sales
+
+The sales a query matches are exported to CSV and JSON Lines from every
+path an engine can stream them from: the loaded sales, a fresh ingestion
+through the parse cache, the reference path (the original scan, select and
+extract phases, re-reading each authority file as it is reached) and the
+sales warehouse, and from a SalesFederation of two characters. Each export
+must hold exactly the sales the reference path loads, one row per sale in
+date order, under filters that match many, few or no sales. Exported
+results must follow the rows of the query as shown, flat or pivoted.
+    
+    python -m unittest discover -s tests
+"""
+
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import generate_books
+from PGStallExport import (CHARACTER_SALE_HEADINGS, SALE_HEADINGS, export_results,
+                           export_sales, result_records)
+from PGStallFederation import SalesFederation
+
+
+# Generated folders: five weeks over a year end, and a second character's
+# three weeks overlapping them
+BOOKS = dict(days=35, files_per_day=3, buyers=10, items=15, sales_per_day=25,
+             start=datetime(2024, 12, 15), seed=13)
+ALT_BOOKS = dict(days=21, files_per_day=2, buyers=8, items=12, sales_per_day=20,
+                 start=datetime(2025, 1, 1), seed=17)
+
+# Date range of the loaded sales (all of them)
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2099, 12, 31)
+
+
+def query(folder, group_by="Item", then_by=None, sort_by="TotalEarned", top_n=0,
+          buyer_filter="", item_filter="", item_exact=False, start_date=START_DATE,
+          end_date=END_DATE):
+    """Return the params of one query"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': group_by, 'then_by': then_by,
+        'buyer_filter': buyer_filter, 'item_filter': item_filter, 'item_exact': item_exact,
+        'sort_by': sort_by, 'top_n': top_n,
+        'start_date': start_date, 'end_date': end_date,
+    }
+
+
+def reference_sales(params):
+    """
+    Return the sales a query matches as the reference path loads them:
+    (YYYY-MM-DD, buyer, item, quantity, earned) in date order
+    """
+    dataset = engine.SalesEngine(reference_mode=True).load_dataset(
+        params['folder'], None, params['start_date'], params['end_date'])
+    if dataset is None:
+        return []
+    sales = dataset.sales
+    rows = engine.apply_filters(dataset, params['buyer_filter'], params['item_filter'],
+                                params['item_exact'], params['start_date'], params['end_date'])
+    return [(datetime.fromordinal(sales.day[row]).strftime("%Y-%m-%d"),
+             sales.buyer_names[sales.buyer[row]], sales.item_names[sales.item[row]],
+             sales.quantity[row], sales.earned[row])
+            for row in rows]
+
+
+def read_export(path):
+    """Return the headings and rows of an exported CSV or JSON Lines file, values as exported"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith(".csv"):
+            reader = csv.reader(f)
+            headings = tuple(next(reader))
+            return headings, [tuple(row) for row in reader]
+        records = [json.loads(line) for line in f]
+    headings = tuple(records[0]) if records else ()
+    return headings, [tuple(record.values()) for record in records]
+
+
+def as_exported(rows, path):
+    """Return rows as read back from the export at path (all text in CSV, empty for None)"""
+    if not path.endswith(".csv"):
+        return rows
+    return [tuple("" if value is None else str(value) for value in row) for row in rows]
+
+
+class ExportTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_export_")
+        cls.folder = os.path.join(cls.tmp_dir, "books")
+        cls.alt_folder = os.path.join(cls.tmp_dir, "alt_books")
+        generate_books(cls.folder, **BOOKS)
+        generate_books(cls.alt_folder, **ALT_BOOKS)
+        cls.cache_dir = os.path.join(cls.tmp_dir, "cache")
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def filters(self):
+        """Return (name, filter params) of filter sets matching many, few and no sales"""
+        all_sales = reference_sales(query(self.folder))
+        return [
+            ("none", {}),
+            ("buyer", {'buyer_filter': all_sales[0][1]}),
+            ("item substring", {'item_filter': "e"}),
+            ("item exact", {'item_filter': all_sales[-1][2], 'item_exact': True}),
+            ("date range", {'start_date': datetime(2024, 12, 28),
+                            'end_date': datetime(2025, 1, 4)}),
+            ("no buyer", {'buyer_filter': "Nobody"}),
+            ("no dates", {'start_date': datetime(2001, 1, 1), 'end_date': datetime(2001, 12, 31)}),
+        ]
+    
+    def engines(self):
+        """Yield (name, engine) for every path sales can be exported from"""
+        loaded = engine.SalesEngine(workers=1, cache_dir=self.cache_dir)
+        loaded.run_query(query(self.folder))
+        yield "loaded", loaded
+        yield "ingested", engine.SalesEngine(workers=1, cache_dir=self.cache_dir)
+        yield "reference", engine.SalesEngine(reference_mode=True)
+        warehouse = engine.SalesEngine(workers=1, cache_dir=self.cache_dir, warehouse=True)
+        try:
+            yield "warehouse", warehouse
+        finally:
+            if warehouse.warehouse is not None:
+                warehouse.warehouse.close()
+    
+    def test_sales_match_reference(self):
+        path_stem = os.path.join(self.tmp_dir, "sales")
+        for filter_name, filters in self.filters():
+            params = query(self.folder, **filters)
+            expected = reference_sales(params)
+            for engine_name, sales_engine in self.engines():
+                for extension in (".csv", ".jsonl"):
+                    path = path_stem + extension
+                    with self.subTest(engine=engine_name, filters=filter_name, format=extension):
+                        written = export_sales(sales_engine, params, path)
+                        self.assertEqual(written, len(expected))
+                        headings, rows = read_export(path)
+                        self.assertEqual(rows, as_exported(expected, path))
+                        if rows:
+                            self.assertEqual(headings, SALE_HEADINGS)
+    
+    def test_loaded_sales_are_streamed_without_reading(self):
+        sales_engine = engine.SalesEngine(workers=1, cache_dir=self.cache_dir)
+        sales_engine.run_query(query(self.folder))
+        stats = engine.RunStats()
+        export_sales(sales_engine, query(self.folder, item_filter="e"),
+                     os.path.join(self.tmp_dir, "loaded.csv"), stats=stats)
+        self.assertNotIn('files_read', stats.counters)
+    
+    def test_federation_sales_match_reference(self):
+        characters = [("Main", self.folder), ("Alt", self.alt_folder)]
+        for reference_mode in (False, True):
+            federation = SalesFederation(characters, reference_mode=reference_mode, workers=1,
+                                         cache_dir=self.cache_dir)
+            for filter_name, filters in self.filters():
+                # Each character's reference sales, merged by day (ties keep
+                # the registration order)
+                expected = sorted(
+                    [(sale[0], name) + sale[1:] for name, folder in characters
+                     for sale in reference_sales(query(folder, **filters))],
+                    key=lambda sale: sale[0]
+                )
+                path = os.path.join(self.tmp_dir, "federation.jsonl")
+                with self.subTest(reference_mode=reference_mode, filters=filter_name):
+                    self.assertEqual(export_sales(federation, query("", **filters), path),
+                                     len(expected))
+                    headings, rows = read_export(path)
+                    self.assertEqual(rows, expected)
+                    if rows:
+                        self.assertEqual(headings, CHARACTER_SALE_HEADINGS)
+    
+    def test_results_follow_display_order(self):
+        sales_engine = engine.SalesEngine(workers=1, cache_dir=self.cache_dir)
+        reference = engine.SalesEngine(reference_mode=True)
+        for group_by, then_by, sort_by, top_n in (("Item", None, "TotalEarned", 0),
+                                                  ("Buyer", None, "Group", 3),
+                                                  ("Month", "Buyer", "TotalSold", 0),
+                                                  ("Buyer", "Week", "AvgPrice", 2)):
+            params = query(self.folder, group_by, then_by, sort_by, top_n)
+            _, results, columns, _, _ = sales_engine.run_query(params)
+            _, expected, expected_columns, _, _ = reference.run_query(params)
+            for extension in (".csv", ".jsonl"):
+                path = os.path.join(self.tmp_dir, "results" + extension)
+                with self.subTest(group_by=group_by, then_by=then_by, format=extension):
+                    self.assertEqual(export_results(results, columns, path), len(expected))
+                    headings, rows = read_export(path)
+                    self.assertEqual(headings, tuple(heading for _, heading in expected_columns))
+                    self.assertEqual(rows, as_exported(
+                        list(result_records(expected, expected_columns)), path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Single-Pass Ingestion - ingest_files against the reference path
+
+The sales of a generated Books folder are loaded by the reference path (the
+original scan, select and extract phases, re-reading every authority file)
+and by single-pass ingestion through the parse cache, both with a cold cache
+and with every file served from it. The sales must match exactly, in the
+same order, over the whole history and over date ranges that skip files by
+their filename date, and so must every query answered from them.
+
+The folder also holds an archived log file and two log files with as many
+lines for one date, so that the authority file of that date is decided by
+listing order.
+    
+    python -m unittest discover -s tests
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import format_line, generate_books, outcome_signature
+
+
+DIMENSIONS = ("Buyer", "Item", "Year", "Month", "Week", "Day")
+
+# Generated folder: six weeks over a year end
+BOOKS = dict(days=42, files_per_day=3, buyers=10, items=15, sales_per_day=25,
+             start=datetime(2024, 12, 10), seed=11)
+
+# Day after the generated sales with two log files of as many lines for it
+TIE_DAY = datetime(2025, 1, 22)
+TIED_LINES = 4
+
+# Date ranges: everything, a span that skips the files of other months, one
+# day, and a range with no sales
+RANGES = (
+    ("all", datetime(2000, 1, 1), datetime(2099, 12, 31)),
+    ("span", datetime(2024, 12, 28), datetime(2025, 1, 6)),
+    ("one day", datetime(2025, 1, 2), datetime(2025, 1, 2)),
+    ("tie day", TIE_DAY, TIE_DAY),
+    ("none", datetime(2023, 1, 1), datetime(2023, 3, 1)),
+)
+
+
+def query(folder, start_date, end_date, group_by="Item", then_by=None, sort_by="TotalEarned",
+          top_n=0, buyer_filter="", item_filter="", item_exact=False):
+    """Return the params of one query"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': group_by, 'then_by': then_by,
+        'buyer_filter': buyer_filter, 'item_filter': item_filter, 'item_exact': item_exact,
+        'sort_by': sort_by, 'top_n': top_n,
+        'start_date': start_date, 'end_date': end_date,
+    }
+
+
+def write_tied_logs(folder):
+    """Write two log files with TIED_LINES lines each for TIE_DAY, sold to different buyers"""
+    for hour, buyer in ((8, "Early"), (9, "Late")):
+        lines = [format_line(TIE_DAY + timedelta(hours=hour, minutes=n),
+                             f"{buyer}{n} bought Tie Token x2 at a cost of 10 per 1 = 20")
+                 for n in range(TIED_LINES)]
+        path = os.path.join(folder, f"PlayerShopLog_{TIE_DAY.strftime('%y%m%d')}_{hour:02d}0000.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in lines))
+
+
+def archive_one(folder):
+    """Compress the first log file of the folder, as archive_logs would"""
+    filename = sorted(os.listdir(folder))[0]
+    path = os.path.join(folder, filename)
+    stat = os.stat(path)
+    with open(path, 'rb') as src, gzip.open(path + ".gz", 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.utime(path + ".gz", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.remove(path)
+
+
+def dataset_rows(dataset):
+    """
+    Return the sales of a LoadedDataset as (day, buyer, item, quantity,
+    earned) in row order. No dataset means no sales: single-pass ingestion
+    skips every file dated outside the range and so finds none to load.
+    """
+    if dataset is None:
+        return []
+    sales = dataset.sales
+    return [(sales.day[row], sales.buyer_names[sales.buyer[row]],
+             sales.item_names[sales.item[row]], sales.quantity[row], sales.earned[row])
+            for row in range(len(sales))]
+
+
+class IngestionTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_ingestion_")
+        cls.folder = os.path.join(cls.tmp_dir, "books")
+        generate_books(cls.folder, **BOOKS)
+        write_tied_logs(cls.folder)
+        archive_one(cls.folder)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def reference_rows(self, start_date, end_date):
+        """Return the sales the reference path loads for a date range (see dataset_rows)"""
+        dataset = engine.SalesEngine(reference_mode=True).load_dataset(
+            self.folder, None, start_date, end_date)
+        return dataset_rows(dataset)
+    
+    def test_sales_match_reference(self):
+        cache_dir = os.path.join(self.tmp_dir, "cache_sales")
+        for name, start_date, end_date in RANGES:
+            expected = self.reference_rows(start_date, end_date)
+            for state in ("cold", "warm"):
+                with self.subTest(range=name, cache=state):
+                    if state == "cold":
+                        shutil.rmtree(cache_dir, ignore_errors=True)
+                    sales_engine = engine.SalesEngine(workers=1, cache_dir=cache_dir)
+                    stats = engine.RunStats()
+                    dataset = sales_engine.current_dataset(self.folder, start_date, end_date,
+                                                           stats=stats)
+                    self.assertEqual(dataset_rows(dataset), expected)
+                    if state == "warm":
+                        self.assertEqual(stats.counters['files_read'], 0)
+    
+    def test_files_outside_the_range_are_skipped(self):
+        _, start_date, end_date = RANGES[1]
+        stats = engine.RunStats()
+        engine.SalesEngine(workers=1, cache_dir=os.path.join(self.tmp_dir, "cache_skip")).run_query(
+            query(self.folder, start_date, end_date), stats=stats)
+        self.assertGreater(stats.counters['files_skipped'], 0)
+        self.assertLess(stats.counters['files_read'], stats.counters['files_seen'])
+    
+    def test_tie_goes_to_the_first_listed_file(self):
+        # Guard the data the other tests run on: both files hold TIED_LINES
+        # lines of TIE_DAY, and the authority is the one listed first
+        buyers = {sale[1] for sale in self.reference_rows(TIE_DAY, TIE_DAY)}
+        self.assertEqual(buyers, {f"Early{n}" for n in range(TIED_LINES)})
+    
+    def test_every_query_shape_matches(self):
+        sales_engine = engine.SalesEngine(workers=1,
+                                          cache_dir=os.path.join(self.tmp_dir, "cache_queries"))
+        reference = engine.SalesEngine(reference_mode=True)
+        for name, start_date, end_date in RANGES:
+            for group_by in DIMENSIONS:
+                for then_by in (None, "Buyer" if group_by != "Buyer" else "Day"):
+                    for sort_by, top_n in (("TotalEarned", 0), ("Group", 3)):
+                        params = query(self.folder, start_date, end_date, group_by, then_by,
+                                       sort_by, top_n)
+                        with self.subTest(range=name, group_by=group_by, then_by=then_by,
+                                          sort_by=sort_by, top_n=top_n):
+                            self.assertEqual(outcome_signature(sales_engine.run_query(params)),
+                                             outcome_signature(reference.run_query(params)))
+    
+    def test_filters_match(self):
+        sales_engine = engine.SalesEngine(workers=1,
+                                          cache_dir=os.path.join(self.tmp_dir, "cache_filters"))
+        reference = engine.SalesEngine(reference_mode=True)
+        _, start_date, end_date = RANGES[0]
+        buyer = self.reference_rows(start_date, end_date)[0][1]
+        for filters in ({'buyer_filter': buyer}, {'item_filter': "e"},
+                        {'item_filter': "Tie Token", 'item_exact': True},
+                        {'buyer_filter': "Nobody"}):
+            params = query(self.folder, start_date, end_date, **filters)
+            with self.subTest(**filters):
+                self.assertEqual(outcome_signature(sales_engine.run_query(params)),
+                                 outcome_signature(reference.run_query(params)))
+
+
+if __name__ == "__main__":
+    unittest.main()
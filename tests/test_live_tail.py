@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Live Tail - LiveTail.poll against a fresh reference load
+
+A LiveTail follows the sales an engine loaded from a generated Books folder
+while log files are appended to, added and removed. After every poll the
+followed sales must equal, row for row, what the reference path (the
+original scan, select and extract phases) loads from the folder as it now
+is, whether the poll appended the new sales or re-selected a date's
+authority file and rebuilt them. A line still being written is left for the
+next poll.
+
+Each test works on its own copy of the folder and its own parse cache.
+    
+    python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import format_line, generate_books
+
+
+# Generated folder: three weeks
+BOOKS = dict(days=21, files_per_day=3, buyers=10, items=15, sales_per_day=25,
+             start=datetime(2025, 3, 1), seed=3)
+LAST_DAY = datetime(2025, 3, 21)
+
+# Day whose authority a new log file takes over, and its number of lines
+TAKEOVER_DAY = datetime(2025, 3, 10)
+TAKEOVER_LINES = 500
+
+# Date range followed (reaches past the generated sales, so new days count)
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2099, 12, 31)
+
+
+def query(folder):
+    """Return the params of a query loading every sale of a folder"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': "Item", 'then_by': None,
+        'buyer_filter': "", 'item_filter': "", 'item_exact': False,
+        'sort_by': "TotalEarned", 'top_n': 0,
+        'start_date': START_DATE, 'end_date': END_DATE,
+    }
+
+
+def sale_line(moment, buyer, earned=120):
+    """Return a purchase line of one sale"""
+    return format_line(moment, f"{buyer} bought Lamp Oil x2 at a cost of {earned // 2} per 1 "
+                               f"= {earned}")
+
+
+def dataset_rows(dataset):
+    """Return the sales of a LoadedDataset as (day, buyer, item, quantity, earned) in row order"""
+    sales = dataset.sales
+    return [(sales.day[row], sales.buyer_names[sales.buyer[row]],
+             sales.item_names[sales.item[row]], sales.quantity[row], sales.earned[row])
+            for row in range(len(sales))]
+
+
+def authority_file(folder, day):
+    """Return the path of the log file the reference path takes a day's sales from"""
+    counts, _ = engine.scan_files_for_authority(folder)
+    best_files = engine.select_authority_files(counts)
+    return best_files[engine.parse_line_date_string(format_line(day, ""))]
+
+
+class LiveTailTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_live_")
+        cls.books = os.path.join(cls.tmp_dir, "books")
+        generate_books(cls.books, **BOOKS)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def setUp(self):
+        test_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        self.folder = os.path.join(test_dir, "books")
+        shutil.copytree(self.books, self.folder)
+        self.engine = engine.SalesEngine(workers=1, cache_dir=os.path.join(test_dir, "cache"))
+        self.engine.run_query(query(self.folder))
+        self.tail = engine.LiveTail(self.engine)
+        self.addCleanup(self.tail.stop)
+    
+    def append(self, path, text):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(text)
+    
+    def follow(self, path):
+        """
+        Append a sale to a log file and poll once, so the tail knows where
+        the file ends: a file it has not read yet is read whole on its first
+        change, and the sales are rebuilt.
+        """
+        self.append(path, sale_line(LAST_DAY + timedelta(hours=23, minutes=40), "First") + "\n")
+        self.assertIsNotNone(self.tail.poll())
+        self.assert_current()
+        return path
+    
+    def assert_current(self):
+        """Check the followed sales against a fresh reference load of the folder"""
+        self.assertTrue(self.tail.is_current())
+        expected = engine.SalesEngine(reference_mode=True).load_dataset(
+            self.folder, None, START_DATE, END_DATE)
+        self.assertEqual(dataset_rows(self.engine.dataset), dataset_rows(expected))
+        
+        # The followed sales cover the folder, so a query reads no file
+        stats = engine.RunStats()
+        self.engine.run_query(query(self.folder), stats=stats)
+        self.assertIs(self.engine.dataset, self.tail.dataset)
+        self.assertEqual(stats.counters.get('files_read', 0), 0)
+    
+    def test_nothing_changed(self):
+        self.assertIsNone(self.tail.poll())
+        self.assert_current()
+    
+    def test_appended_sales(self):
+        path = self.follow(authority_file(self.folder, LAST_DAY))
+        self.append(path, "".join(sale_line(LAST_DAY + timedelta(hours=23, minutes=50 + n),
+                                            f"Tailed{n}") + "\n" for n in range(2)))
+        
+        new_rows, rebuilt = self.tail.poll()
+        self.assertEqual((len(new_rows), rebuilt), (2, False))
+        self.assert_current()
+        
+        self.append(path, sale_line(LAST_DAY + timedelta(hours=23, minutes=59), "Tailed2") + "\n")
+        new_rows, rebuilt = self.tail.poll()
+        self.assertEqual((len(new_rows), rebuilt), (1, False))
+        self.assert_current()
+    
+    def test_new_day(self):
+        next_day = LAST_DAY + timedelta(days=1)
+        path = os.path.join(self.folder, f"PlayerShopLog_{next_day.strftime('%y%m%d')}_010000.txt")
+        self.append(path, "".join(sale_line(next_day + timedelta(minutes=n), f"Early{n}") + "\n"
+                                  for n in range(3)))
+        
+        new_rows, rebuilt = self.tail.poll()
+        self.assertEqual((len(new_rows), rebuilt), (3, False))
+        self.assert_current()
+    
+    def test_authority_moves(self):
+        path = os.path.join(self.folder,
+                            f"PlayerShopLog_{TAKEOVER_DAY.strftime('%y%m%d')}_235959.txt")
+        self.append(path, "".join(sale_line(TAKEOVER_DAY + timedelta(minutes=n), f"Takeover{n % 5}")
+                                  + "\n" for n in range(TAKEOVER_LINES)))
+        # Guard the data: the new file must win its date for the test to mean anything
+        self.assertEqual(authority_file(self.folder, TAKEOVER_DAY), path)
+        
+        new_rows, rebuilt = self.tail.poll()
+        self.assertTrue(rebuilt)
+        self.assertEqual(len(new_rows), 0)
+        self.assert_current()
+    
+    def test_removed_authority_file(self):
+        path = authority_file(self.folder, TAKEOVER_DAY)
+        os.remove(path)
+        self.assertNotEqual(authority_file(self.folder, TAKEOVER_DAY), path)
+        
+        _, rebuilt = self.tail.poll()
+        self.assertTrue(rebuilt)
+        self.assert_current()
+    
+    def test_partial_line(self):
+        path = self.follow(authority_file(self.folder, LAST_DAY))
+        line = sale_line(LAST_DAY + timedelta(hours=23, minutes=58), "Halfway") + "\n"
+        half = len(line) // 2
+        
+        self.append(path, line[:half])
+        new_rows, rebuilt = self.tail.poll()
+        self.assertEqual((len(new_rows), rebuilt), (0, False))
+        self.assertNotIn("Halfway", self.engine.dataset.sales.buyer_names)
+        
+        self.append(path, line[half:])
+        new_rows, rebuilt = self.tail.poll()
+        self.assertEqual((len(new_rows), rebuilt), (1, False))
+        self.assert_current()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+NumPy Backend Parity - PGStallVector against the pure-Python path
+
+Every query shape (each Group By with and without each Then By, each Sort
+By, with and without Top N, under filters that match many, few or no
+sales) is answered twice from the same loaded sales of a fixed generated
+Books folder: once with the NumPy backend and once with it turned off. The
+outcomes must match exactly, down to row order, key order and value types.
+A log file of tied sales is added to the folder, so that Top N has to pick
+among tied groups.
+
+VECTOR_MIN_ROWS is lowered to 1 so that every non-empty selection goes
+through the backend. Skipped when NumPy is not installed.
+    
+    python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import format_line, generate_books, outcome_signature
+
+
+engine.use_vector_backend(True)
+HAVE_NUMPY = engine.vector_backend() is not None
+
+DIMENSIONS = ("Buyer", "Item", "Year", "Month", "Week", "Day")
+SORTS = ("Group", "TotalSold", "TotalEarned", "AvgPrice")
+TOP_N = (0, 2)
+
+# Generated folder: two months over a year end, so Year, Month and Week
+# groups all have several members
+BOOKS = dict(days=60, files_per_day=3, buyers=12, items=20, sales_per_day=30,
+             start=datetime(2024, 12, 1), seed=7)
+
+# Day after the generated sales on which three buyers each buy as much of
+# their own item, so grouped by Buyer or Item they tie at the top of every
+# measure and Top 2 cuts through the tie
+TIE_DAY = datetime(2025, 2, 3)
+TIED = 3
+
+# Date range of the loaded sales (all of them)
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2099, 12, 31)
+
+
+def query(group_by, then_by=None, sort_by="TotalEarned", top_n=0, buyer_filter="",
+          item_filter="", item_exact=False, start_date=START_DATE, end_date=END_DATE,
+          folder=""):
+    """Return the params of one query"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': group_by, 'then_by': then_by,
+        'buyer_filter': buyer_filter, 'item_filter': item_filter, 'item_exact': item_exact,
+        'sort_by': sort_by, 'top_n': top_n,
+        'start_date': start_date, 'end_date': end_date,
+    }
+
+
+def write_tied_sales(folder):
+    """Write the log file of TIE_DAY's tied sales"""
+    lines = [format_line(TIE_DAY + timedelta(hours=9 + n),
+                         f"Tied{n} bought Tied Token {n} x1000 at a cost of 5000 per 1 = 5000000")
+             for n in range(TIED)]
+    path = os.path.join(folder, f"PlayerShopLog_{TIE_DAY.strftime('%y%m%d')}_230000.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+@unittest.skipUnless(HAVE_NUMPY, "NumPy is not installed")
+class VectorParityTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_parity_")
+        folder = os.path.join(cls.tmp_dir, "books")
+        generate_books(folder, **BOOKS)
+        write_tied_sales(folder)
+        
+        sales_engine = engine.SalesEngine(workers=1, cache_dir=os.path.join(cls.tmp_dir, "cache"))
+        sales_engine.run_query(query("Item", folder=folder))
+        cls.dataset = sales_engine.dataset
+    
+    @classmethod
+    def tearDownClass(cls):
+        engine.use_vector_backend(True)
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def setUp(self):
+        patcher = mock.patch.object(engine, 'VECTOR_MIN_ROWS', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(engine.use_vector_backend, True)
+    
+    def filters(self):
+        """Return (name, filter params) of filter sets matching many, few and no sales"""
+        sales = self.dataset.sales
+        first_day = datetime.fromordinal(sales.day[0])
+        last_day = datetime.fromordinal(sales.day[-1])
+        return [
+            ("none", {}),
+            ("buyer", {'buyer_filter': sales.buyer_names[0]}),
+            ("item substring", {'item_filter': "e"}),
+            ("item exact", {'item_filter': sales.item_names[0], 'item_exact': True}),
+            ("date range", {'start_date': datetime(2024, 12, 20),
+                            'end_date': datetime(2025, 1, 10)}),
+            ("no buyer", {'buyer_filter': "Nobody"}),
+            ("no item", {'item_filter': "no such item"}),
+            ("no dates", {'start_date': datetime(2001, 1, 1), 'end_date': datetime(2001, 12, 31)}),
+            ("one day", {'start_date': first_day, 'end_date': first_day}),
+            ("last day", {'start_date': last_day, 'end_date': last_day}),
+        ]
+    
+    def outcome(self, params, vectorized):
+        """Answer a query from the loaded sales with or without the NumPy backend"""
+        engine.use_vector_backend(vectorized)
+        # Select from scratch rather than narrow the previous query's rows
+        self.dataset.last_selection = None
+        stats = engine.RunStats()
+        source, rows, message = engine.filter_dataset(self.dataset, params, stats)
+        return engine.aggregate_selection(params, source, rows, message, stats)
+    
+    def test_every_query_shape_matches(self):
+        for group_by in DIMENSIONS:
+            for then_by in (None,) + DIMENSIONS:
+                if then_by == group_by:
+                    continue
+                for sort_by in SORTS:
+                    for top_n in TOP_N:
+                        for name, filters in self.filters():
+                            params = query(group_by, then_by, sort_by, top_n, **filters)
+                            with self.subTest(group_by=group_by, then_by=then_by,
+                                              sort_by=sort_by, top_n=top_n, filters=name):
+                                self.assertEqual(
+                                    outcome_signature(self.outcome(params, True)),
+                                    outcome_signature(self.outcome(params, False))
+                                )
+    
+    def test_top_n_cuts_through_ties(self):
+        # Guard the data the parity test runs on: Top N must have to choose
+        # between tied groups for the tie order to be checked at all
+        top_n = max(TOP_N)
+        for group_by in ("Buyer", "Item"):
+            for sort_by in ("TotalSold", "TotalEarned", "AvgPrice"):
+                with self.subTest(group_by=group_by, sort_by=sort_by):
+                    results = self.outcome(query(group_by, sort_by=sort_by), False)[1]
+                    values = [r[sort_by] for r in results[:TIED]]
+                    self.assertEqual(len(set(values)), 1)
+                    self.assertLess(top_n, TIED)
+    
+    def test_empty_selections(self):
+        for name, filters in self.filters():
+            if not name.startswith("no "):
+                continue
+            for group_by in DIMENSIONS:
+                with self.subTest(group_by=group_by, filters=name):
+                    params = query(group_by, **filters)
+                    outcome = self.outcome(params, True)
+                    self.assertEqual(list(outcome[1]), [])
+                    self.assertEqual(outcome_signature(outcome),
+                                     outcome_signature(self.outcome(params, False)))
+    
+    def test_backend_is_used(self):
+        import PGStallVector
+        
+        with mock.patch.object(PGStallVector, 'group_and_aggregate',
+                               wraps=PGStallVector.group_and_aggregate) as grouped, \
+                mock.patch.object(PGStallVector, 'aggregate_rollup',
+                                  wraps=PGStallVector.aggregate_rollup) as rolled_up:
+            self.outcome(query("Buyer", "Item"), True)
+            self.outcome(query("Month", "Buyer"), True)
+        self.assertTrue(grouped.called)
+        self.assertTrue(rolled_up.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Sales Warehouse - SalesEngine(warehouse=True) against the reference path
+
+Queries over a generated Books folder are answered from the SQLite sales
+warehouse and by a reference-mode engine, which re-reads the folder through
+the original scan, select and extract phases every time. The outcomes must
+match exactly, for every Group By with and without a Then By and under
+filters, and still after the warehouse is brought up to date with a sale
+appended to a log file, a new log file that takes over a date's authority,
+and a removed authority file.
+
+Each test works on its own copy of the folder and its own warehouse.
+    
+    python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PGStallEngine as engine
+from PGStallBench import format_line, generate_books, outcome_signature
+
+
+DIMENSIONS = ("Buyer", "Item", "Year", "Month", "Week", "Day")
+
+# Generated folder: five weeks over a year end
+BOOKS = dict(days=35, files_per_day=3, buyers=10, items=15, sales_per_day=25,
+             start=datetime(2024, 12, 15), seed=5)
+
+# Day whose authority a new log file takes over, and its number of lines
+TAKEOVER_DAY = datetime(2025, 1, 3)
+TAKEOVER_LINES = 500
+
+# Date range of every query (all of the sales)
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2099, 12, 31)
+
+# Query shapes checked again after each change to the folder
+SHAPES = (("Day", None), ("Buyer", "Item"), ("Month", "Item"))
+
+
+def query(folder, group_by, then_by=None, sort_by="TotalEarned", top_n=0, buyer_filter="",
+          item_filter="", item_exact=False, start_date=START_DATE, end_date=END_DATE):
+    """Return the params of one query"""
+    return {
+        'folder': folder, 'characters': False,
+        'group_by': group_by, 'then_by': then_by,
+        'buyer_filter': buyer_filter, 'item_filter': item_filter, 'item_exact': item_exact,
+        'sort_by': sort_by, 'top_n': top_n,
+        'start_date': start_date, 'end_date': end_date,
+    }
+
+
+def authority_files(folder):
+    """Return {line date string: authority file path} as the reference path selects them"""
+    counts, _ = engine.scan_files_for_authority(folder)
+    return engine.select_authority_files(counts)
+
+
+class WarehouseTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix="pgstall_warehouse_")
+        cls.books = os.path.join(cls.tmp_dir, "books")
+        generate_books(cls.books, **BOOKS)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+    
+    def setUp(self):
+        test_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        self.folder = os.path.join(test_dir, "books")
+        shutil.copytree(self.books, self.folder)
+        self.engine = engine.SalesEngine(workers=1, cache_dir=os.path.join(test_dir, "cache"),
+                                         warehouse=True)
+        self.addCleanup(self.close_warehouse)
+        self.reference = engine.SalesEngine(reference_mode=True)
+    
+    def close_warehouse(self):
+        if self.engine.warehouse is not None:
+            self.engine.warehouse.close()
+    
+    def assert_matches(self, params_list):
+        """Check each query's warehouse outcome against the reference outcome"""
+        for params in params_list:
+            with self.subTest(**{key: params[key] for key in
+                                 ('group_by', 'then_by', 'sort_by', 'top_n', 'buyer_filter',
+                                  'item_filter', 'item_exact', 'start_date')}):
+                self.assertEqual(outcome_signature(self.engine.run_query(params)),
+                                 outcome_signature(self.reference.run_query(params)))
+    
+    def update(self):
+        """Bring the warehouse up to date with a query and return its RunStats"""
+        stats = engine.RunStats()
+        self.engine.run_query(query(self.folder, "Day"), stats=stats)
+        return stats
+    
+    def test_every_query_shape_matches(self):
+        params_list = []
+        for group_by in DIMENSIONS:
+            for then_by in (None,) + DIMENSIONS:
+                if then_by == group_by:
+                    continue
+                for sort_by, top_n in (("TotalEarned", 0), ("AvgPrice", 3), ("Group", 0)):
+                    params_list.append(query(self.folder, group_by, then_by, sort_by, top_n))
+        self.assert_matches(params_list)
+    
+    def test_filters_match(self):
+        sales = self.reference.load_dataset(self.folder, None, START_DATE, END_DATE).sales
+        filters = (
+            {'buyer_filter': sales.buyer_names[0]},
+            {'item_filter': "e"},
+            {'item_filter': sales.item_names[0], 'item_exact': True},
+            {'start_date': datetime(2024, 12, 28), 'end_date': datetime(2025, 1, 4)},
+            {'start_date': TAKEOVER_DAY, 'end_date': TAKEOVER_DAY},
+            {'buyer_filter': "Nobody"},
+            {'start_date': datetime(2001, 1, 1), 'end_date': datetime(2001, 12, 31)},
+        )
+        self.assert_matches([query(self.folder, group_by, then_by, **extra)
+                             for extra in filters
+                             for group_by, then_by in SHAPES + (("Item", None),)])
+    
+    def test_unchanged_folder_reads_nothing(self):
+        self.update()
+        stats = self.update()
+        self.assertEqual(stats.counters.get('files_read', 0), 0)
+    
+    def test_appended_sale(self):
+        self.update()
+        last_file = max(authority_files(self.folder).values())
+        last_day = datetime.fromordinal(
+            self.reference.load_dataset(self.folder, None, START_DATE, END_DATE).sales.day[-1])
+        with open(last_file, 'a', encoding='utf-8') as f:
+            f.write(format_line(last_day + timedelta(hours=23, minutes=59),
+                                "Latecomer bought Late Lantern x3 at a cost of 70 per 1 = 210")
+                    + "\n")
+        
+        stats = self.update()
+        self.assertEqual(stats.counters['files_read'], 1)
+        self.assert_matches([query(self.folder, group_by, then_by)
+                             for group_by, then_by in SHAPES])
+        latecomer = query(self.folder, "Buyer", buyer_filter="Latecomer")
+        self.assertEqual(len(self.reference.run_query(latecomer)[1]), 1)
+        self.assert_matches([latecomer])
+    
+    def test_new_file_takes_authority(self):
+        self.update()
+        lines = [format_line(TAKEOVER_DAY + timedelta(minutes=n),
+                             f"Takeover{n % 7} bought Takeover Tonic x2 at a cost of 15 per 1 = 30")
+                 for n in range(TAKEOVER_LINES)]
+        path = os.path.join(self.folder,
+                            f"PlayerShopLog_{TAKEOVER_DAY.strftime('%y%m%d')}_235959.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in lines))
+        # Guard the data: the new file must win its date for the test to mean anything
+        self.assertIn(path, authority_files(self.folder).values())
+        
+        self.update()
+        self.assert_matches([query(self.folder, group_by, then_by)
+                             for group_by, then_by in SHAPES])
+    
+    def test_removed_authority_file(self):
+        self.update()
+        best_files = authority_files(self.folder)
+        removed = best_files[engine.parse_line_date_string(format_line(TAKEOVER_DAY, ""))]
+        os.remove(removed)
+        self.assertNotIn(removed, authority_files(self.folder).values())
+        
+        self.update()
+        self.assert_matches([query(self.folder, group_by, then_by)
+                             for group_by, then_by in SHAPES])
+
+
+if __name__ == "__main__":
+    unittest.main()